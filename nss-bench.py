@@ -0,0 +1,951 @@
+#!/usr/bin/env python3
+
+import gc
+import random
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from optparse import OptionParser
+
+from utils.regexes import (
+    RE_backout,
+    RE_backout_std,
+    RE_backout_template,
+    RE_patch,
+    RE_tag,
+    RX_backout,
+    RX_backout_std,
+    RX_backout_template,
+    RX_patch,
+    RX_tag,
+)
+from utils.types import NullValidator, Patch
+
+
+def synthetic_commits(count: int, *, seed=1):
+    rng = random.Random(seed)
+    authors = [f"Dev {n} <dev{n}@example.com>".encode() for n in range(200)]
+    body = b"\n\nDifferential Revision: https://phabricator.services.mozilla.com/D12345"
+    for rev in range(count):
+        node = f"{rng.getrandbits(160):040x}".encode()
+        kind = rng.random()
+        if kind < 0.05:
+            desc = f"Backed out changeset {node[:12].decode()} (bug {rng.randrange(10**6)}) for build bustage"
+        elif kind < 0.07:
+            desc = f"Added tag NSS_3_{rng.randrange(99)}_RTM for changeset {node[:12].decode()}"
+        else:
+            desc = f"Bug {rng.randrange(10**6)} - fix something in lib/ssl that was broken r=reviewer a=release"
+        yield (
+            str(rev).encode(),
+            node,
+            b"tip" if rev == count - 1 else b"",
+            b"default",
+            rng.choice(authors),
+            desc.encode() + body,
+            datetime(2020, 1, 1),
+        )
+
+
+# Patch as it was before fields became lazy, for comparison.
+@dataclass
+class LegacyPatch:
+    type: str
+    headline: str
+    id: str
+    hash: str
+    author: str
+    message: str
+    timestamp: str
+    bug: int = None
+    reviewers: list = None
+    tag: str = None
+    reason: str = None
+    description: str = None
+
+    def __init__(self, *, validator, commit):
+        self.headline = commit[5].decode(encoding="UTF-8").split("\n")[0]
+        if re.match(RE_backout, self.headline):
+            self.type = "backout"
+            extended_match = re.match(RE_backout_template, self.headline)
+            if extended_match:
+                self.bug = extended_match.group("bug")
+                self.changeset = extended_match.group("changeset")
+                self.reason = extended_match.group("reason")
+            else:
+                validator.warn("Backout headline needs to be of the form: ...")
+                matches = re.match(RE_backout_std, self.headline)
+                if matches:
+                    self.changeset = matches.group("changeset")
+        elif re.match(RE_tag, self.headline):
+            self.type = "tag"
+            tagmatches = re.match(RE_tag, self.headline)
+            self.changeset = tagmatches.group("changeset")
+            self.tag = tagmatches.group("tag")
+        else:
+            self.type = "patch"
+            matches = re.match(RE_patch, self.headline)
+            if matches:
+                self.reviewers = matches.group("reviewers")
+                self.bug = matches.group("bug")
+                self.description = matches.group("desc")
+            else:
+                validator.warn(f"Patch headline doesn't parse: {self.headline}")
+        self.id = commit[0]
+        self.hash = commit[1]
+        self.author = commit[4]
+        self.message = commit[5].decode(encoding="UTF-8")
+        self.timestamp = commit[6]
+
+
+# Headlines in the shapes that turn up in NSS history, odd ones included.
+HEADLINES = [
+    "Bug 1760827 - Add a CI task for tracking ECCKiila code status. r=nss-reviewers,djackson",
+    "Bug 1765753 - Extend NSS DBM fuzzers. r=jschanck",
+    "Bug 1748386 - Remove unused `in_encrypt` parameter. r=beurdouche a=RyanVM",
+    "Bug 1753535 - Remove obsolete stateEnd check in SEC_ASN1DecoderUpdate. r=#nss-reviewers",
+    "Bug 1735028 - check for missing signedData field r?keeler",
+    "Bug 1757279 - Set version numbers to 3.77 Beta",
+    "bug 1640203: Fix KeyLogFile tests r=mt",
+    "Bug 1688374 , Update the constructor of nss-ssl-gtests r=kaie",
+    "Bug 1662738 - Only run cert_extensions when SSL is enabled r=jcj,nss-reviewers a=me",
+    "Bug 123 foo",
+    "Bug 1730012 - Stop sending zero-length",
+    "Bug 1694214 - tls13_derive_secret mixes  spaces   r=mt   a=pascalc",
+    "Backed out changeset 6b6b7a0fd2a8 (bug 1759525) for causing build bustage",
+    "Backed out changeset 6b6b7a0fd2a8 for causing build bustage on a CLOSED TREE",
+    "Backout of changeset 52d1f2d7ebc1 (bug 1700556)",
+    "backout bug 1234567 because reasons",
+    "Backed out 2 changesets (bug 1683710, bug 1682044) for build bustage",
+    "Back out bug 1668123 - it broke the ABI check",
+    "Added tag NSS_3_77_RTM for changeset 3b87245eb6a6",
+    "Added tag NSS_3_68_4_RTM for changeset c5ba9f9d4b20",
+    "Added tag nss_lowercase for changeset abc",
+    "No bug - Update HACL* to 4ef81c7 r=me",
+    "Merge NSS trunk to NSS_3_44_BRANCH",
+    "Automatic update from the checklist",
+    "",
+]
+
+
+def fuzzed_headlines(count: int, *, seed=1):
+    rng = random.Random(seed)
+    pieces = [
+        "Bug ", "bug ", "123", "4567890", " ", "  ", "-", ",", ":", "r=", "r?",
+        "a=", "mt", "Backed out changeset ", "abcdef123456", " (bug 42)",
+        " for ", "Added tag ", "NSS_3_1_RTM", " for changeset ", "back", " out",
+        "Backout", "x" * 50, "\u00e9", "(", ")",
+    ]  # fmt: skip
+    for _ in range(count):
+        headline = rng.choice(HEADLINES + [""])
+        for _ in range(rng.randrange(4)):
+            at = rng.randrange(len(headline) + 1)
+            if rng.random() < 0.7:
+                headline = headline[:at] + rng.choice(pieces) + headline[at:]
+            else:
+                headline = headline[:at] + headline[at + rng.randrange(1, 5) :]
+        yield headline
+
+
+# Just the matching each way, without building fields; that the two agree is
+# tests/test_headlines.py's job.
+def bench_headlines(options):
+    from utils.regexes import RX_headline
+
+    headlines = list(HEADLINES)
+    if options.corpus:
+        with open(options.corpus, "r") as inFile:
+            headlines += [line.rstrip("\n") for line in inFile]
+    headlines += fuzzed_headlines(options.count, seed=options.seed)
+    print(f"{len(headlines)} headlines")
+
+    def cascade_matches():
+        for headline in headlines:
+            if RX_backout.match(headline):
+                RX_backout_template.match(headline) or RX_backout_std.match(headline)
+            elif RX_tag.match(headline):
+                RX_tag.match(headline)
+            else:
+                RX_patch.match(headline)
+
+    def single_matches():
+        for headline in headlines:
+            match = RX_headline.match(headline)
+            match and match.lastgroup
+
+    measure("cascade", cascade_matches)
+    measure("single pass", single_matches)
+
+
+def measure(label, func):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<32} {elapsed:8.3f} s {peak / 2**20:10.1f} MiB")
+    return result
+
+
+def bench_patch(options):
+    commits = list(synthetic_commits(options.count))
+    validator = NullValidator()
+    print(f"Parsing {len(commits)} synthetic commits:")
+
+    for name, cls in [("dataclass", LegacyPatch), ("lazy", Patch)]:
+        measure(
+            f"{name}, author only",
+            lambda: [cls(commit=c, validator=validator).author for c in commits],
+        )
+        measure(
+            f"{name}, all fields",
+            lambda: [
+                (p.author, p.type, p.bug, p.reviewers)
+                for p in [cls(commit=c, validator=validator) for c in commits]
+            ],
+        )
+        measure(
+            f"{name}, kept in memory",
+            lambda: [cls(commit=c, validator=validator) for c in commits],
+        )
+
+
+def bench_log(options):
+    import hglib
+    from utils.repo import stream_revisions
+
+    hgclient = hglib.open(".")
+    root = hgclient.root()
+    print(f"Reading {options.revrange} in {root.decode()}:")
+
+    def first_and_count(commits):
+        start = time.perf_counter()
+        first = None
+        count = 0
+        for commit in commits:
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+        print(f"    first result after {first or 0:.3f} s, {count} commits")
+
+    measure(
+        "hglib.log",
+        lambda: first_and_count(hgclient.log(revrange=options.revrange)),
+    )
+    measure(
+        "stream_revisions",
+        lambda: first_and_count(stream_revisions(root, revrange=options.revrange)),
+    )
+
+
+def bench_snapshot(options):
+    import json
+    import tempfile
+    from utils.snapshot import SNAPSHOT_VERSION, SnapshotBugs
+
+    rng = random.Random(1)
+    bugs = {}
+    for bug_id in range(options.count):
+        bugs[str(bug_id)] = {
+            "id": bug_id,
+            "product": "NSS",
+            "status": "RESOLVED",
+            "target_milestone": f"3.{rng.randrange(99)}",
+            "summary": f"Summary for bug {bug_id} " * 3,
+            "groups": ["core-security"] if rng.random() < 0.1 else [],
+            "weburl": f"https://bugzilla.mozilla.org/show_bug.cgi?id={bug_id}",
+        }
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as snapshot:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "created": 0,
+                "revrange": "all()",
+                "bugzilla": "https://bugzilla.mozilla.org/rest",
+                "bugs": bugs,
+                "errors": {},
+            },
+            snapshot,
+        )
+        snapshot.flush()
+        print(f"Rendering {options.count} bugs from a snapshot:")
+
+        def render():
+            fetcher = SnapshotBugs(snapshot.name)
+            return "\n".join(
+                f'<li><a href="{b.weburl}">{"🔐 " if b.groups else ""}Bug {b.id}</a> - {b.summary}</li>'
+                for b in map(fetcher.get, range(options.count))
+            )
+
+        measure("load and render", render)
+
+
+# The hg side of `nss-land-commit.py --resolve`, without nss-hgd and then
+# through one started for the benchmark.
+def bench_startup(options):
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+    from utils import hgsession
+    from utils.repo import stream_revisions
+    from utils.version import get_version
+
+    validator = NullValidator()
+
+    def resolve_calls():
+        hgclient = hgsession.open_repo(".")
+        hgclient.paths(name=b"default")
+        patches = [
+            Patch(commit=commit, validator=validator)
+            for commit in stream_revisions(hgclient.root(), revrange=options.revrange)
+        ]
+        hgclient.outgoing(revrange=" + ".join(p.hash.decode() for p in patches[:20]))
+        get_version(hgclient, rev=patches[0].hash, validator=validator)
+        hgclient.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket = Path(tmp) / "hgd.sock"
+        os.environ["NSS_HGD_SOCKET"] = str(socket)
+        print(f"Resolving {options.revrange}:")
+        for run in range(3):
+            hgsession._session = None
+            measure(f"cold, run {run + 1}", resolve_calls)
+
+        script = Path(__file__).resolve().parent / "nss-hgd.py"
+        subprocess.Popen([sys.executable, script], stdout=subprocess.DEVNULL)
+        while hgsession.daemon() is None:
+            hgsession._session = None
+            time.sleep(0.05)
+        try:
+            for run in range(3):
+                measure(f"nss-hgd, run {run + 1}", resolve_calls)
+        finally:
+            subprocess.run(
+                [sys.executable, script, "--stop"], stdout=subprocess.DEVNULL
+            )
+
+
+# What each tool imports before it can print --help, from -X importtime.
+def bench_imports(options):
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    here = Path(__file__).resolve().parent
+    print("Startup imports for --help:")
+    for script in [
+        "nss-tools.py",
+        "nss-land-commit.py",
+        "nss-release-review.py",
+        "nss-code-review.py",
+    ]:
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", here / script, "--help"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        elapsed = time.perf_counter() - start
+
+        # Top-level imports are the ones whose name isn't indented.
+        toplevel = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                toplevel[name.strip()] = int(cumulative) / 1000
+        heaviest = sorted(toplevel.items(), key=lambda item: -item[1])[:3]
+        print(
+            f"  {script:<24} {elapsed:6.3f} s, imports {sum(toplevel.values()):6.1f} ms "
+            + ", ".join(f"{name} {ms:.1f}" for name, ms in heaviest)
+        )
+
+
+# Runs the tools end to end on a synthetic repository (utils.synthrepo)
+# against an in-process utils.fakebugzilla, offline.
+def bench_tools(options):
+    import json
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+    from utils.fakebugzilla import FakeBugzilla, serve
+    from utils.synthrepo import SynthRepo
+
+    here = Path(__file__).resolve().parent
+    with tempfile.TemporaryDirectory() as tmp:
+        # resolve() takes the repository name from after the "@" in the
+        # default path; pointing it at itself means everything has landed.
+        repo = Path(tmp) / "nss@synth"
+        start = time.perf_counter()
+        bugs = SynthRepo(str(repo), seed=options.seed).build(
+            commits=options.commits, releases=max(1, options.commits // 500)
+        )
+        print(
+            f"Built {options.commits} commits, {len(bugs)} bugs in "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+        (repo / ".hg" / "hgrc").write_text(f"[paths]\ndefault = {repo}\n")
+
+        home = Path(tmp) / "home"
+        home.mkdir()
+        (home / ".nss-land-commit.json").write_text(json.dumps({"api_key": "x"}))
+
+        fake = FakeBugzilla(bugs, delay=options.delay)
+        server = serve(fake)
+        url = f"http://127.0.0.1:{server.server_address[1]}/rest/"
+        env = dict(os.environ, HOME=str(home), NSS_HGD_SOCKET=str(Path(tmp) / "no"))
+
+        runs = [
+            ("release-review", ["nss-release-review.py", "-r", "reverse(all())"]),
+            (
+                "land --resolve",
+                ["nss-land-commit.py", "--resolve", f"last(all(), {options.resolve})"],
+            ),
+        ]
+        runs += [(f"{label} --async", [*run, "--async"]) for label, run in runs]
+        print(f"{'tool':<28} {'wall':>8} {'requests':>9} {'peak RSS':>10}")
+        for label, (script, *args) in runs:
+            before = fake.stats()["requests"]
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                [sys.executable, here / script, *args]
+                + ["--batch", "--yes", "--no-cache", "--bugzilla", url]
+                + ([] if options.rate is None else ["--rate", str(options.rate)]),
+                cwd=repo,
+                env=env,
+                stdout=subprocess.DEVNULL,
+            )
+            _, status, usage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - start
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            requests = fake.stats()["requests"] - before
+            print(
+                f"{label:<28} {elapsed:7.2f}s {requests:>9} {usage.ru_maxrss / 1024:7.1f} MiB"
+                + ("" if proc.returncode == 0 else f"  (exit {proc.returncode})")
+            )
+        server.shutdown()
+
+
+def der_element(der: bytes, offset: int) -> tuple:
+    length = der[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(der[offset : offset + size], "big")
+        offset += size
+    return offset, offset + length
+
+
+# Just enough X.509 to find what certdata.txt keys trust objects on.
+def issuer_and_serial(der: bytes) -> tuple:
+    tbs, _ = der_element(der, der_element(der, 0)[0])
+    position = tbs
+    if der[position] == 0xA0:
+        position = der_element(der, position)[1]
+    serialEnd = der_element(der, position)[1]
+    algorithmEnd = der_element(der, serialEnd)[1]
+    issuerEnd = der_element(der, algorithmEnd)[1]
+    return der[algorithmEnd:issuerEnd], der[position:serialEnd]
+
+
+def octal(data: bytes) -> str:
+    lines = [
+        "".join(f"\\{byte:03o}" for byte in data[start : start + 16])
+        for start in range(0, len(data), 16)
+    ]
+    return "MULTILINE_OCTAL\n" + "\n".join(lines) + "\nEND\n"
+
+
+def certdata_release(certs, rng) -> str:
+    out = [
+        "BEGINDATA\n",
+        "CKA_CLASS CK_OBJECT_CLASS CKO_NSS_BUILTIN_ROOT_LIST\n",
+        'CKA_LABEL UTF8 "Mozilla Builtin Roots"\n',
+    ]
+    for number, der in enumerate(certs):
+        issuer, serial = issuer_and_serial(der)
+        label = f"Root {number}"
+        trust = rng.choice(
+            ["CKT_NSS_TRUSTED_DELEGATOR"] * 8 + ["CKT_NSS_MUST_VERIFY_TRUST"]
+        )
+        out += [
+            f'\n# Certificate "{label}"\n',
+            "CKA_CLASS CK_OBJECT_CLASS CKO_CERTIFICATE\n",
+            f'CKA_LABEL UTF8 "{label}"\n',
+            "CKA_ISSUER " + octal(issuer),
+            "CKA_SERIAL_NUMBER " + octal(serial),
+            "CKA_VALUE " + octal(der),
+            f'\n# Trust for "{label}"\n',
+            "CKA_CLASS CK_OBJECT_CLASS CKO_NSS_TRUST\n",
+            f'CKA_LABEL UTF8 "{label}"\n',
+            "CKA_ISSUER " + octal(issuer),
+            "CKA_SERIAL_NUMBER " + octal(serial),
+            f"CKA_TRUST_SERVER_AUTH CK_TRUST {trust}\n",
+            "CKA_TRUST_EMAIL_PROTECTION CK_TRUST CKT_NSS_TRUSTED_DELEGATOR\n",
+            "CKA_TRUST_CODE_SIGNING CK_TRUST CKT_NSS_MUST_VERIFY_TRUST\n",
+        ]
+    return "".join(out)
+
+
+# The Go converter's way: every \ooo parsed on its own.
+def decode_per_byte(text: str) -> bytes:
+    return bytes(int(text[pos + 1 : pos + 4], 8) for pos in range(0, len(text), 4))
+
+
+# certdata.txt releases built from the CA certificates installed here,
+# concatenated as a trust-store pipeline would read them.
+def bench_certdata(options):
+    import base64
+    import ssl
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+    from utils import certdata
+
+    bundle = Path(options.corpus or ssl.get_default_verify_paths().cafile or "")
+    if not bundle.is_file():
+        print("No CA bundle found; give one with --corpus")
+        return
+    certs = [
+        base64.b64decode(block)
+        for block in re.findall(
+            r"-----BEGIN CERTIFICATE-----(.*?)-----END CERTIFICATE-----",
+            bundle.read_text(),
+            re.S,
+        )
+    ]
+
+    rng = random.Random(options.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        releases = []
+        for number in range(options.releases):
+            kept = [der for der in certs if rng.random() > 0.05]
+            path = Path(tmp) / f"certdata-{number}.txt"
+            path.write_text(certdata_release(kept, rng))
+            releases.append(path)
+        history = Path(tmp) / "history.txt"
+        with open(history, "w") as outFile:
+            for path in releases:
+                outFile.write(path.read_text())
+        print(
+            f"{options.releases} releases of up to {len(certs)} roots, "
+            f"{history.stat().st_size / 2**20:.1f} MiB concatenated:"
+        )
+
+        def count_roots(roots):
+            return sum(1 for root in roots if root.der is not None)
+
+        blocks = re.findall(r"MULTILINE_OCTAL\n(.*?)\nEND", history.read_text(), re.S)
+        blocks = [block.replace("\n", "") for block in blocks]
+        measure(
+            "decode octal, per byte",
+            lambda: [decode_per_byte(block) for block in blocks],
+        )
+        measure(
+            "decode octal, escape_decode",
+            lambda: [certdata.codecs.escape_decode(block)[0] for block in blocks],
+        )
+        roots = measure(
+            "parse history, streaming",
+            lambda: count_roots(certdata.read_roots(history)),
+        )
+        print(f"    {roots} certificates")
+        measure(
+            "parse history, materialized",
+            lambda: len(list(certdata.read_roots(history))),
+        )
+
+        for jobs in [1, 4]:
+            measure(
+                f"write PEMs, {jobs} thread(s)",
+                lambda: certdata.convert(
+                    history, Path(tmp) / f"pems-{jobs}", jobs=jobs
+                ),
+            )
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, Path(__file__).resolve().parent / "nss-certdata.py"]
+            + ["-j", "4", "-o", Path(tmp) / "per-release", *releases],
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        print(
+            f"  {'nss-certdata.py -j 4, per release':<32} "
+            f"{time.perf_counter() - start:8.3f} s"
+        )
+
+        changes = measure(
+            "diff first and last release",
+            lambda: list(
+                certdata.diff_roots(
+                    certdata.read_roots(releases[0]), certdata.read_roots(releases[-1])
+                )
+            ),
+        )
+        print(f"    {len(changes)} changes")
+
+
+# How long the slowest shard takes with gtest's own round-robin sharding and
+# with shards balanced on recorded times, for skewed synthetic test times.
+def bench_shards(options):
+    import tempfile
+    from pathlib import Path
+    from utils.gtests import Timings, balance, makespan, round_robin
+
+    rng = random.Random(options.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = Timings(Path(tmp) / "timings.json", binary="bench")
+    tests = [f"Suite{n // 50}.Test{n % 50}" for n in range(min(options.count, 20000))]
+    for test in tests:
+        timings.tests[test] = rng.lognormvariate(-4, 1.5)
+    total = sum(timings.tests.values())
+    print(f"{len(tests)} tests, {total:.0f}s in all:")
+    for jobs in [4, 8, 16, 32]:
+        roundRobin = makespan(round_robin(tests, jobs), timings)
+        balanced = makespan(balance(tests, timings, jobs), timings)
+        print(
+            f"  {jobs:>2} shards: round robin {roundRobin:7.1f}s, "
+            f"balanced {balanced:7.1f}s (ideal {total / jobs:.1f}s)"
+        )
+
+
+# Loading the code review checklist and checking a patch's files, without
+# and then with the results of an earlier review.
+def bench_review(options):
+    import tempfile
+    from pathlib import Path
+    from utils.checklist import ReviewCache, load_checklist, run_checks
+
+    count = min(options.count, 2000)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        gtests = root / "gtests" / "bench_gtest"
+        gtests.mkdir(parents=True)
+        names = [f"bench_{n}_unittest.cc" for n in range(count)]
+        for name in names:
+            (gtests / name).write_text(f"// {name}\n" * 200)
+        (gtests / "manifest.mn").write_text("CPPSRCS = " + " ".join(names))
+        (gtests / "bench_gtest.gyp").write_text(repr({"sources": names}))
+        changes = {f"gtests/bench_gtest/{name}": "A" for name in names}
+        cache = ReviewCache(root / "cache.json")
+        print(f"Checking {count} new gtest files:")
+
+        measure("load checklist (PyYAML)", lambda: load_checklist())
+        load_checklist(cache=cache)
+        measure("load checklist (cached)", lambda: load_checklist(cache=cache))
+        rules = load_checklist(cache=cache)
+        for jobs in [1, 4]:
+            measure(
+                f"check, {jobs} job(s), no cache",
+                lambda: run_checks(rules, changes, root=root, jobs=jobs),
+            )
+        run_checks(rules, changes, root=root, cache=cache)
+        (gtests / names[0]).write_text("// revised\n")
+        measure(
+            "check a revision of one file",
+            lambda: run_checks(rules, changes, root=root, cache=cache),
+        )
+
+
+# The same lookups and updates through python-bugzilla on FetchExecutor's
+# threads and through utils.asyncbz on one event loop, against an in-process
+# utils.fakebugzilla.
+def bench_bugzilla(options):
+    import asyncio
+    import bugzilla
+    from utils.asyncbz import AsyncBugzilla
+    from utils.fakebugzilla import FakeBugzilla, serve
+    from utils.fetch import FetchExecutor
+
+    count = min(options.count, 200)
+    bugs = [{"id": n, "product": "NSS", "status": "NEW"} for n in range(1, count + 1)]
+    fake = FakeBugzilla(bugs, delay=options.delay)
+    server = serve(fake)
+    url = f"http://127.0.0.1:{server.server_address[1]}/rest/"
+    ids = [bug["id"] for bug in bugs]
+
+    print(f"{count} getbug and {count} update_bugs, {options.delay * 1000:.0f}ms each")
+    executor = FetchExecutor(jobs=options.jobs)
+    bzapi = bugzilla.Bugzilla(url, api_key="x")
+
+    def threaded():
+        executor.map("getbug", bzapi.getbug, ids)
+        update = bzapi.build_update(comment="bench", status="RESOLVED")
+        executor.map("update", lambda bug: bzapi.update_bugs([bug], update), ids)
+
+    measure(f"python-bugzilla, {options.jobs} threads", threaded)
+    executor.close()
+
+    async def gathered():
+        client = AsyncBugzilla(url, api_key="x", connections=options.jobs)
+        await asyncio.gather(*(client.getbug(bug) for bug in ids))
+        update = client.build_update(comment="bench", status="RESOLVED")
+        await asyncio.gather(*(client.update_bugs([bug], update) for bug in ids))
+        await client.close()
+        return client.pool.connects
+
+    connects = measure(
+        f"asyncbz, {options.jobs} connections", lambda: asyncio.run(gathered())
+    )
+    print(f"  asyncbz opened {connects} connections for {2 * count} requests")
+    server.shutdown()
+
+
+# Pairing backouts with what they back out, by scanning every patch for each
+# backout and through utils.backouts.NodeIndex; then looking up the targets
+# of every backout in `-r` (in the current repository) one hg log at a time
+# and in one batched query.
+def bench_backouts(options):
+    import hglib
+    from utils.backouts import Backouts, NodeIndex, find_backouts, resolve_outside
+    from utils.repo import stream_revisions
+
+    rng = random.Random(options.seed)
+    validator = NullValidator()
+    patches = []
+    for rev in range(options.count):
+        node = f"{rng.getrandbits(160):040x}"
+        if patches and rng.random() < 0.05:
+            target = rng.choice(patches).hash.decode()[:12]
+            desc = f"Backed out changeset {target} (bug 1) for build bustage"
+        else:
+            desc = f"Bug {rng.randrange(10**6)} - fix something r=reviewer"
+        commit = (str(rev).encode(), node.encode(), b"", b"default", b"", desc.encode(), None)  # fmt: skip
+        patches.append(Patch(commit=commit, validator=validator))
+    for patch in patches:
+        patch.type
+    backoutCount = sum(patch.type == "backout" for patch in patches)
+    print(f"Pairing {backoutCount} backouts among {len(patches)} changesets:")
+
+    def scan():
+        return {
+            patch.hash: next(
+                other.hash
+                for other in patches
+                if other.hash.decode().startswith(patch.changeset)
+            )
+            for patch in patches
+            if patch.type == "backout"
+        }
+
+    scanned = measure("scan per backout", scan)
+    indexed = measure("NodeIndex", lambda: find_backouts(patches, NodeIndex(patches)))
+    print(f"    {len(scanned)} targets found, {len(indexed.targets)} paired")
+
+    hgclient = hglib.open(".")
+    root = hgclient.root()
+    backouts = [
+        Patch(commit=commit, validator=validator)
+        for commit in stream_revisions(root, revrange=options.revrange)
+    ]
+    backouts = [patch for patch in backouts if patch.type == "backout"]
+    print(f"Looking up the targets of {len(backouts)} backouts in {root.decode()}:")
+
+    def one_by_one():
+        return [hgclient.log(revrange=f'id("{patch.changeset}")') for patch in backouts]
+
+    measure("hg log per backout", one_by_one)
+    result = Backouts(
+        targets={},
+        reverted=set(),
+        outside={patch.hash: (patch, None) for patch in backouts},
+    )
+    measure(
+        "one batched query",
+        lambda: resolve_outside(hgclient, [result], validator=validator),
+    )
+    found = sum(target is not None for _, target in result.outside.values())
+    print(f"    {found} found")
+
+
+# How nss-uplift-unified.sh and nss-uplift.py notice .def changes after
+# update_nss, over a scratch repository with `-n` changed files.
+def bench_uplift(options):
+    import hglib
+    import tempfile
+    from pathlib import Path
+    from utils.uplift import def_changes
+
+    count = min(options.count, 5000)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        hglib.init(tmp)
+        hgclient = hglib.open(tmp)
+        lib = root / "security" / "nss" / "lib"
+        lib.mkdir(parents=True)
+        for n in range(count):
+            (lib / f"f{n}.c").write_text("int x;\n" * 200)
+        (lib / "nss.def").write_text("EXPORTS\n")
+        hgclient.commit(message="base", addremove=True, user="bench")
+        for n in range(count):
+            (lib / f"f{n}.c").write_text("int y;\n" * 200)
+        (lib / "nss.def").write_text("EXPORTS\nNSS_Foo;\n")
+        print(f"Finding .def changes among {count + 1} changed files:")
+
+        def grep_diff():
+            return [line for line in hgclient.diff().splitlines() if b".def" in line]
+
+        found = measure("hg diff | grep .def", grep_diff)
+        print(f"    {len(found)} matching lines")
+        found = measure("status", lambda: def_changes(hgclient))
+        print(f"    {found}")
+        hgclient.close()
+
+
+def bench_try(options):
+    import hglib
+    import tempfile
+    from pathlib import Path
+    from utils.trypush import push_key
+
+    count = min(options.count, 50)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        hglib.init(str(root / "work"))
+        hgclient = hglib.open(str(root / "work"))
+        for n in range(200):
+            (root / "work" / f"f{n}.c").write_text("int x;\n" * 200)
+        hgclient.commit(message="base", addremove=True, user="bench")
+        hgclient.phase(b"0", public=True)
+        heads = []
+        for n in range(count):
+            hgclient.update(rev=b"0", clean=True)
+            (root / "work" / f"f{n}.c").write_text("int y;\n" * 200)
+            hgclient.commit(message=f"change {n}", user="bench")
+            heads.append(hgclient.log(revrange=".")[0].node)
+
+        def fresh_try(name):
+            hglib.init(str(root / name))
+            (root / name / ".hg" / "hgrc").write_text("[phases]\npublish = False\n")
+            return str(root / name)
+
+        def one_each():
+            dest = fresh_try("try1").encode()
+            for head in heads:
+                hgclient.push(dest=dest, rev=[head], force=True)
+
+        def one_push():
+            hgclient.push(dest=fresh_try("try2").encode(), rev=heads, force=True)
+
+        print(f"Pushing {count} diffs to a local try repository:")
+        measure("one push per diff", one_each)
+        measure("one push, a head each", one_push)
+        measure(
+            "dedupe keys",
+            lambda: [push_key(hgclient, head.decode(), "-b do") for head in heads],
+        )
+        hgclient.close()
+
+
+# What nss-ssl-gtests.py hashes before deciding what to run: a dist's
+# binary and libraries, first unseen and then unchanged since last time.
+def bench_results(options):
+    import tempfile
+    from pathlib import Path
+    from utils.gtests import ResultCache
+
+    count = min(options.count, 40)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / "bin").mkdir()
+        (root / "lib").mkdir()
+        rng = random.Random(options.seed)
+        (root / "bin" / "ssl_gtest").write_bytes(rng.randbytes(30 << 20))
+        for n in range(count):
+            (root / "lib" / f"lib{n}.so").write_bytes(rng.randbytes(2 << 20))
+        command = [str(root / "bin" / "ssl_gtest")]
+        print(f"Hashing a 30 MiB binary and {count} 2 MiB libraries:")
+
+        def inputs():
+            cache = ResultCache(root / "results.json")
+            key = cache.inputs(command, env={}, lib_dir=root / "lib")
+            cache.save()
+            return key
+
+        measure("first run", inputs)
+        measure("nothing changed", inputs)
+
+
+BENCHMARKS = {
+    "patch": bench_patch,
+    "log": bench_log,
+    "snapshot": bench_snapshot,
+    "startup": bench_startup,
+    "imports": bench_imports,
+    "tools": bench_tools,
+    "headlines": bench_headlines,
+    "bugzilla": bench_bugzilla,
+    "certdata": bench_certdata,
+    "shards": bench_shards,
+    "review": bench_review,
+    "uplift": bench_uplift,
+    "backouts": bench_backouts,
+    "try": bench_try,
+    "results": bench_results,
+}
+
+
+def main():
+    parser = OptionParser(usage=f"%prog [options] {{{','.join(BENCHMARKS)}}}")
+    parser.add_option(
+        "-n", "--count", type="int", default=100000, help="number of items to use"
+    )
+    parser.add_option(
+        "-r",
+        "--revrange",
+        default="reverse(all())",
+        help="revisions for `log` and `startup`",
+    )
+
+    parser.add_option(
+        "--commits", type="int", default=500, help="synthetic commits for `tools`"
+    )
+    parser.add_option(
+        "--resolve", type="int", default=50, help="commits to resolve for `tools`"
+    )
+    parser.add_option(
+        "--delay",
+        type="float",
+        default=0.0,
+        help="fake Bugzilla latency per request for `tools` and `bugzilla`",
+    )
+    parser.add_option(
+        "--releases",
+        type="int",
+        default=20,
+        help="certdata.txt releases to concatenate for `certdata`",
+    )
+    parser.add_option(
+        "--rate",
+        type="float",
+        help="pass --rate to the tools for `tools` (0 for no limit)",
+    )
+    parser.add_option(
+        "-j", "--jobs", type="int", default=4, help="concurrency for `bugzilla`"
+    )
+    parser.add_option("--seed", type="int", default=1, help="seed for synthetic data")
+    parser.add_option(
+        "--corpus",
+        help="file of extra headlines, one per line, for `headlines`; a CA bundle for `certdata`",
+    )
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        parser.error(f"Pick one of: {', '.join(BENCHMARKS)}")
+
+    BENCHMARKS[args[0]](options)
+
+
+if __name__ == "__main__":
+    main()
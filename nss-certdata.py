@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Turns NSS's certdata.txt into PEM files, like
+# cmd/convert_nss_certdata_to_pems, but knows which roots are trusted for
+# what, takes many releases at once and can compare two of them.
+#
+#   nss-certdata.py lib/ckfw/builtins/certdata.txt > roots.pem
+#   nss-certdata.py --trust server -o pems/ certdata-3.*.txt
+#   nss-certdata.py --diff old/certdata.txt new/certdata.txt
+
+import sys
+from colorama import init, Fore
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+from pathlib import Path
+
+from utils.certdata import (
+    TRUST_PURPOSES,
+    convert,
+    diff_roots,
+    pem,
+    read_roots,
+    wanted,
+)
+
+
+def describe_trust(trust) -> str:
+    return ", ".join(
+        f"{purpose} {value.replace('CKT_NSS_', '')}" for purpose, value in trust
+    )
+
+
+def show_diff(oldPath, newPath):
+    changes = 0
+    for change, label, old, new in diff_roots(read_roots(oldPath), read_roots(newPath)):
+        changes += 1
+        if change == "+":
+            print(Fore.GREEN + f"+ {label} ({describe_trust(new)})")
+        elif change == "-":
+            print(Fore.RED + f"- {label} ({describe_trust(old)})")
+        else:
+            print(Fore.YELLOW + f"~ {label}")
+            print(f"    was {describe_trust(old)}")
+            print(f"    now {describe_trust(new)}")
+    print(f"{changes} change(s)")
+
+
+def main():
+    init(autoreset=True)
+
+    parser = OptionParser(usage="%prog [options] certdata.txt [...]")
+    parser.add_option(
+        "-o",
+        "--output",
+        metavar="DIR",
+        help="Write one PEM file per root into DIR (one directory per input if several) instead of to stdout",
+    )
+    parser.add_option(
+        "--trust",
+        choices=list(TRUST_PURPOSES),
+        help=f"Only roots trusted for this purpose ({', '.join(TRUST_PURPOSES)})",
+    )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        default=4,
+        help="Files converted at once, and PEM writers per file (default 4)",
+    )
+    parser.add_option(
+        "--diff",
+        action="store_true",
+        help="Compare two certdata.txt files rather than convert them",
+    )
+
+    (options, args) = parser.parse_args()
+    jobs = max(1, options.jobs)
+
+    if options.diff:
+        if len(args) != 2:
+            parser.error("--diff takes the old and new certdata.txt")
+        show_diff(*args)
+        return
+
+    if not args:
+        parser.error("Give the path of at least one certdata.txt")
+
+    if not options.output:
+        for path in args:
+            for root in read_roots(path):
+                if wanted(root, options.trust):
+                    sys.stdout.write(pem(root.der))
+        return
+
+    if len(args) == 1:
+        written = convert(args[0], options.output, purpose=options.trust, jobs=jobs)
+        print(f"Wrote {written} PEM files to {options.output}")
+        return
+
+    # Releases usually all live in files called certdata.txt.
+    stems = [Path(path).stem for path in args]
+    if len(set(stems)) != len(stems):
+        stems = [f"{index}-{stem}" for index, stem in enumerate(stems)]
+    directories = [Path(options.output) / stem for stem in stems]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(convert, path, directory, purpose=options.trust, jobs=1)
+            for path, directory in zip(args, directories)
+        ]
+        for path, directory, future in zip(args, directories, futures):
+            print(f"{path}: wrote {future.result()} PEM files to {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,140 @@
 #!/usr/bin/env python3
 
-from whaaaaat import prompt
-import yaml
-import pyperclip
-import io, os
-
-__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
-
-resultData = {}
-checklistData = {}
-with open(os.path.join(__location__, "nss-code-review-checklist.yaml"), "r") as inFile:
-    checklistData = yaml.load(inFile, Loader=yaml.BaseLoader)
-
-print("h for help. y=pass, s=skip, n=fail\n\n")
-
-for segment in checklistData:
-    for heading in segment:
-        print("## {} ##".format(heading))
-
-        resultData[heading] = {}
-
-        for rule in segment[heading]:
-            answers = prompt(
-                [
-                    {
-                        "type": "expand",
-                        "name": "checklist_item",
-                        "message": rule,
-                        "default": "s",
-                        "choices": [
-                            {"name": "Pass", "key": "y"},
-                            {"name": "N/A", "key": "s"},
-                            {"name": "Fail", "key": "n"},
-                        ],
-                    },
-                ]
+import io
+from colorama import init, Fore
+from optparse import OptionParser
+from pathlib import Path
+
+from utils.checklist import ReviewCache, changed_files, load_checklist, run_checks
+
+
+def check_patch(rules, *, options, cache) -> dict:
+    import hglib
+    from utils.hgsession import open_repo
+
+    try:
+        hgclient = open_repo(".")
+        root = Path(hgclient.root().decode("UTF-8"))
+        changes = changed_files(hgclient, options.revrange)
+    except (hglib.error.ServerError, hglib.error.CommandError):
+        print(Fore.YELLOW + "Not in an hg repository, so nothing is checked for you")
+        return {}
+
+    results = run_checks(rules, changes, root=root, cache=cache, jobs=options.jobs)
+    for name, result in results.items():
+        if result.unavailable:
+            print(Fore.YELLOW + f"{name}: {result.unavailable}")
+        else:
+            print(
+                f"{name}: {result.checked} file(s), {result.cached} unchanged since they were last checked"
             )
-            resultData[heading][rule] = answers["checklist_item"]
-
-with io.StringIO() as buf:
-
-    for heading in resultData:
-        print("**{}**".format(heading), file=buf)
-        for rule in resultData[heading]:
-            result = resultData[heading][rule]
-            if result == "Pass":
-                print("✅ " + rule, file=buf)
-            elif result == "N/A":
-                print("⏭  " + rule, file=buf)
+    return results
+
+
+def main():
+    init(autoreset=True)
+
+    parser = OptionParser(
+        usage="%prog [options]\n\nWalk through the NSS code review checklist and copy the results"
+    )
+    parser.add_option(
+        "-r",
+        "--revrange",
+        default=".",
+        help="Changesets under review; they and any uncommitted changes are checked (default .)",
+    )
+    parser.add_option(
+        "-j", "--jobs", type="int", default=4, help="Files checked at once (default 4)"
+    )
+    parser.add_option(
+        "--no-checks",
+        action="store_true",
+        help="Ask about every rule, even the ones that can be checked",
+    )
+    parser.add_option(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse or keep the parsed checklist and earlier check results",
+    )
+    (options, args) = parser.parse_args()
+
+    import pyperclip
+    from utils.types import prompt
+
+    cache = None if options.no_cache else ReviewCache()
+    rules = load_checklist(cache=cache)
+
+    results = {}
+    if not options.no_checks and any(rule.check for rule in rules):
+        results = check_patch(rules, options=options, cache=cache)
+    if cache is not None:
+        cache.save()
+
+    resultData = {}
+
+    print("h for help. y=pass, s=skip, n=fail\n\n")
+
+    for rule in rules:
+        if rule.heading not in resultData:
+            print("## {} ##".format(rule.heading))
+            resultData[rule.heading] = {}
+
+        # Only what couldn't be checked, or didn't pass, needs asking about.
+        result = results.get(rule.check)
+        if result is not None and not result.unavailable and not result.problems:
+            if result.checked:
+                print(f"✅ {rule.text} ({result.checked} file(s) checked)")
+                resultData[rule.heading][rule.text] = "Pass"
             else:
-                print("❌ " + rule, file=buf)
+                print(f"⏭  {rule.text} (no files it applies to)")
+                resultData[rule.heading][rule.text] = "N/A"
+            continue
+        if result is not None:
+            for problem in result.problems:
+                print(Fore.RED + problem)
+
+        answers = prompt(
+            [
+                {
+                    "type": "expand",
+                    "name": "checklist_item",
+                    "message": rule.text,
+                    "default": "s",
+                    "choices": [
+                        {"name": "Pass", "key": "y"},
+                        {"name": "N/A", "key": "s"},
+                        {"name": "Fail", "key": "n"},
+                    ],
+                },
+            ]
+        )
+        resultData[rule.heading][rule.text] = answers["checklist_item"]
+
+    with io.StringIO() as buf:
+
+        for heading in resultData:
+            print("**{}**".format(heading), file=buf)
+            for rule in resultData[heading]:
+                result = resultData[heading][rule]
+                if result == "Pass":
+                    print("✅ " + rule, file=buf)
+                elif result == "N/A":
+                    print("⏭  " + rule, file=buf)
+                else:
+                    print("❌ " + rule, file=buf)
+            print("", file=buf)
+
         print("", file=buf)
+        print(
+            "[[ https://github.com/mozilla/nss-tools | nss-code-review.py ]]", file=buf
+        )
+
+        print("\n\n")
+        print(buf.getvalue())
 
-    print("", file=buf)
-    print("[[ https://github.com/mozilla/nss-tools | nss-code-review.py ]]", file=buf)
+        pyperclip.copy(buf.getvalue())
+        print("(Copied to clipboard)")
 
-    print("\n\n")
-    print(buf.getvalue())
 
-    pyperclip.copy(buf.getvalue())
-    print("(Copied to clipboard)")
+if __name__ == "__main__":
+    main()
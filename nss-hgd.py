@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+import hglib
+import os
+import pickle
+import secrets
+import subprocess
+import threading
+import time
+from colorama import init, Fore
+from multiprocessing.connection import Client, Listener
+from optparse import OptionParser
+from pathlib import Path
+
+from utils.hgsession import daemon, key_path, socket_path
+from utils.repo import Revision
+
+
+class RootedClient(hglib.client.hgclient):
+    # hg resolves relative file patterns, like `hg cat lib/nss/nss.h`, from
+    # its working directory, and hglib starts the command server in ours.
+    # The tools run from the repository's root, so its server runs there.
+
+    def __init__(self, root: Path):
+        self.cwd = root
+        super().__init__(os.fsencode(root), None, None)
+
+    def open(self):
+        self.server = subprocess.Popen(
+            self._args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=dict(os.environ, **self._env),
+        )
+        try:
+            self._readhello()
+        except hglib.error.ServerError:
+            ret, err = self._close()
+            raise hglib.error.ServerError(
+                f"server exited with status {ret}: {err.strip()}"
+            )
+        return self
+
+
+def find_root(path) -> Path:
+    path = Path(path).resolve()
+    for candidate in [path, *path.parents]:
+        if (candidate / ".hg").is_dir():
+            return candidate
+    return path
+
+
+class Daemon:
+    # Keeps one hglib command server per repository warm, so the tools skip
+    # Mercurial's startup on every run. Calls into the same repository are
+    # serialized; the command server picks up changes made by other hg
+    # processes between commands.
+
+    def __init__(self, *, address, authkey, idle_timeout):
+        self.address = address
+        self.authkey = authkey
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.repos = {}
+        self.roots = {}
+        self.requests = 0
+        self.started = time.time()
+        self.last_used = time.monotonic()
+        self.stopping = False
+
+    def repo(self, root):
+        with self.lock:
+            return self.repos[root]
+
+    def open(self, path):
+        with self.lock:
+            if path in self.roots:
+                return self.roots[path]
+        client = RootedClient(find_root(path))
+        root = client.root()
+        with self.lock:
+            self.roots[path] = root
+            if root in self.repos:
+                client.close()
+            else:
+                self.repos[root] = (client, threading.Lock())
+        return root
+
+    def call(self, root, name, args, kwargs):
+        client, lock = self.repo(root)
+        with lock:
+            result = getattr(client, name)(*args, **kwargs)
+        # hglib's revision tuples don't unpickle; Revision has the same shape.
+        if isinstance(result, list):
+            result = [
+                Revision(*item) if isinstance(item, hglib.client.revision) else item
+                for item in result
+            ]
+        return result
+
+    # For utils.repo.stream_log: the whole output at once, plus the exit code.
+    def run(self, root, args):
+        args = [os.fsencode(arg) for arg in args]
+        client, lock = self.repo(root)
+        with lock:
+            out = client.rawcommand(args, eh=lambda ret, out, err: (ret, out, err))
+        return out if isinstance(out, tuple) else (0, out, b"")
+
+    def status(self):
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "uptime": time.time() - self.started,
+                "requests": self.requests,
+                "repos": [root.decode(encoding="UTF-8") for root in self.repos],
+            }
+
+    def stop(self):
+        self.stopping = True
+        # Wake up the accept() in serve().
+        Client(self.address, family="AF_UNIX", authkey=self.authkey).close()
+
+    def handle(self, request):
+        op, *args = request
+        if op == "open":
+            return self.open(*args)
+        if op == "call":
+            return self.call(*args)
+        if op == "run":
+            return self.run(*args)
+        if op == "status":
+            return self.status()
+        if op == "stop":
+            threading.Thread(target=self.stop).start()
+            return None
+        raise Exception(f"Unknown request {op}")
+
+    def reply(self, request):
+        try:
+            return ("ok", self.handle(request))
+        except hglib.error.CommandError as ce:
+            return ("command-error", (ce.args, ce.ret, ce.out, ce.err))
+        except Exception as e:
+            try:
+                pickle.loads(pickle.dumps(e))
+            except Exception:
+                e = Exception(f"{type(e).__name__}: {e}")
+            return ("error", e)
+
+    def session(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                with self.lock:
+                    self.requests += 1
+                    self.last_used = time.monotonic()
+                conn.send(self.reply(request))
+
+    def watch_idle(self):
+        while not self.stopping:
+            time.sleep(min(self.idle_timeout, 10))
+            with self.lock:
+                idle = time.monotonic() - self.last_used
+            if idle > self.idle_timeout and not self.stopping:
+                print(f"Idle for {idle:.0f}s, stopping")
+                self.stop()
+
+    def serve(self):
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o600)
+            threading.Thread(target=self.watch_idle, daemon=True).start()
+            while not self.stopping:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(Fore.YELLOW + f"Rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self.session, args=(conn,), daemon=True).start()
+
+        for client, _ in self.repos.values():
+            client.close()
+
+
+def main():
+    init(autoreset=True)
+
+    parser = OptionParser()
+    parser.add_option(
+        "--idle-timeout",
+        type="int",
+        default=3600,
+        help="Exit after this many seconds without requests (default 3600)",
+    )
+    parser.add_option(
+        "--status", action="store_true", help="Show what a running daemon holds"
+    )
+    parser.add_option("--stop", action="store_true", help="Stop a running daemon")
+
+    (options, args) = parser.parse_args()
+
+    socket = socket_path()
+
+    if options.status or options.stop:
+        session = daemon()
+        if session is None:
+            print(f"No daemon listening on {socket}")
+            return
+        if options.stop:
+            session.request("stop")
+            print("Stopped")
+        else:
+            for key, value in session.request("status").items():
+                print(f"{key}: {value}")
+        return
+
+    if daemon() is not None:
+        print(Fore.RED + f"A daemon is already listening on {socket}")
+        exit(1)
+    if socket.exists():
+        socket.unlink()
+
+    # A fresh key each start; clients read it from a file only we can read.
+    authkey = secrets.token_bytes(32)
+    keyfile = key_path(socket)
+    keyfile.unlink(missing_ok=True)
+    fd = os.open(keyfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(fd, "wb") as outFile:
+        outFile.write(authkey)
+
+    print(f"Listening on {socket}")
+    try:
+        Daemon(
+            address=str(socket), authkey=authkey, idle_timeout=options.idle_timeout
+        ).serve()
+    finally:
+        keyfile.unlink()
+        if socket.exists():
+            socket.unlink()
+
+
+if __name__ == "__main__":
+    main()
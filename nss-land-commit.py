@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 
 import io, os
-import bugzilla
-import json
-import hglib
 from colorama import init, Fore
 from optparse import OptionParser
-from pathlib import Path
-from whaaaaat import prompt
 
-from utils.types import Patch, PackageVersion, Validator
+from utils.backouts import NodeIndex, find_backouts
+from utils.bugcache import add_cache_options, open_bug_cache
+from utils.bugs import BugFetcher
+from utils.config import add_bugzilla_options, connect_bugzilla
+from utils.fetch import add_fetch_options, background, open_executor
+from utils.hgsession import open_repo
+from utils.repo import node_revsets, stream_revisions
+from utils.report import add_batch_options
+from utils.trace import add_trace_options, open_tracer, traced
+from utils.types import Patch, PackageVersion, Validator, open_validator
+from utils.version import get_version, prefetch_versions
 
 
 def info(message):
@@ -20,145 +25,173 @@ def log(message):
     print(message)
 
 
-def get_version(hgclient, *, rev=None, validator) -> PackageVersion:
-    if Path("lib/nss/nss.h").exists():
-        contents = hgclient.cat([b"lib/nss/nss.h"], rev=rev).decode(encoding="UTF-8")
-        return PackageVersion.from_header(
-            component="NSS", header=contents, validator=validator
-        )
-    elif Path("pr/include/prinit.h").exists():
-        contents = hgclient.cat([b"pr/include/prinit.h"], rev=rev).decode(
-            encoding="UTF-8"
-        )
-        return PackageVersion.from_header(
-            component="NSPR", header=contents, validator=validator
-        )
-    raise Exception("No version files found")
-
-
 def bug_status_check(*, bugdata, patch, validator: Validator):
     if patch.type == "patch":
         if bugdata.status not in ["NEW", "ASSIGNED", "REOPENED"]:
             validator.warn(
-                f"Bug {bugdata.id} is in an odd state for a patch: {bugdata.status}"
+                f"Bug {bugdata.id} is in an odd state for a patch: {bugdata.status}",
+                rule="bug-status",
+                patch=patch.hash,
+                bug=bugdata.id,
             )
     elif patch.type == "backout":
         if bugdata.status not in ["RESOLVED"]:
             validator.warn(
-                f"Bug {bugdata.id} is in an odd state for a backout: {bugdata.status}"
+                f"Bug {bugdata.id} is in an odd state for a backout: {bugdata.status}",
+                rule="bug-status",
+                patch=patch.hash,
+                bug=bugdata.id,
             )
     else:
-        validator.fatal("Unknown patch type: " + patch.type)
-
-
-def resolve(*, hgclient, bzapi, patch: Patch, validator: Validator):
-    repo = hgclient.paths(name=b"default").decode(encoding="UTF-8").split("@")[1]
-
-    bugdata = bzapi.getbug(patch.bug)
+        validator.fatal(
+            "Unknown patch type: " + patch.type, rule="patch-type", patch=patch.hash
+        )
 
-    bug_status_check(bugdata=bugdata, patch=patch, validator=validator)
 
-    comment = f"https://{repo}rev/{patch.hash.decode(encoding='UTF-8')}\n"
-    if patch.type == "backout":
-        comment = f"Backed out for {patch.reason}\n{comment}"
-    elif hgclient.outgoing(revrange=patch.hash):
-        validator.fatal(f"Patch {patch} doesn't appear to have landed.")
+def group_by_bug(patches: list) -> dict:
+    byBug = {}
+    for patch in patches:
+        if patch.type == "tag" or patch.bug is None:
+            continue
+        byBug.setdefault(int(patch.bug), []).append(patch)
+    return byBug
 
-    version = get_version(hgclient, rev=patch.hash, validator=validator)
-    info(f"Commit {patch} is against {version.component} {version.number}")
 
-    info(f"Adding comment to bug {patch.bug} - {bugdata.summary} [{bugdata.status}]:")
+def resolve(*, hgclient, bzapi, fetcher, patches: list, validator: Validator):
+    repo = hgclient.paths(name=b"default").decode(encoding="UTF-8").split("@")[1]
 
-    if patch.type == "patch":
-        log(comment)
+    patches = sorted(
+        (patch for patch in patches if patch.type != "tag"),
+        key=lambda patch: int(patch.id),
+    )
 
-        update = None
-        if "leave-open" in bugdata.keywords:
-            answers = prompt(
-                [
-                    {
-                        "type": "confirm",
-                        "message": "Submit this comment and leave the bug open?",
-                        "name": "leaveopen",
-                    }
-                ]
+    byNode = {patch.hash.decode(encoding="UTF-8"): patch for patch in patches}
+    backouts = find_backouts(patches, NodeIndex(patches))
+    for backout, landed in backouts.targets.items():
+        log(
+            f"Skipping {byNode[landed]}, it was backed out in the same range by {byNode[backout]}"
+        )
+    patches = [
+        patch
+        for patch in patches
+        if not backouts.skipped(patch.hash.decode(encoding="UTF-8"))
+    ]
+
+    byBug = group_by_bug(patches)
+    fetching = background(fetcher.prefetch, byBug.keys())
+
+    landed = [
+        patch.hash.decode(encoding="UTF-8")
+        for patch in patches
+        if patch.type == "patch"
+    ]
+    if landed:
+        notLanded = hgclient.outgoing(revrange=" + ".join(landed))
+        if notLanded:
+            validator.fatal(
+                "Patches don't appear to have landed: "
+                + ", ".join(
+                    commit[1].decode(encoding="UTF-8")[:12] for commit in notLanded
+                ),
+                rule="not-landed",
             )
-            if answers["leaveopen"]:
-                update = bzapi.build_update(
-                    comment=comment, target_milestone=version.number
-                )
 
+    # Whatever landed last decides where the bug ends up.
+    for revset in node_revsets(
+        [bugPatches[-1].hash.decode(encoding="UTF-8") for bugPatches in byBug.values()]
+    ):
+        prefetch_versions(hgclient, revset)
+    versions = {
+        bug: get_version(hgclient, rev=bugPatches[-1].hash, validator=validator)
+        for bug, bugPatches in byBug.items()
+    }
+    fetching.result()
+
+    updates = {}
+    for bug, bugPatches in byBug.items():
+        bugdata = fetcher.get(bug)
+
+        bug_status_check(bugdata=bugdata, patch=bugPatches[0], validator=validator)
+
+        comment = ""
+        for patch in bugPatches:
+            url = f"https://{repo}rev/{patch.hash.decode(encoding='UTF-8')}\n"
+            if patch.type == "backout":
+                comment += f"Backed out for {patch.reason}\n{url}"
+            else:
+                comment += url
+
+        last = bugPatches[-1]
+        version = versions[bug]
+        info(f"Commit {last} is against {version.component} {version.number}")
+
+        if last.type == "backout":
+            action = "reopen"
+            changes = {
+                "status": "REOPENED",
+                "resolution": "---",
+                "target_milestone": "---",
+            }
+        elif "leave-open" in bugdata.keywords:
+            action = "leave open"
+            changes = {"target_milestone": version.number}
         else:
-            answers = prompt(
-                [
-                    {
-                        "type": "confirm",
-                        "message": "Submit this comment and resolve the bug?",
-                        "name": "resolve",
-                    }
-                ]
-            )
-            if answers["resolve"]:
-                update = bzapi.build_update(
-                    comment=comment,
-                    status="RESOLVED",
-                    resolution="FIXED",
-                    target_milestone=version.number,
-                )
-        # breakpoint()
-        if update is not None:
-            bzapi.update_bugs([patch.bug], update)
-            info(f"Updated {bugdata.weburl}")
-
-    elif patch.type == "backout":
+            action = "resolve"
+            changes = {
+                "status": "RESOLVED",
+                "resolution": "FIXED",
+                "target_milestone": version.number,
+            }
+
+        info(f"Bug {bug} - {bugdata.summary} [{bugdata.status}] ({action}):")
         log(comment)
-        answers = prompt(
-            [
-                {
-                    "type": "confirm",
-                    "message": "Submit this comment and reopen the bug?",
-                    "name": "resolve",
-                }
-            ]
-        )
-        if answers["resolve"]:
-            update = bzapi.build_update(
-                comment=comment,
-                status="REOPENED",
-                resolution="---",
-                target_milestone="---",
-            )
-            # breakpoint()
-            bzapi.update_bugs([patch.bug], update)
-            info(f"Reopened {bugdata.weburl}")
 
-    else:
-        validator.fatal(f"Unknown patch type: {patch.type}")
+        key = (comment, tuple(sorted(changes.items())))
+        updates.setdefault(key, []).append(bugdata)
+
+    if not updates:
+        log("Nothing to update")
+        return
+
+    if not validator.confirm(f"Submit these comments to {len(byBug)} bug(s)?"):
+        return
+
+    # Bugs only share an update call when the update is identical. The calls
+    # don't depend on each other, so they all go out at once.
+    def submit(item):
+        (comment, changes), bugs = item
+        update = bzapi.build_update(comment=comment, **dict(changes))
+        bzapi.update_bugs([bugdata.id for bugdata in bugs], update)
+
+    items = list(updates.items())
+    failed = None
+    for (_, bugs), (_, error) in zip(items, fetcher.run("update", submit, items)):
+        fetcher.invalidate([bugdata.id for bugdata in bugs])
+        if error is not None:
+            failed = failed or error
+            continue
+        for bugdata in bugs:
+            info(f"Updated {bugdata.weburl}")
+    if failed is not None:
+        raise failed
 
 
 def process_patches(
-    *, hgclient, bzapi, revrange: str, patches: list, validator: Validator
+    *, hgclient, bzapi, fetcher, revrange: str, patches: list, validator: Validator
 ):
-    bug = None
+    byBug = group_by_bug(patches)
+    fetching = background(fetcher.prefetch, byBug.keys())
 
     version = get_version(hgclient, rev=revrange, validator=validator)
     info(f"Patchset {revrange} is against {version.component} {version.number}")
+    fetching.result()
 
-    if len(patches) != 1:
-        raise Exception("One at a time right now")
-
-    for patch in patches:
-        if patch.type == "tag":
-            continue
-
-        if bug is None:
-            bug = patch.bug
-        elif bug != patch.bug:
-            validator.fatal(f"Multiple bugs in one revrange: {bug}, {patch.bug}")
-
-        bugdata = bzapi.getbug(patch.bug)
+    for bug, bugPatches in byBug.items():
+        bugdata = fetcher.get(bug)
 
         info(bugdata.__str__())
+        for patch in bugPatches:
+            log(f"  {patch}")
         log(f"Component: {bugdata.component}")
         log(bugdata.weburl)
         log(bugdata.status)
@@ -171,41 +204,38 @@ def process_patches(
             and bugdata.product != version.component
         ):
             validator.fatal(
-                f"Bug component mismatch. Bug is for {bugdata.product}::{bugdata.component}, but we're in {version.component}"
+                f"Bug component mismatch. Bug is for {bugdata.product}::{bugdata.component}, but we're in {version.component}",
+                rule="component-mismatch",
+                bug=bug,
             )
 
         if bugdata.target_milestone != version.number:
             validator.warn(
-                f"Bug target milestone ({bugdata.target_milestone}) is not set to {version.number}"
+                f"Bug target milestone ({bugdata.target_milestone}) is not set to {version.number}",
+                rule="target-milestone",
+                bug=bug,
             )
 
-        bug_status_check(bugdata=bugdata, patch=patch, validator=validator)
+        bug_status_check(bugdata=bugdata, patch=bugPatches[0], validator=validator)
 
-        answers = prompt(
-            [
-                {
-                    "type": "confirm",
-                    "message": "Ready to Push patch (will be manual)?",
-                    "name": "push",
-                }
-            ]
-        )
-        if answers["push"]:
-            log("Now run:")
-            info(f"  hg push -r {revrange}")
-
-            if prompt(
-                [
-                    {
-                        "type": "confirm",
-                        "message": "Was your push successful?",
-                        "name": "push",
-                    }
-                ]
-            )["push"]:
-                resolve(
-                    hgclient=hgclient, bzapi=bzapi, patch=patch, validator=validator
-                )
+    # Pushing is manual, so in batch mode this only validates.
+    if not validator.interactive:
+        return
+
+    if validator.confirm(
+        f"Ready to Push {len(patches)} patch(es) for {len(byBug)} bug(s) (will be manual)?"
+    ):
+        log("Now run:")
+        info(f"  hg push -r {revrange}")
+
+        if validator.confirm("Was your push successful?"):
+            resolve(
+                hgclient=hgclient,
+                bzapi=bzapi,
+                fetcher=fetcher,
+                patches=patches,
+                validator=validator,
+            )
 
 
 def main():
@@ -216,65 +246,78 @@ def main():
     parser.add_option("-l", "--landed", help="as-landed hg revision, used with -b")
     parser.add_option("-e", "--revrange", default=".", help="hg revision range")
     parser.add_option("-r", "--resolve", help="resolve bugs for a given revision range")
+    add_bugzilla_options(parser)
+    add_cache_options(parser)
+    add_fetch_options(parser)
+    add_batch_options(parser)
+    add_trace_options(parser)
 
     (options, args) = parser.parse_args()
 
-    hgclient = hglib.open(".")
+    import hglib
 
-    config = {}
-    confFile = Path.home() / ".nss-land-commit.json"
-    if confFile.exists():
-        with open(confFile, "r") as conf:
-            config = json.load(conf)
+    open_tracer(options)
+    hgclient = traced(open_repo("."), "hg")
 
-    if "api_key" not in config:
-        print(
-            Fore.YELLOW
-            + "Note: Not logging into Bugzilla. BZ actions won't work. Make a file at ~/.nss-land-commit.json"
-        )
-        print(Fore.YELLOW + "with contents like:")
-        log(json.dumps({"api_key": "random_api_key_1e87d00d1c2fb"}))
-        bzapi = bugzilla.Bugzilla("bugzilla.mozilla.org")
-    else:
-        bzapi = bugzilla.Bugzilla("bugzilla.mozilla.org", api_key=config["api_key"])
+    bzapi = traced(connect_bugzilla(options), "bugzilla")
 
-    validator = Validator()
+    validator = open_validator(options, tool="nss-land-commit")
+    cache = open_bug_cache(options, server=bzapi.url)
+    executor = open_executor(options)
+    fetcher = BugFetcher(bzapi, cache=cache, executor=executor)
 
     info(f"Interacting with Bugzilla at {bzapi.url}. Logged in = {bzapi.logged_in}")
 
     try:
         if options.bug and options.landed:
-            commits = hgclient.log(revrange=options.landed)
+            commits = list(stream_revisions(hgclient.root(), revrange=options.landed))
             if len(commits) != 1:
-                validator.fatal(f"Couldn't find revision {options.landed}")
+                validator.fatal(
+                    f"Couldn't find revision {options.landed}", rule="usage"
+                )
 
             patch = Patch(commit=commits[0], validator=validator)
             patch.validate(validator=validator)
-            resolve(hgclient=hgclient, bzapi=bzapi, patch=patch, validator=validator)
+            resolve(
+                hgclient=hgclient,
+                bzapi=bzapi,
+                fetcher=fetcher,
+                patches=[patch],
+                validator=validator,
+            )
 
         elif options.bug or options.landed:
-            validator.fatal("You have to specify --bug and --landed together")
+            validator.fatal(
+                "You have to specify --bug and --landed together", rule="usage"
+            )
 
         elif options.resolve:
-            commits = hgclient.log(revrange=options.resolve)
+            commits = list(stream_revisions(hgclient.root(), revrange=options.resolve))
             if not commits:
-                validator.fatal("No changes found")
-
-            if len(commits) != 1:
-                raise Exception("Only one at a time now")
+                validator.fatal("No changes found", rule="no-changes")
 
+            patches = []
             for commit in commits:
                 patch = Patch(commit=commit, validator=validator)
                 patch.validate(validator=validator)
-                if patch.type == "patch":
-                    resolve(
-                        hgclient=hgclient, bzapi=bzapi, patch=patch, validator=validator
-                    )
+                patches.append(patch)
+
+            resolve(
+                hgclient=hgclient,
+                bzapi=bzapi,
+                fetcher=fetcher,
+                patches=patches,
+                validator=validator,
+            )
 
         else:
-            commits = hgclient.outgoing(revrange=options.revrange)
+            commits = list(
+                stream_revisions(
+                    hgclient.root(), revrange=options.revrange, command="outgoing"
+                )
+            )
             if not commits:
-                validator.fatal("No changes found")
+                validator.fatal("No changes found", rule="no-changes")
 
             patches = []
             for commit in commits:
@@ -285,13 +328,23 @@ def main():
             process_patches(
                 hgclient=hgclient,
                 bzapi=bzapi,
+                fetcher=fetcher,
                 revrange=options.revrange,
                 patches=patches,
                 validator=validator,
             )
 
     except hglib.error.CommandError as ce:
-        validator.fatal(f"Mercurial error {ce.err.decode(encoding='UTF-8')}")
+        validator.fatal(
+            f"Mercurial error {ce.err.decode(encoding='UTF-8')}", rule="hg-error"
+        )
+
+    finally:
+        log(executor.summary())
+        executor.close()
+        if cache is not None:
+            cache.close()
+        validator.finish()
 
 
 if __name__ == "__main__":
@@ -1,44 +1,90 @@
 #!/usr/bin/env python3
 
-import bugzilla
-import hglib
-import io, os, json
-import pyperclip
+import io
 from colorama import init, Fore
 from optparse import OptionParser
-from pathlib import Path
 
-from utils.types import Patch, PackageVersion, Validator, NullValidator
-
-# todo: dedupe with nss-land-commit
-def get_version(hgclient, *, rev=None, validator) -> PackageVersion:
-    if Path("lib/nss/nss.h").exists():
-        contents = hgclient.cat([b"lib/nss/nss.h"], rev=rev).decode(encoding="UTF-8")
-        return PackageVersion.from_header(
-            component="NSS", header=contents, validator=validator
-        )
-    elif Path("pr/include/prinit.h").exists():
-        contents = hgclient.cat([b"pr/include/prinit.h"], rev=rev).decode(
-            encoding="UTF-8"
+from utils.backouts import NodeIndex, find_backouts, resolve_outside
+from utils.bugcache import add_cache_options, open_bug_cache
+from utils.bugs import BugFetcher, RELEASE_REVIEW_FIELDS
+from utils.config import add_bugzilla_options, connect_bugzilla
+from utils.contributors import AuthorIndex, ContributorsList
+from utils.fetch import add_fetch_options, background, open_executor
+from utils.hgsession import open_repo
+from utils.repo import stream_log, stream_revisions
+from utils.report import add_batch_options
+from utils.reviewstate import ReviewState
+from utils.trace import add_trace_options, open_tracer, traced
+from utils.snapshot import SnapshotBugs, write_snapshot
+from utils.types import Patch, PackageVersion, Validator, NullValidator, open_validator
+from utils.version import get_version, prefetch_versions
+
+
+# Findings that keep a bug out of the release notes.
+SKIP_RULES = ["wrong-product", "bug-not-resolved"]
+
+
+def review(*, patch, bugdata, version: str) -> list:
+    if bugdata.product != "NSS":
+        return [
+            [
+                "wrong-product",
+                f"Bug {patch.bug} is not for NSS ({bugdata.product}). Odd. Skipping.",
+            ]
+        ]
+
+    findings = []
+    if bugdata.target_milestone != version:
+        findings.append(
+            [
+                "target-milestone",
+                f"Version mismatch! target_milestone set to {bugdata.target_milestone} but hg says {version}",
+            ]
         )
-        return PackageVersion.from_header(
-            component="NSPR", header=contents, validator=validator
+    if bugdata.status not in ["RESOLVED", "VERIFIED"]:
+        findings.append(
+            [
+                "bug-not-resolved",
+                f"Status is not resolved! bug set to {bugdata.status}. Skipping.",
+            ]
         )
-    raise Exception("No version files found")
-
-
-class ContributorsList:
-    def __init__(self):
-        self.authors = {}
+    return findings
+
+
+# Each release is (name, revrange). A plain -r is the one release, unnamed.
+def parse_releases(parser, options) -> list:
+    if not options.release:
+        return [(None, options.revrange)]
+    releases = []
+    for spec in options.release:
+        name, sep, revrange = spec.partition("=")
+        if not sep or not name or not revrange:
+            parser.error(f"--release takes NAME=REVRANGE, not {spec}")
+        releases.append((name, revrange))
+    return releases
+
+
+def release_notes_html(bugs: dict):
+    import pyperclip
+
+    with io.StringIO() as buf:
+        print("<ul>", file=buf)
+        for bugid, bugdata in bugs.items():
+            sec = "🔐 " if bugdata.groups else ""
+            print(
+                f'  <li><a href="{bugdata.weburl}">{sec}Bug {bugid}</a> - {bugdata.summary}</li>',
+                file=buf,
+            )
+        print("</ul>", file=buf)
 
-    def observe(self, author, previousRelease=False):
-        if not author in self.authors or previousRelease:
-            self.authors[author] = previousRelease
+        print("\n\n")
+        print(buf.getvalue())
 
-    def list(self, *, limitToNewContributors=True):
-        if limitToNewContributors:
-            return filter(lambda x: self.authors[x] is False, self.authors)
-        return self.authors
+        try:
+            pyperclip.copy(buf.getvalue())
+            print("(Copied to clipboard)")
+        except pyperclip.PyperclipException:
+            print("(No clipboard available)")
 
 
 def main():
@@ -51,113 +97,299 @@ def main():
         default="reverse(ancestors(.))",
         help="hg revision range like `reverse(startHash::endHash)`",
     )
+    parser.add_option(
+        "--release",
+        action="append",
+        metavar="NAME=REVRANGE",
+        help="Review several releases (e.g. default and ESR) in one pass; repeatable",
+    )
     parser.add_option(
         "--html",
         action="store_true",
         help="Provide HTML suitable for the release notes",
     )
+    add_bugzilla_options(parser)
+    parser.add_option(
+        "--export-snapshot",
+        metavar="FILE",
+        help="Save the fetched bug data to FILE for later offline runs",
+    )
+    parser.add_option(
+        "--snapshot",
+        metavar="FILE",
+        help="Read bug data from a file made with --export-snapshot instead of Bugzilla",
+    )
+    parser.add_option(
+        "--incremental",
+        action="store_true",
+        help="Reuse what the last --incremental run found for this repository",
+    )
+    add_cache_options(parser)
+    add_fetch_options(parser)
+    add_batch_options(parser)
+    add_trace_options(parser)
 
     (options, args) = parser.parse_args()
 
-    if "reverse" not in options.revrange:
-        print(
-            Fore.YELLOW
-            + "Warning: You almost certainly want a `reverse` command in your revrange!"
-        )
+    if options.incremental and (options.snapshot or options.export_snapshot):
+        parser.error("--incremental doesn't work with snapshots")
+    if options.snapshot and options.export_snapshot:
+        parser.error("--export-snapshot needs bugs from Bugzilla, not --snapshot")
+
+    releases = parse_releases(parser, options)
+    for _, revrange in releases:
+        if "reverse" not in revrange:
+            print(
+                Fore.YELLOW
+                + "Warning: You almost certainly want a `reverse` command in your revrange!"
+            )
+    # Releases share most of their history, so the union is read once.
+    if len(releases) == 1:
+        revrange = releases[0][1]
+    else:
+        revrange = " + ".join(f"({release})" for _, release in releases)
 
-    hgclient = hglib.open(".")
+    open_tracer(options)
+    hgclient = traced(open_repo("."), "hg")
 
-    config = {}
-    confFile = Path.home() / ".nss-land-commit.json"
-    if confFile.exists():
-        with open(confFile, "r") as conf:
-            config = json.load(conf)
+    validator = open_validator(options, tool="nss-release-review", ask=False)
 
-    if "api_key" not in config:
+    if options.snapshot:
+        bzapi = cache = executor = None
+        fetcher = SnapshotBugs(options.snapshot)
+        print(f"Reading bugs from {options.snapshot} (from {fetcher.url})")
+        if fetcher.revrange != revrange:
+            print(
+                Fore.YELLOW
+                + f"Warning: the snapshot was taken for `{fetcher.revrange}`, not `{revrange}`"
+            )
+    else:
+        bzapi = traced(connect_bugzilla(options), "bugzilla")
         print(
-            Fore.YELLOW
-            + "Note: Not logging into Bugzilla. BZ actions won't work. Make a file at ~/.nss-land-commit.json"
+            f"Interacting with Bugzilla at {bzapi.url}. Logged in = {bzapi.logged_in}"
+        )
+        cache = open_bug_cache(options, server=bzapi.url)
+        executor = open_executor(options)
+        fields = RELEASE_REVIEW_FIELDS
+        if options.incremental:
+            fields = fields + ["last_change_time"]
+        fetcher = BugFetcher(
+            bzapi, include_fields=fields, cache=cache, executor=executor
         )
-        print(Fore.YELLOW + "with contents like:")
-        log(json.dumps({"api_key": "random_api_key_1e87d00d1c2fb"}))
-        bzapi = bugzilla.Bugzilla("bugzilla.mozilla.org")
-    else:
-        bzapi = bugzilla.Bugzilla("bugzilla.mozilla.org", api_key=config["api_key"])
-
-    validator = Validator(ask=False)
-
-    print(f"Interacting with Bugzilla at {bzapi.url}. Logged in = {bzapi.logged_in}")
-
-    bugs = {}
-    contribList = ContributorsList()
-    contribListLastHash = None
-
-    for commit in hgclient.log(revrange=options.revrange):
-        patch = Patch(commit=commit, validator=validator)
-        print(f"{patch.hash.decode('utf-8')} - {patch}")
-
-        contribListLastHash = patch.hash
-
-        version = get_version(hgclient, rev=patch.hash, validator=validator)
-
-        if patch.type == "tag" or patch.bug is None:
-            continue
-
-        contribList.observe(patch.author.decode("utf-8"), previousRelease=False)
-
-        bugdata = bzapi.getbug(patch.bug)
 
-        if bugdata.product == "NSS":
-            if bugdata.target_milestone != version.number:
+    try:
+        # Parse everything first so the bugs can be fetched in bulk.
+        root = hgclient.root()
+        patches = {}
+        for commit in stream_revisions(root, revrange=revrange):
+            patch = Patch(commit=commit, validator=validator)
+            patches[patch.hash.decode("utf-8")] = patch
+
+        # Which changesets each release has, in its revrange's order.
+        if len(releases) == 1:
+            members = {releases[0][0]: list(patches)}
+        else:
+            members = {
+                name: [
+                    line.decode("utf-8")
+                    for line in stream_log(root, revrange=release, template="{node}\n")
+                ]
+                for name, release in releases
+            }
+
+        # What was landed and backed out within a release isn't in it. Backouts
+        # of older changesets are looked up together.
+        index = NodeIndex(patches.values())
+        backouts = {
+            name: find_backouts([patches[node] for node in nodes], index)
+            for name, nodes in members.items()
+        }
+        resolve_outside(hgclient, backouts.values(), validator=validator)
+        shipped = {
+            node
+            for name, nodes in members.items()
+            for node in nodes
+            if not backouts[name].skipped(node)
+        }
+
+        bugIds = {
+            int(patches[node].bug)
+            for node in shipped
+            if patches[node].type != "tag" and patches[node].bug is not None
+        }
+        state = ReviewState(hgclient) if options.incremental else None
+
+        def fetch_bugs():
+            unchanged = state.unchanged(fetcher, bugIds) if state is not None else {}
+            fetcher.prefetch(bugIds - unchanged.keys())
+            return unchanged
+
+        # Bugzilla answers while hg works out which version each changeset is in.
+        fetching = background(fetch_bugs)
+        prefetch_versions(hgclient, revrange)
+        versions = {}
+        for node in shipped:
+            patch = patches[node]
+            if state is not None and node in state.patches:
+                versions[node] = state.patches[node]["version"]
+            else:
+                versions[node] = get_version(
+                    hgclient, rev=patch.hash, validator=validator
+                ).number
+        unchanged = fetching.result()
+
+        if state is not None:
+            fresh = sum(node not in state.patches for node in shipped)
+            print(
+                f"{fresh} new changesets; {len(unchanged)} of {len(bugIds)} bugs unchanged since the last run"
+            )
+        if options.export_snapshot:
+            write_snapshot(
+                options.export_snapshot,
+                fetcher=fetcher,
+                revrange=revrange,
+                bugzilla_url=bzapi.url,
+            )
+            print(f"Wrote {len(fetcher.bugs)} bugs to {options.export_snapshot}")
+
+        # A changeset in several releases is reviewed, and its findings reported,
+        # the first time one lists it. (bugdata, findings), or None for tags.
+        reviewed = {}
+
+        def review_patch(node, patch):
+            validator.reviewed(patch.hash)
+            stored = state.patches.get(node) if state is not None else None
+            version = versions[node]
+
+            if patch.type == "tag" or patch.bug is None:
+                if state is not None:
+                    state.remember_patch(node, version=version)
+                return None
+
+            bug = int(patch.bug)
+            if stored is not None and stored["bug"] == bug and bug in unchanged:
+                bugdata = unchanged[bug]
+                findings = stored["findings"]
+            else:
+                bugdata = unchanged[bug] if bug in unchanged else fetcher.get(bug)
+                findings = review(patch=patch, bugdata=bugdata, version=version)
+
+            for rule, message in findings:
+                validator.warn(message, rule=rule, patch=patch.hash, bug=patch.bug)
+            if state is not None:
+                state.remember_patch(node, version=version, bug=bug, findings=findings)
+                state.remember_bug(bugdata)
+            return bugdata, findings
+
+        def warn_outside(backout, target):
+            if target is None:
                 validator.warn(
-                    f"Version mismatch! target_milestone set to {bugdata.target_milestone} but hg says {version.number}"
+                    f"Backs out {backout.changeset}, which isn't in this repository",
+                    rule="backout-unknown",
+                    patch=backout.hash,
+                    bug=backout.bug,
                 )
-
-        else:
+                return
+            version = get_version(hgclient, rev=target.hash, validator=validator)
             validator.warn(
-                f"Bug {patch.bug} is not for NSS ({bugdata.product}). Odd. Skipping."
+                f"Backs out {target.hash.decode('utf-8')[:12]} ({target}), which shipped in {version.number}",
+                rule="backout-earlier-release",
+                patch=backout.hash,
+                bug=backout.bug,
             )
-            continue
 
-        if bugdata.status not in ["RESOLVED", "VERIFIED"]:
-            validator.warn(
-                f"Status is not resolved! bug set to {bugdata.status}. Skipping."
+        bugs = {}
+        for name, nodes in members.items():
+            if name is not None:
+                print(Fore.CYAN + f"== {name} ({len(nodes)} changesets) ==")
+            bugs[name] = {}
+            result = backouts[name]
+            for node in nodes:
+                patch = patches[node]
+                print(f"{node} - {patch}")
+
+                if node in result.targets:
+                    print(f"  (backs out {result.targets[node][:12]}; both left out)")
+                    continue
+                if node in result.reverted:
+                    print("  (backed out later in the range; left out)")
+                    continue
+                if node in result.outside and node not in reviewed:
+                    warn_outside(*result.outside[node])
+
+                if node in reviewed:
+                    if reviewed[node] is not None and reviewed[node][1]:
+                        print("  (findings reported above)")
+                else:
+                    reviewed[node] = review_patch(node, patch)
+                if reviewed[node] is None:
+                    continue
+
+                bugdata, findings = reviewed[node]
+                if not any(rule in SKIP_RULES for rule, _ in findings):
+                    bugs[name][bugdata.id] = bugdata
+
+        if state is not None:
+            state.save(shipped)
+    finally:
+        if executor is not None:
+            print(
+                f"Fetched {len(fetcher.bugs)} bugs in {fetcher.round_trips} round trips"
             )
+            print(executor.summary())
+            executor.close()
+        if cache is not None:
+            cache.close()
+
+    # One index for all the releases; each one after the first only has to
+    # scan what its ancestry adds.
+    authorIndex = None
+    ranges = dict(releases)
+    for name, nodes in members.items():
+        if name is not None:
+            print(Fore.CYAN + f"== {name} ==")
+        if not bugs[name]:
+            print("No patches found")
             continue
 
-        bugs[bugdata.id] = bugdata
-
-    if not bugs:
-        print("No patches found")
-        return
-
-    if options.html:
-        with io.StringIO() as buf:
-            print("<ul>", file=buf)
-            for bugid, bugdata in bugs.items():
-                sec = "🔐 " if bugdata.groups else ""
-                print(
-                    f'  <li><a href="{bugdata.weburl}">{sec}Bug {bugid}</a> - {bugdata.summary}</li>',
-                    file=buf,
-                )
-            print("</ul>", file=buf)
-
-            print("\n\n")
-            print(buf.getvalue())
-
-            pyperclip.copy(buf.getvalue())
-            print("(Copied to clipboard)")
-
-    # Derive the new contributors list
-    contributorsRevRange = f"reverse(ancestors({contribListLastHash.decode('utf-8')}^))"
-    print(f"Gathering new contributors list ({contributorsRevRange})...")
-    for commit in hgclient.log(revrange=contributorsRevRange):
-        patch = Patch(commit=commit, validator=NullValidator())
-        contribList.observe(patch.author.decode("utf-8"), previousRelease=True)
-
-    print("(Apparently) new contributors:")
-    for author in sorted(contribList.list(limitToNewContributors=True)):
-        print(f"{author}")
+        if options.html:
+            release_notes_html(bugs[name])
+
+        contribList = ContributorsList()
+        for node in nodes:
+            if reviewed.get(node) is not None:
+                author = patches[node].author.decode("utf-8")
+                contribList.observe(author, previousRelease=False)
+
+        # Derive the new contributors list from what the release's roots
+        # were built on, whichever order its revrange lists them in. hg works
+        # the set out from the revrange; a list of its nodes could be too
+        # long for one argument.
+        contributorsBase = f"parents(roots({ranges[name]}))"
+        roots = [
+            line.decode("utf-8")
+            for line in stream_log(
+                root, revrange=f"roots({ranges[name]})", template="{node}\n"
+            )
+        ]
+        print(
+            "Gathering new contributors list (ancestors of "
+            + ", ".join(f"{node[:12]}^" for node in roots)
+            + ")..."
+        )
+        if authorIndex is None:
+            authorIndex = AuthorIndex(hgclient)
+        scanned = authorIndex.update(contributorsBase)
+        print(f"Indexed {scanned} new changesets")
+        contribList.observe_index(authorIndex, rev=contributorsBase)
+
+        print("(Apparently) new contributors:")
+        for author in sorted(contribList.list(limitToNewContributors=True)):
+            print(f"{author}")
+
+    if authorIndex is not None:
+        authorIndex.save()
+    validator.finish()
 
 
 if __name__ == "__main__":
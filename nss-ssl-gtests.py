@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Runs ssl_gtest (or another NSS gtest binary) split over every core and
+# merges the results. Shards are balanced on how long each test took in
+# earlier runs, and -f skips the tests those runs found slow. Tests that
+# passed with the same build and settings aren't run again. For running
+# under a debugger, rr or valgrind, use nss-ssl-gtests.sh.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from colorama import init, Fore
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+from pathlib import Path
+
+from utils.gtests import (
+    DEFAULT_RESULTS_FILE,
+    DEFAULT_SLOW_SECONDS,
+    DEFAULT_SLOW_TESTS,
+    DEFAULT_TIMINGS_FILE,
+    ResultCache,
+    Shard,
+    Timings,
+    add_cached,
+    balance,
+    list_tests,
+    makespan,
+    merge_results,
+    test_cases,
+)
+
+
+def find_nss_dir() -> Path:
+    nssDir = os.environ.get("NSS_DIR")
+    for probe in [["hg", "root"], ["git", "rev-parse", "--show-toplevel"]]:
+        if nssDir:
+            break
+        try:
+            nssDir = (
+                subprocess.run(probe, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                .stdout.decode()
+                .strip()
+            )
+        except FileNotFoundError:
+            pass
+    if not nssDir or not Path(nssDir).is_dir():
+        print("Can't find NSS directory.  Set $NSS_DIR.", file=sys.stderr)
+        sys.exit(2)
+    return Path(nssDir)
+
+
+def newest_db(root: Path):
+    dbs = [
+        path for path in (root / "tests_results").rglob("ssl_gtests") if path.is_dir()
+    ]
+    return max(dbs, key=lambda path: path.stat().st_mtime, default=None)
+
+
+def main():
+    init(autoreset=True)
+
+    # gtest's own flags go straight through.
+    gtestArgs = [arg for arg in sys.argv[1:] if arg.startswith("--gtest_")]
+    argv = [arg for arg in sys.argv[1:] if not arg.startswith("--gtest_")]
+
+    parser = OptionParser(
+        usage="%prog [options] [--] [filter|-filter ...] [--gtest_* ...]\n\n"
+        "Tests matching '*filter*' are included, '*-filter*' excluded."
+    )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        default=os.cpu_count() or 1,
+        help="Shards to run at once (default: one per core)",
+    )
+    parser.add_option(
+        "-f",
+        "--fast",
+        action="store_true",
+        help="Skip the tests earlier runs found slow",
+    )
+    parser.add_option(
+        "--slow",
+        type="float",
+        default=DEFAULT_SLOW_SECONDS,
+        metavar="SECONDS",
+        help=f"What counts as slow for -f (default {DEFAULT_SLOW_SECONDS:g})",
+    )
+    parser.add_option(
+        "-l",
+        "--list",
+        action="store_true",
+        help="List the tests with their recorded times",
+    )
+    parser.add_option("-s", "--shuffle", action="store_true", help="Shuffle test order")
+    parser.add_option("-t", "--ssltrace", metavar="N", help="Set SSLTRACE=N")
+    parser.add_option("-o", "--output", metavar="FILE", help="Write merged XML results")
+    parser.add_option(
+        "--binary", help="gtest binary to run (default: ssl_gtest in the latest dist)"
+    )
+    parser.add_option(
+        "--timings",
+        default=str(DEFAULT_TIMINGS_FILE),
+        help=f"Where test times are kept (default {DEFAULT_TIMINGS_FILE})",
+    )
+    parser.add_option(
+        "--no-record",
+        action="store_true",
+        help="Don't update the recorded times from this run",
+    )
+    parser.add_option(
+        "--no-cache",
+        action="store_true",
+        help="Run every test, even those that passed with the same build and settings",
+    )
+    parser.add_option(
+        "--results",
+        default=str(DEFAULT_RESULTS_FILE),
+        help=f"Where passing tests are remembered (default {DEFAULT_RESULTS_FILE})",
+    )
+    parser.add_option("-v", "--verbose", action="store_true")
+
+    (options, args) = parser.parse_args(argv)
+
+    env = dict(os.environ, NSS_STRICT_SHUTDOWN="1")
+    if options.ssltrace:
+        env["SSLTRACE"] = options.ssltrace
+    command = [options.binary] if options.binary else None
+    libDir = Path(options.binary).resolve().parent.parent / "lib" if command else None
+    if command is None:
+        root = find_nss_dir().resolve().parent
+        dist = root / "dist" / (root / "dist" / "latest").read_text().strip()
+        variable = (
+            "DYLD_LIBRARY_PATH" if sys.platform == "darwin" else "LD_LIBRARY_PATH"
+        )
+        env[variable] = f"{dist / 'lib'}:{env.get(variable, '')}"
+        command = [str(dist / "bin" / "ssl_gtest")]
+        libDir = dist / "lib"
+        db = newest_db(root)
+        if db is not None:
+            command += ["-d", str(db)]
+    if options.shuffle:
+        gtestArgs.append("--gtest_shuffle")
+    command += gtestArgs
+
+    timings = Timings(options.timings, binary=Path(command[0]).name)
+
+    included = [f"*{arg}*" for arg in args if not arg.startswith("-")] or ["*"]
+    excluded = [f"*{arg[1:]}*" for arg in args if arg.startswith("-")]
+    if options.fast:
+        excluded += timings.slow(options.slow) if len(timings) else DEFAULT_SLOW_TESTS
+    gtestFilter = ":".join(included) + (f":-{':'.join(excluded)}" if excluded else "")
+
+    tests = list_tests(command, env=env, gtest_filter=gtestFilter)
+    if options.list:
+        for test in tests:
+            recorded = (
+                f"{timings.estimate(test):8.3f}s" if test in timings else "       -"
+            )
+            print(f"{recorded}  {test}")
+        return
+    if not tests:
+        print("No tests match")
+        return
+
+    # Only what failed, is new, or ran with other inputs last time runs.
+    results = ResultCache(options.results)
+    inputs = results.inputs(command, env=env, lib_dir=libDir)
+    cached = [] if options.no_cache else sorted(results.passed(inputs) & set(tests))
+    if options.verbose:
+        print(f"Inputs {inputs[:16]}")
+    if not options.no_cache:
+        print(f"Result cache: {len(cached)} hits, {len(tests) - len(cached)} misses")
+    replayed = set(cached)
+    tests = [test for test in tests if test not in replayed]
+    if not tests:
+        print(f"All {len(cached)} tests passed before with these inputs")
+        if options.output:
+            merged = merge_results([], elapsed=0.0)
+            add_cached(merged, cached)
+            ET.ElementTree(merged).write(
+                options.output, encoding="UTF-8", xml_declaration=True
+            )
+        results.save()
+        return
+
+    jobs = max(1, min(options.jobs, len(tests)))
+    workdir = Path(tempfile.mkdtemp(prefix="nss-ssl-gtests-"))
+    if len(timings):
+        assigned = balance(tests, timings, jobs)
+        print(
+            f"Running {len(tests)} tests in {len(assigned)} shards, "
+            f"the longest should take {makespan(assigned, timings):.1f}s"
+        )
+        shards = [
+            Shard(index=index, total=len(assigned), tests=shardTests, workdir=workdir)
+            for index, shardTests in enumerate(assigned)
+        ]
+    else:
+        print(f"Running {len(tests)} tests in {jobs} shards (no recorded times yet)")
+        shards = [
+            Shard(index=index, total=jobs, tests=None, workdir=workdir)
+            for index in range(jobs)
+        ]
+    if options.verbose:
+        print("Run: " + " ".join(shards[0].command(command, gtestFilter)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [
+            pool.submit(shard.run, command, env=env, gtest_filter=gtestFilter)
+            for shard in shards
+        ]
+        for future in futures:
+            shard = future.result()
+            if options.verbose:
+                print(f"Shard {shard.index} exited {shard.returncode}")
+    elapsed = time.perf_counter() - start
+
+    crashed = [shard for shard in shards if not shard.xml.exists()]
+    merged = merge_results(
+        [shard.xml for shard in shards if shard.xml.exists()], elapsed=elapsed
+    )
+    ran = merged.get("tests")
+    add_cached(merged, cached)
+    if options.output:
+        ET.ElementTree(merged).write(
+            options.output, encoding="UTF-8", xml_declaration=True
+        )
+
+    failed = []
+    passed = []
+    for test, case in test_cases(merged):
+        if case.get("result") == "cached":
+            continue
+        if case.find("failure") is not None:
+            failed.append(test)
+        elif case.get("status", "run") == "run":
+            passed.append(test)
+            if not options.no_record:
+                timings.record(test, float(case.get("time", 0)))
+    if not options.no_record:
+        timings.save()
+    results.record(inputs, passed=passed, failed=failed)
+    results.save()
+
+    print(
+        f"{ran} tests in {elapsed:.1f}s, "
+        f"{len(failed)} failed, {merged.get('disabled')} disabled"
+        + (f", {len(cached)} passed before" if cached else "")
+    )
+    for test in failed:
+        print(Fore.RED + f"FAILED {test}")
+    for shard in crashed:
+        print(Fore.RED + f"Shard {shard.index} left no results; see {shard.log}")
+
+    if failed or crashed or any(shard.returncode for shard in shards):
+        print(f"Logs are in {workdir}")
+        sys.exit(1)
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
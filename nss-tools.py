@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import runpy
+import sys
+from optparse import OptionParser
+from pathlib import Path
+
+# Each tool imports what it needs once it's picked, so `nss-tools.py --help`
+# or a subcommand's --help doesn't pay for Bugzilla or prompt_toolkit.
+TOOLS = {
+    "land": ("nss-land-commit.py", "check outgoing commits and resolve their bugs"),
+    "release-review": ("nss-release-review.py", "review the bugs in a release"),
+    "code-review": ("nss-code-review.py", "walk through the code review checklist"),
+    "uplift": ("nss-uplift.py", "land an NSS tag in mozilla-unified, resumably"),
+    "try": ("nss-try.py", "push to nss-try, skipping pushes already made"),
+    "hgd": ("nss-hgd.py", "keep hg command servers warm between runs"),
+    "ssl-gtests": ("nss-ssl-gtests.py", "run ssl_gtest sharded over every core"),
+    "certdata": (
+        "nss-certdata.py",
+        "convert certdata.txt roots to PEM, or compare two",
+    ),
+}
+
+
+def main():
+    parser = OptionParser(
+        usage="%prog <command> [options]\n\nCommands:\n"
+        + "\n".join(f"  {name:<16}{help}" for name, (_, help) in TOOLS.items())
+    )
+    parser.disable_interspersed_args()
+    (options, args) = parser.parse_args()
+
+    if not args or args[0] not in TOOLS:
+        parser.error(f"Pick one of: {', '.join(TOOLS)}")
+
+    name, *toolArgs = args
+    script = Path(__file__).resolve().parent / TOOLS[name][0]
+    sys.argv = [str(script), *toolArgs]
+    runpy.run_path(str(script), run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
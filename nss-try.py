@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Pushes to nss-try as nss-try.sh and nss-try-patch.sh do, but skips a push
+# when the same changes already went to try with the same syntax, and sends
+# several Phabricator diffs to try as one push with a head for each.
+
+import os
+import shutil
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import hglib
+from colorama import init, Fore
+from optparse import OptionParser
+
+from utils.hgsession import open_repo
+from utils.trypush import (
+    TREEHERDER_URL,
+    TRY_HELP,
+    TryHistory,
+    normalize_syntax,
+    push_key,
+)
+from utils.types import Validator
+
+TRY_PATH = "nss-try"
+
+
+def info(message):
+    print(Fore.GREEN + message)
+
+
+def log(message):
+    print(message)
+
+
+def die(message):
+    print(Fore.RED + message)
+    sys.exit(1)
+
+
+def hg(hgclient, *args):
+    return hgclient.rawcommand([arg.encode("UTF-8") for arg in args])
+
+
+def node(hgclient, rev: str) -> str:
+    return hgclient.log(revrange=rev)[0].node.decode("UTF-8")
+
+
+def headline(hgclient, rev: str) -> str:
+    return hgclient.log(revrange=rev)[0].desc.decode("UTF-8").split("\n")[0]
+
+
+def preflight(hgclient, options):
+    if hgclient.status(modified=True, added=True, removed=True, deleted=True):
+        die("Please commit unstaged changes")
+    paths = hgclient.paths()
+    if b"hg.mozilla.org/projects/nss-try" not in paths.get(TRY_PATH.encode(), b""):
+        die(
+            f"You need to set up the {TRY_PATH} path. See https://wiki.mozilla.org/NSS:TryServer"
+        )
+    if options.phab and shutil.which("moz-phab") is None:
+        die("moz-phab not found")
+
+
+# Each Phabricator diff lands on `start` as its own head; returns
+# [(label, node)] for what to push. What's applied goes in `created`, even
+# if a later diff fails, so it can be cleaned up.
+def apply_diffs(hgclient, *, start: str, diffs: list, created: list) -> list:
+    targets = []
+    for diff in diffs:
+        hgclient.update(rev=start.encode(), clean=True)
+        proc = subprocess.run(
+            ["moz-phab", "patch", "--apply-to", "here", diff],
+            cwd=hgclient.root().decode("UTF-8"),
+        )
+        applied = node(hgclient, ".")
+        if applied != start:
+            created.append(applied)
+        if proc.returncode:
+            die(f"Couldn't download patch {diff}")
+        targets.append((diff, applied))
+    return targets
+
+
+def commit_try_file(hgclient, *, rev: str, syntax: str) -> str:
+    hgclient.update(rev=rev.encode(), clean=True)
+    tryFile = os.path.join(hgclient.root().decode("UTF-8"), ".try")
+    with open(tryFile, "w") as outFile:
+        outFile.write(syntax + "\n")
+    hgclient.add([tryFile.encode()])
+    message = f"{syntax} {os.environ.get('COMMIT_SUFFIX', '')}".strip()
+    hgclient.commit(message=message.encode(), include=[tryFile.encode()])
+    return node(hgclient, ".")
+
+
+# The try syntax is options too, so only the ones at the front that are
+# nss-try.py's own are parsed.
+def split_args(parser, argv) -> tuple:
+    ours = []
+    remaining = list(argv)
+    while remaining:
+        option = parser.get_option(remaining[0].split("=", 1)[0])
+        if option is None:
+            break
+        ours.append(remaining.pop(0))
+        if option.takes_value() and "=" not in ours[-1] and remaining:
+            ours.append(remaining.pop(0))
+    return ours, remaining
+
+
+def main():
+    init(autoreset=True)
+
+    parser = OptionParser(usage="%prog [options] <try syntax>\n\n" + TRY_HELP)
+    parser.add_option(
+        "-D",
+        "--phab",
+        action="append",
+        metavar="Dxxxx",
+        help="Push this Phabricator diff, applied to the working directory's parent, instead of the parent; repeatable, all in one push",
+    )
+    parser.add_option(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Push even if the same changes went to try with the same syntax before",
+    )
+    ours, args = split_args(parser, sys.argv[1:])
+    (options, _) = parser.parse_args(ours)
+    diffs = list(dict.fromkeys(options.phab or []))
+
+    if not args:
+        parser.error("Give the try syntax")
+    trySyntax = "try: " + " ".join(args)
+    syntax = normalize_syntax(args)
+
+    hgclient = open_repo(".")
+    preflight(hgclient, options)
+    history = TryHistory(hgclient)
+    validator = Validator()
+
+    log("Try syntax: ")
+    log(f"  {trySyntax}")
+    log("")
+
+    start = node(hgclient, ".")
+    created = []
+    try:
+        if diffs:
+            targets = apply_diffs(hgclient, start=start, diffs=diffs, created=created)
+        else:
+            targets = [(start[:12], start)]
+
+        # Whatever's been pushed before, with this syntax, isn't pushed again.
+        pushing = {}
+        for label, rev in targets:
+            key = push_key(hgclient, rev, syntax)
+            earlier = history.get(key)
+            if key in pushing:
+                log(f"{label} is the same change as {pushing[key][0]}")
+                continue
+            if earlier is not None:
+                print(
+                    Fore.YELLOW
+                    + f"{label} was pushed with the same syntax on {earlier['pushed']}:"
+                )
+                log(f"  {earlier['url']}")
+                if not options.force:
+                    continue
+            pushing[key] = (label, rev)
+
+        if not pushing:
+            log("Nothing new to push (--force pushes anyway)")
+            return
+
+        for label, rev in pushing.values():
+            info(f"{label}: {headline(hgclient, rev)}")
+        if diffs and not validator.confirm(
+            f"Push {len(pushing)} head(s) to {TRY_PATH}?"
+        ):
+            return
+
+        tryHeads = {}
+        for key, (label, rev) in pushing.items():
+            tryHeads[key] = commit_try_file(hgclient, rev=rev, syntax=trySyntax)
+            created.append(tryHeads[key])
+
+        log(f"Pushing {len(tryHeads)} head(s) to {TRY_PATH}...")
+        hgclient.push(
+            dest=TRY_PATH.encode(),
+            rev=[head.encode() for head in tryHeads.values()],
+            force=True,
+            newbranch=True,
+        )
+
+        now = datetime.now(timezone.utc)
+        for key, (label, rev) in pushing.items():
+            history.record(
+                key,
+                revision=tryHeads[key],
+                syntax=syntax,
+                description=headline(hgclient, rev),
+                when=now,
+            )
+            log(f"Pushed {label} as {tryHeads[key][:12]}. Find it on Treeherder:")
+            log("")
+            log(f"  {TREEHERDER_URL}{tryHeads[key]}")
+            log("")
+        history.save()
+
+    except hglib.error.CommandError as ce:
+        die(f"Mercurial error {ce.err.decode('UTF-8', 'replace')}".strip())
+
+    finally:
+        # The .try commits and applied diffs only existed for the push.
+        log("Cleaning up...")
+        hgclient.update(rev=start.encode(), clean=True)
+        if created:
+            hg(
+                hgclient,
+                "--config",
+                "extensions.strip=",
+                "strip",
+                "-r",
+                f"only({' + '.join(created)}, {start})",
+            )
+        bookmarks, _ = hgclient.bookmarks()
+        names = {name.decode("UTF-8") for name, _, _ in bookmarks}
+        for diff in diffs:
+            if f"phab-{diff}" in names:
+                hg(hgclient, "bookmark", "-d", f"phab-{diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+# Lands an NSS tag in mozilla-unified, as nss-uplift-unified.sh does. The
+# Bugzilla check and both pulls run at once, and every step is checkpointed,
+# so a re-run after a failure (or a fix by hand) carries on from the step
+# that stopped it.
+
+import os
+import shutil
+import sys
+import time
+from colorama import init, Fore
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+from pathlib import Path
+
+from utils.config import add_bugzilla_options, connect_bugzilla
+from utils.hgsession import open_repo
+from utils.types import PackageVersion, Validator
+from utils.uplift import (
+    DEFAULT_CONFIG_FILE,
+    Checkpoints,
+    UpliftError,
+    commit_message,
+    def_changes,
+    hg,
+    load_uplift_config,
+    orig_files,
+    run,
+)
+
+NSS_REPO = "https://hg.mozilla.org/projects/nss"
+
+CONFIG_HELP = """There's a problem in your ~/.nss-uplift.conf file. As a starting point, here are some defaults:
+
+bug=1501587
+central_path=~/hg/mozilla-central
+nss_path=~/hg/nss
+check_def=true
+mozilla_branch=central
+reviewers=nssteam
+"""
+
+
+def info(message):
+    print(Fore.GREEN + message)
+
+
+def log(message):
+    print(message)
+
+
+class Uplift:
+    def __init__(self, *, config, options, tag, validator):
+        self.options = options
+        self.validator = validator
+        self.tag = tag
+        self.bug = config.get("bug")
+        self.branch = config["mozilla_branch"]
+        self.reviewers = config.get("reviewers")
+        self.check_def = config.get("check_def") == "true"
+        self.central = Path(config["central_path"])
+        self.nss = Path(config["nss_path"])
+        self.hgclient = open_repo(str(self.central))
+        self.checkpoints = Checkpoints(
+            self.central / ".hg" / "nss-uplift.json", tag=tag
+        )
+        self.messageFile = self.central / ".hg" / f"nss-uplift-{tag}.commitmsg"
+
+    def step(self, name, func, *args):
+        if name in self.checkpoints:
+            log(f"[{name}] done in an earlier run")
+            return self.checkpoints.get(name)
+        start = time.perf_counter()
+        value = func(*args)
+        self.checkpoints.finish(name, True if value is None else value)
+        info(f"[{name}] done in {time.perf_counter() - start:.1f}s")
+        return value
+
+    def hg(self, repo, *args, **kwargs) -> str:
+        kwargs.setdefault("verbose", self.options.verbose)
+        return hg(repo, *args, **kwargs)
+
+    def reset(self):
+        self.hg(self.central, "revert", "-q", "-C", "--all")
+        # update_nss puts the bookmark on the branch head, which is public,
+        # before anything is committed; only the uplift's own commit goes.
+        if self.hgclient.log(revrange='draft() and present(bookmark("nss-uplift"))'):
+            self.hg(
+                self.central,
+                "--config",
+                "extensions.strip=",
+                "strip",
+                "-r",
+                "nss-uplift",
+            )
+        bookmarks, _ = self.hgclient.bookmarks()
+        if any(name == b"nss-uplift" for name, _, _ in bookmarks):
+            self.hg(self.central, "bookmark", "-d", "nss-uplift")
+        if self.messageFile.exists():
+            self.messageFile.unlink()
+        self.checkpoints.clear()
+
+    def check_bug(self):
+        bzapi = connect_bugzilla(self.options)
+        bugdata = bzapi.getbug(int(self.bug))
+        log(f"Bug {self.bug}: {bugdata.summary} [{bugdata.status}]")
+        if bugdata.status == "RESOLVED":
+            raise UpliftError("Bug is resolved. Please update ~/.nss-uplift.conf")
+        if "leave-open" not in bugdata.keywords:
+            raise UpliftError("Bug is not leave-open. Please update the bug.")
+
+    # Returns the tag that's landed at the tip of the branch, which is where
+    # the changelog starts.
+    def update_central(self) -> str:
+        heads = self.hg(
+            self.central, "fxheads", "-T", "{join(fxheads, ' ')}\n", verbose=False
+        )
+        if self.branch not in heads.split():
+            raise UpliftError(
+                f"mozilla_branch {self.branch} doesn't appear to exist in {self.central}"
+            )
+        self.hg(self.central, "--config", "extensions.purge=", "purge", "--all", ".")
+        self.hg(self.central, "revert", "-q", "-C", "--all")
+        self.hg(self.central, "pull", self.branch)
+        self.hg(self.central, "up", self.branch)
+        base = (self.central / "security/nss/TAG-INFO").read_text().strip()
+        if base == self.tag:
+            raise UpliftError(
+                f"NSS tag {self.tag} is already landed in this repository"
+            )
+        return base
+
+    def update_nss_repo(self):
+        self.hg(self.nss, "pull", "default")
+
+    def write_message(self, revset) -> str:
+        header = f"Bug {self.bug or 'unknown'} - land NSS {self.tag} UPGRADE_NSS_RELEASE, r={self.reviewers}"
+        self.messageFile.write_text(
+            commit_message(self.nss, revset=revset, header=header)
+        )
+        return str(self.messageFile)
+
+    def update_nss(self):
+        self.hg(self.central, "bookmark", "-f", "nss-uplift")
+        client = ["./mach", "python", "client.py", "update_nss"]
+        run([*client, "--repo", self.nss, self.tag], cwd=self.central, capture=False)
+
+    def build(self):
+        run(["./mach", "build"], cwd=self.central, capture=False)
+
+    def update_hashes(self):
+        tools = self.central / "security/manager/tools"
+        table = tools.parent / "ssl/RootHashes.inc"
+        run(["xpcshell", "genRootCAHashes.js", table], cwd=tools, capture=False)
+
+    def commit(self):
+        self.hg(self.central, "addremove")
+        self.hg(self.central, "commit", "--logfile", self.messageFile)
+        self.messageFile.unlink()
+
+    # Brings an uplift that was committed in an earlier run up to date with
+    # the branch.
+    def refresh(self):
+        log(
+            f"Looks like the commit was already made. Updating to current {self.branch}..."
+        )
+        self.hg(self.central, "pull", self.branch)
+        self.hg(
+            self.central,
+            "--config",
+            "extensions.rebase=",
+            "rebase",
+            "-s",
+            "nss-uplift",
+            "-d",
+            self.branch,
+        )
+        if not self.options.no_build:
+            self.build()
+
+    def check_configure(self):
+        header = (self.central / "security/nss/lib/nss/nss.h").read_text()
+        version = PackageVersion.from_header(self.validator, "NSS", header)
+        minimum = ".".join(version.number.split(".")[:2])
+        configure = self.central / "build/moz.configure/nss.configure"
+        if f"nss >= {minimum}" not in configure.read_text():
+            raise UpliftError(
+                f"{configure} is out-of-date for NSS {version.number}. "
+                "Fix it, then hg commit --amend and re-run"
+            )
+
+    def prepare(self) -> str:
+        steps = [("central", self.update_central), ("nss", self.update_nss_repo)]
+        if self.bug and not self.options.security:
+            steps.insert(0, ("bug", self.check_bug))
+        with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+            futures = [
+                (name, pool.submit(self.step, name, func)) for name, func in steps
+            ]
+        errors = [(name, future.exception()) for name, future in futures]
+        for name, error in errors:
+            if error is not None:
+                print(Fore.RED + f"[{name}] {error}")
+        if any(error is not None for _, error in errors):
+            raise UpliftError("Couldn't prepare the uplift")
+        return self.checkpoints.get("central")
+
+    def land(self):
+        base = self.prepare()
+        revset = self.options.revset or f"reverse({base}~-1::{self.tag})"
+        info(f"Revset: {revset}")
+        message = self.step("message", self.write_message, revset)
+        # The commit step uses it up.
+        if "commit" not in self.checkpoints:
+            log(Path(message).read_text())
+
+        if "update" not in self.checkpoints:
+            self.step("update", self.update_nss)
+            # Only right after update_nss, so a re-run goes past .def
+            # changes that were dealt with by hand.
+            changed = def_changes(self.hgclient)
+            if changed and self.check_def:
+                raise UpliftError(
+                    f"Changes in {', '.join(changed)}. "
+                    "We might have to change security/nss.symbols then manually"
+                )
+
+        leftovers = orig_files(self.hgclient)
+        if leftovers:
+            raise UpliftError(
+                f"Some .orig files appear to be included: {', '.join(leftovers)}"
+            )
+
+        if "commit" in self.checkpoints:
+            self.refresh()
+        else:
+            if not self.options.no_build:
+                self.step("build", self.build)
+            if not self.options.no_hashes:
+                self.step("hashes", self.update_hashes)
+            self.step("commit", self.commit)
+
+        self.check_configure()
+        log(self.hg(self.central, "export", "-r", ".", verbose=False))
+
+    def submit(self):
+        if "try" not in self.checkpoints and self.validator.confirm(
+            "Do you wish to submit to try?"
+        ):
+            self.step("try", self.push_try)
+        if "phabricator" not in self.checkpoints and self.validator.confirm(
+            "Do you wish to submit to Phabricator?"
+        ):
+            self.step("phabricator", self.submit_phabricator)
+
+    def push_try(self):
+        try_syntax = ["-b", "do", "-p", "all", "-u", "all", "-t", "none"]
+        run(["./mach", "try", "syntax", *try_syntax], cwd=self.central, capture=False)
+
+    def submit_phabricator(self):
+        run(
+            ["moz-phab", "submit", "--reviewers", self.reviewers, "nss-uplift"],
+            cwd=self.central,
+            capture=False,
+        )
+
+
+def preflight(config, options):
+    for name in ["central_path", "nss_path", "mozilla_branch"]:
+        if not config.get(name):
+            print(CONFIG_HELP)
+            sys.exit(f"You must set {name} in {options.config}")
+    if not (Path(config["nss_path"]) / "lib/util/nssutil.h").exists():
+        sys.exit(f"nss_path {config['nss_path']} doesn't contain NSS")
+    if not (Path(config["central_path"]) / "security/nss/lib/util/nssutil.h").exists():
+        sys.exit(f"central_path {config['central_path']} doesn't contain NSS")
+
+    needed = ["ssh-add", "moz-phab"] + ([] if options.no_hashes else ["xpcshell"])
+    for tool in needed:
+        if shutil.which(tool) is None:
+            sys.exit(f"{tool} not installed")
+    keys = run(["ssh-add", "-l"], cwd=".")
+    if not keys.strip():
+        sys.exit("ssh keys not available, perhaps you need to ssh-add?")
+
+
+def env_flag(name) -> bool:
+    return os.environ.get(name, "false") == "true"
+
+
+def main():
+    init(autoreset=True)
+
+    parser = OptionParser(
+        usage="%prog [options] [NSS tag]\n\nThe tag defaults to the tip of NSS default."
+    )
+    parser.add_option(
+        "--config",
+        default=str(DEFAULT_CONFIG_FILE),
+        help=f"Uplift settings (default {DEFAULT_CONFIG_FILE})",
+    )
+    parser.add_option(
+        "--revset",
+        default=os.environ.get("REVSET"),
+        help="NSS changesets for the commit message (default: since the landed tag)",
+    )
+    parser.add_option(
+        "--no-build",
+        action="store_true",
+        default=env_flag("NOBUILD"),
+        help="Don't build mozilla-unified",
+    )
+    parser.add_option(
+        "--no-hashes",
+        action="store_true",
+        default=env_flag("NOHASHES"),
+        help="Don't recreate the CA telemetry hashes",
+    )
+    parser.add_option(
+        "--security",
+        action="store_true",
+        default=env_flag("SECURITY"),
+        help="A security bug, so don't look it up",
+    )
+    parser.add_option(
+        "--restart",
+        action="store_true",
+        help="Throw away an uplift of the same tag in progress instead of resuming it",
+    )
+    parser.add_option(
+        "--resume",
+        action="store_true",
+        help="Carry on with an uplift in progress without asking",
+    )
+    parser.add_option("-v", "--verbose", action="store_true")
+    add_bugzilla_options(parser)
+    (options, args) = parser.parse_args()
+
+    if not Path(options.config).exists():
+        print(CONFIG_HELP)
+        sys.exit("No configuration ready")
+    config = load_uplift_config(options.config)
+    preflight(config, options)
+
+    validator = Validator()
+    try:
+        tag = (
+            args[0]
+            if args
+            else hg(config["nss_path"], "id", f"{NSS_REPO}#default").strip()
+        )
+        uplift = Uplift(config=config, options=options, tag=tag, validator=validator)
+
+        if uplift.checkpoints.steps and not options.resume:
+            done = ", ".join(uplift.checkpoints.steps)
+            if options.restart or not validator.confirm(
+                f"Uplift of {tag} is in progress ({done}). Resume? (no starts over)"
+            ):
+                uplift.reset()
+
+        log(f"Mozilla repo: {uplift.central}")
+        log(f"Mozilla branch: {uplift.branch}")
+        log(f"NSS repo: {uplift.nss}")
+        log(f"NSS tag: {tag}")
+        log(f"Check-def: {uplift.check_def}")
+        log(f"Reviewers: {uplift.reviewers}")
+        if uplift.bug:
+            log(f"Bug #: {uplift.bug} https://bugzil.la/{uplift.bug}")
+        if options.no_build:
+            log("Not building")
+        if options.no_hashes:
+            log("Not recreating CA hashes")
+        if options.security:
+            print(Fore.YELLOW + "SECURITY BUG")
+        if not validator.confirm("Go ahead?"):
+            return
+
+        uplift.land()
+        uplift.submit()
+    except UpliftError as e:
+        print(Fore.RED + str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+# The tools and utils/ aren't a package; run them from the repository root.
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# The nss-*.py scripts can't be imported by name.
+def load_script(filename: str):
+    name = filename[: -len(".py")].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# `python -X importtime` of the given arguments, as {module: cumulative ms}
+# for every module imported and, separately, the top-level ones.
+def import_times(*args) -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    toplevel = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules[name.strip()] = int(cumulative) / 1000
+        if not name.startswith("  "):
+            toplevel[name.strip()] = int(cumulative) / 1000
+    return modules, toplevel
+
+
+# What running nss-tools.py with `args` adds to a bare interpreter's imports
+# (site and friends), in ms.
+def startup_import_ms(*args) -> float:
+    _, bare = import_times("-c", "pass")
+    _, toplevel = import_times(ROOT / "nss-tools.py", *args)
+    return sum(ms for name, ms in toplevel.items() if name not in bare)
@@ -0,0 +1,144 @@
+# The tools end to end on a synthetic repository (utils.synthrepo) against an
+# in-process utils.fakebugzilla, offline. Wall time goes to pytest-benchmark;
+# Bugzilla round trips and peak RSS go in each benchmark's extra_info, and
+# round trips are held to what the batched fetches need.
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import ROOT, load_script, startup_import_ms
+from utils.fakebugzilla import FakeBugzilla, serve
+from utils.synthrepo import SynthRepo
+
+COMMITS = 300
+RESOLVE = 20
+
+
+@pytest.fixture(scope="module")
+def synth(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("synth")
+    # resolve() takes the repository name from after the "@" in the default
+    # path; pointing it at itself means everything has landed.
+    repo = tmp / "nss@synth"
+    bugs = SynthRepo(str(repo)).build(commits=COMMITS, releases=2)
+    (repo / ".hg" / "hgrc").write_text(f"[paths]\ndefault = {repo}\n")
+
+    home = tmp / "home"
+    home.mkdir()
+    (home / ".nss-land-commit.json").write_text(json.dumps({"api_key": "x"}))
+
+    fake = FakeBugzilla(bugs)
+    server = serve(fake)
+    yield SimpleNamespace(
+        repo=repo,
+        fake=fake,
+        url=f"http://127.0.0.1:{server.server_address[1]}/rest/",
+        env=dict(os.environ, HOME=str(home), NSS_HGD_SOCKET=str(tmp / "no")),
+    )
+    server.shutdown()
+
+
+def run_tool(synth, script, *args) -> SimpleNamespace:
+    before = synth.fake.stats()["requests"]
+    proc = subprocess.Popen(
+        [sys.executable, ROOT / script, *args]
+        + ["--batch", "--yes", "--no-cache", "--bugzilla", synth.url],
+        cwd=synth.repo,
+        env=synth.env,
+        stdout=subprocess.DEVNULL,
+    )
+    _, status, usage = os.wait4(proc.pid, 0)
+    return SimpleNamespace(
+        returncode=os.waitstatus_to_exitcode(status),
+        requests=synth.fake.stats()["requests"] - before,
+        rss=usage.ru_maxrss * 1024,
+    )
+
+
+def record(benchmark, result):
+    benchmark.extra_info["requests"] = result.requests
+    benchmark.extra_info["peak_rss"] = result.rss
+    assert result.returncode == 0
+
+
+@pytest.mark.parametrize("mode", [[], ["--async"]], ids=["threads", "async"])
+def test_release_review(benchmark, synth, mode):
+    result = benchmark.pedantic(
+        run_tool,
+        args=(synth, "nss-release-review.py", "-r", "reverse(all())", *mode),
+        rounds=1,
+    )
+    record(benchmark, result)
+    # The bugs come in chunks, not one request each.
+    assert result.requests < 10
+
+
+@pytest.mark.parametrize("mode", [[], ["--async"]], ids=["threads", "async"])
+def test_land_resolve(benchmark, synth, mode):
+    result = benchmark.pedantic(
+        run_tool,
+        args=(
+            synth,
+            "nss-land-commit.py",
+            "--resolve",
+            f"last(all(), {RESOLVE})",
+            *mode,
+        ),
+        rounds=1,
+    )
+    record(benchmark, result)
+    # A prefetch, then at most an update for each bug.
+    assert result.requests <= RESOLVE + 5
+
+
+def test_asyncbz_requests(benchmark):
+    from utils.asyncbz import AsyncBugzilla
+
+    bugs = [{"id": n, "product": "NSS", "status": "NEW"} for n in range(1, 101)]
+    fake = FakeBugzilla(bugs)
+    server = serve(fake)
+    url = f"http://127.0.0.1:{server.server_address[1]}/rest/"
+
+    async def gathered():
+        client = AsyncBugzilla(url, api_key="x", connections=8)
+        found = await asyncio.gather(*(client.getbug(bug["id"]) for bug in bugs))
+        await client.close()
+        return found, client.pool.connects
+
+    try:
+        found, connects = benchmark.pedantic(lambda: asyncio.run(gathered()), rounds=3)
+    finally:
+        server.shutdown()
+    benchmark.extra_info["connects"] = connects
+    assert [bug.id for bug in found] == [bug["id"] for bug in bugs]
+    # Connections are kept alive and reused.
+    assert connects <= 8
+
+
+def headline_matches(headlines):
+    from utils.regexes import RX_headline
+
+    for headline in headlines:
+        match = RX_headline.match(headline)
+        match and match.lastgroup
+
+
+def test_headline_throughput(benchmark):
+    bench = load_script("nss-bench.py")
+    headlines = bench.HEADLINES + list(bench.fuzzed_headlines(5000))
+    benchmark(headline_matches, headlines)
+
+
+@pytest.mark.parametrize("tool", ["land", "release-review", "code-review"])
+def test_startup(benchmark, tool):
+    args = [sys.executable, ROOT / "nss-tools.py", tool, "--help"]
+    benchmark.pedantic(
+        subprocess.run, args=(args,), kwargs={"stdout": subprocess.DEVNULL}, rounds=5
+    )
+    benchmark.extra_info["import_ms"] = startup_import_ms(tool, "--help")
@@ -0,0 +1,94 @@
+# RX_headline classifies a headline and extracts its fields in one match;
+# this holds it to what the cascade of RX_backout, RX_tag, RX_patch and the
+# backout forms it replaced gave, on real NSS headlines and mangled ones.
+
+import pytest
+
+from conftest import load_script
+from utils.regexes import (
+    RX_backout,
+    RX_backout_std,
+    RX_backout_template,
+    RX_patch,
+    RX_tag,
+)
+from utils.types import NullValidator, Patch
+
+bench = load_script("nss-bench.py")
+
+
+# Patch's headline parsing as it was before RX_headline.
+def cascade(headline: str) -> dict:
+    fields = {"type": "patch", "rules": []}
+    if RX_backout.match(headline):
+        fields["type"] = "backout"
+        match = RX_backout_template.match(headline)
+        if match:
+            fields.update(match.groupdict())
+        else:
+            fields["rules"].append("backout-format")
+            match = RX_backout_std.match(headline)
+            if match:
+                fields["changeset"] = match.group("changeset")
+            else:
+                fields["rules"].append("backout-parse")
+    elif RX_tag.match(headline):
+        fields["type"] = "tag"
+        fields.update(RX_tag.match(headline).groupdict())
+    else:
+        match = RX_patch.match(headline)
+        if match:
+            fields.update(match.groupdict())
+        else:
+            fields["rules"].append("headline-parse")
+    return fields
+
+
+class RecordingValidator(NullValidator):
+    def __init__(self):
+        self.rules = []
+
+    def warn(self, message, *, rule, **kwargs):
+        self.rules.append(rule)
+
+
+def single_pass(headline: str) -> dict:
+    validator = RecordingValidator()
+    commit = (b"0", b"0" * 40, b"", b"default", b"", headline.encode(), None)
+    patch = Patch(commit=commit, validator=validator)
+    return {
+        "type": patch.type,
+        "bug": patch.bug,
+        "reviewers": patch.reviewers,
+        "approvers": patch.approvers,
+        "desc": patch.description,
+        "changeset": patch.changeset,
+        "tag": patch.tag,
+        "reason": patch.reason,
+        "rules": validator.rules,
+    }
+
+
+def differences(headline: str) -> dict:
+    old = cascade(headline)
+    new = single_pass(headline)
+    return {
+        field: (old.get(field), value)
+        for field, value in new.items()
+        if old.get(field) != value
+    }
+
+
+@pytest.mark.parametrize("headline", bench.HEADLINES)
+def test_corpus(headline):
+    assert differences(headline) == {}
+
+
+@pytest.mark.parametrize("seed", range(1, 6))
+def test_fuzzed(seed):
+    mismatches = {}
+    for headline in bench.fuzzed_headlines(2000, seed=seed):
+        found = differences(headline)
+        if found:
+            mismatches[headline] = found
+    assert mismatches == {}
@@ -0,0 +1,28 @@
+# `--help` shouldn't pay for the libraries a tool only needs once it runs,
+# and what it does import is held to a budget.
+
+import pytest
+
+from conftest import ROOT, import_times, startup_import_ms
+
+DEFERRED = ["bugzilla", "hglib", "yaml", "whaaaaat", "prompt_toolkit", "pyperclip"]
+
+# Each of these imports 30-50ms over a bare interpreter on a laptop; letting
+# python-bugzilla back in adds another 75ms or so.
+IMPORT_BUDGET_MS = 100
+
+HELP = [["--help"], ["land", "--help"], ["release-review", "--help"]]
+HELP += [["code-review", "--help"]]
+HELP_IDS = ["nss-tools", "land", "release-review", "code-review"]
+
+
+@pytest.mark.parametrize("args", HELP, ids=HELP_IDS)
+def test_help_defers_imports(args):
+    modules, _ = import_times(ROOT / "nss-tools.py", *args)
+    assert "optparse" in modules
+    assert sorted(modules.keys() & set(DEFERRED)) == []
+
+
+@pytest.mark.parametrize("args", HELP, ids=HELP_IDS)
+def test_help_import_time(args):
+    assert startup_import_ms(*args) < IMPORT_BUDGET_MS
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import ssl
+import threading
+from urllib.parse import urlencode, urlsplit
+
+
+class BugzillaError(Exception):
+    def __init__(self, message, *, code=None):
+        super().__init__(f"code {code}: {message}" if code is not None else message)
+        self.code = code
+
+
+class ConnectionPool:
+    # Keep-alive HTTP/1.1 connections to one host, at most `size` of them in
+    # use at once. A request on a reused connection the server has since
+    # closed is retried on another one.
+
+    def __init__(self, *, host, port, tls, size=4):
+        self.host = host
+        self.port = port
+        self.tls = ssl.create_default_context() if tls else None
+        self.slots = asyncio.Semaphore(size)
+        self.idle = []
+        self.connects = 0
+        self.requests = 0
+
+    async def connect(self):
+        if self.idle:
+            return self.idle.pop(), True
+        self.connects += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.tls), False
+
+    async def request(self, method, target, *, headers=None, body=None):
+        async with self.slots:
+            while True:
+                (reader, writer), reused = await self.connect()
+                try:
+                    status, keepAlive, data = await self.exchange(
+                        reader, writer, method, target, headers or {}, body
+                    )
+                except ConnectionResetError:
+                    writer.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                self.requests += 1
+                if keepAlive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, data
+
+    async def exchange(self, reader, writer, method, target, headers, body):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Content-Length: {len(body or b'')}")
+        writer.write(
+            ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        )
+        await writer.drain()
+
+        statusLine = await reader.readline()
+        if not statusLine:
+            # Only safe to retry because the server didn't answer at all.
+            raise ConnectionResetError("Connection closed by Bugzilla")
+        version, status, *_ = statusLine.decode("latin-1").split(" ", 2)
+
+        response = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            response[name.strip().lower()] = value.strip()
+
+        keepAlive = (
+            version == "HTTP/1.1" and response.get("connection", "").lower() != "close"
+        )
+        if response.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()).strip():
+                        pass
+                    break
+                data += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in response:
+            data = await reader.readexactly(int(response["content-length"]))
+        else:
+            data = await reader.read()
+            keepAlive = False
+        return int(status), keepAlive, data
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class RestBug:
+    # The parts of python-bugzilla's Bug the tools use: fields as attributes,
+    # weburl and get_raw_data().
+
+    def __init__(self, data: dict, *, weburl: str):
+        self.__dict__["_data"] = data
+        self.__dict__["weburl"] = weburl
+
+    def __getattr__(self, name):
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(f"Bug object has no attribute '{name}'.") from None
+
+    def __str__(self):
+        return (
+            f"#{self._data.get('id'):<6} {self._data.get('status', ''):<10} - "
+            f"{self._data.get('assigned_to', '')} - {self._data.get('summary', '')}"
+        )
+
+    def get_raw_data(self) -> dict:
+        return dict(self._data)
+
+
+class AsyncBugzilla:
+    # The subset of the REST API the tools need, on asyncio. Hosts are taken
+    # the way python-bugzilla takes them, except a bare host always means its
+    # REST API.
+
+    def __init__(self, url, *, api_key=None, connections=4):
+        if "://" not in url:
+            url = f"https://{url}"
+        parts = urlsplit(url)
+        path = parts.path.rstrip("/")
+        if not path.endswith("/rest"):
+            path += "/rest"
+        self.url = f"{parts.scheme}://{parts.netloc}{path}/"
+        self.base = path
+        self.site = f"{parts.scheme}://{parts.netloc}{path[: -len('/rest')]}"
+        self.api_key = api_key
+        self.pool = ConnectionPool(
+            host=parts.hostname,
+            port=parts.port or (443 if parts.scheme == "https" else 80),
+            tls=parts.scheme == "https",
+            size=connections,
+        )
+
+    async def call(self, method, path, *, params=None, payload=None) -> dict:
+        target = self.base + path
+        if params:
+            target += "?" + urlencode(params)
+        headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if self.api_key:
+            headers["X-BUGZILLA-API-KEY"] = self.api_key
+        body = None
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(payload).encode("UTF-8")
+
+        status, data = await self.pool.request(
+            method, target, headers=headers, body=body
+        )
+        try:
+            result = json.loads(data or b"{}")
+        except ValueError:
+            raise BugzillaError(f"HTTP {status} from {target}") from None
+        if result.get("error") or status >= 400:
+            raise BugzillaError(
+                result.get("message", f"HTTP {status}"), code=result.get("code")
+            )
+        return result
+
+    def bug(self, data: dict) -> RestBug:
+        return RestBug(data, weburl=f"{self.site}/show_bug.cgi?id={data['id']}")
+
+    async def logged_in(self) -> bool:
+        if not self.api_key:
+            return False
+        try:
+            await self.call("GET", "/user", params={"ids": 1})
+        except BugzillaError:
+            return False
+        return True
+
+    async def getbug(self, bug_id, *, include_fields=None) -> RestBug:
+        params = {"include_fields": ",".join(include_fields)} if include_fields else {}
+        result = await self.call("GET", f"/bug/{bug_id}", params=params)
+        return self.bug(result["bugs"][0])
+
+    # Like python-bugzilla, the bugs come back in the order of `ids`; with
+    # permissive, bugs that don't exist or can't be seen are left out rather
+    # than an error.
+    async def getbugs(self, ids, *, include_fields=None, permissive=False) -> list:
+        params = {"id": ",".join(str(bug_id) for bug_id in ids)}
+        if include_fields:
+            params["include_fields"] = ",".join(include_fields)
+        result = await self.call("GET", "/bug", params=params)
+        found = {int(data["id"]): data for data in result["bugs"]}
+        if not permissive:
+            for bug_id in ids:
+                if int(bug_id) not in found:
+                    raise BugzillaError(f"Bug #{bug_id} not found", code=101)
+        return [self.bug(found[int(bug_id)]) for bug_id in ids if int(bug_id) in found]
+
+    def build_update(self, *, comment=None, **fields) -> dict:
+        update = dict(fields)
+        if comment is not None:
+            update["comment"] = {"body": comment}
+        return update
+
+    async def update_bugs(self, ids, update: dict) -> dict:
+        ids = [int(bug_id) for bug_id in ids]
+        return await self.call("PUT", f"/bug/{ids[0]}", payload=dict(update, ids=ids))
+
+    async def close(self):
+        await self.pool.close()
+
+
+class BackgroundBugzilla:
+    # The tools are synchronous and call Bugzilla from FetchExecutor's
+    # threads, so this runs an AsyncBugzilla on an event loop of its own and
+    # blocks each caller until its request is answered. All of those threads
+    # share the one pool of keep-alive connections.
+
+    def __init__(self, url, *, api_key=None, connections=4):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        async def start():
+            return AsyncBugzilla(url, api_key=api_key, connections=connections)
+
+        self.client = self.wait(start())
+        self.url = self.client.url
+        self.logged_in = self.wait(self.client.logged_in())
+
+    def wait(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def getbug(self, bug_id, include_fields=None):
+        return self.wait(self.client.getbug(bug_id, include_fields=include_fields))
+
+    def getbugs(self, ids, include_fields=None, permissive=False):
+        return self.wait(
+            self.client.getbugs(
+                ids, include_fields=include_fields, permissive=permissive
+            )
+        )
+
+    def build_update(self, **kwargs):
+        return self.client.build_update(**kwargs)
+
+    def update_bugs(self, ids, update):
+        return self.wait(self.client.update_bugs(ids, update))
+
+    def close(self):
+        self.wait(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
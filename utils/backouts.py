@@ -0,0 +1,100 @@
+import re
+from dataclasses import dataclass
+
+from utils.types import Patch
+
+RE_hex = re.compile(r"[0-9a-f]+")
+
+
+class NodeIndex:
+    # Patches by short hash, for the changeset prefixes backout headlines
+    # carry. There's one dict per prefix length asked about, built on first
+    # use, so every lookup is a dict hit whatever length was pasted (usually
+    # 12). A prefix that's ambiguous at its length finds nothing.
+
+    def __init__(self, patches):
+        self.nodes = [(patch.hash.decode("UTF-8"), patch) for patch in patches]
+        self.byLength = {}
+
+    def get(self, prefix: str):
+        length = len(prefix)
+        if length not in self.byLength:
+            index = {}
+            for node, patch in self.nodes:
+                key = node[:length]
+                index[key] = None if key in index else patch
+            self.byLength[length] = index
+        return self.byLength[length].get(prefix)
+
+
+@dataclass
+class Backouts:
+    # targets: backout node -> the in-range node it backs out.
+    # reverted: nodes that end up backed out once the range has landed.
+    # outside: backout node -> (backout, target Patch or None) for targets
+    # that aren't in the range, filled in by resolve_outside().
+    targets: dict
+    reverted: set
+    outside: dict
+
+    # Neither a change that was backed out nor the backout itself ship.
+    def skipped(self, node: str) -> bool:
+        return node in self.targets or node in self.reverted
+
+
+# Cancels out patch/backout pairs in `patches` (any order; the index may
+# cover more than them). A backout toggles whether its target is in effect,
+# so backing out a backout re-lands the original, to any depth. A change
+# landed again as a new changeset is just another patch.
+def find_backouts(patches, index: NodeIndex) -> Backouts:
+    ordered = sorted(patches, key=lambda patch: int(patch.id))
+    revs = {patch.hash.decode("UTF-8"): int(patch.id) for patch in ordered}
+    targets = {}
+    reverted = set()
+    outside = {}
+
+    for patch in ordered:
+        if patch.type != "backout" or not patch.changeset:
+            continue
+        node = patch.hash.decode("UTF-8")
+        target = index.get(patch.changeset)
+        targetNode = target.hash.decode("UTF-8") if target is not None else None
+        if targetNode not in revs:
+            outside[node] = (patch, target)
+            continue
+        if revs[targetNode] >= revs[node]:
+            continue
+
+        targets[node] = targetNode
+        while targetNode is not None:
+            reverted ^= {targetNode}
+            targetNode = targets.get(targetNode)
+
+    return Backouts(targets=targets, reverted=reverted, outside=outside)
+
+
+# Looks up every backout target that's outside all the ranges in one hg
+# query. The answer is a handful of changesets, so it goes through the
+# command server rather than a fresh hg. Returns how many were looked up.
+def resolve_outside(hgclient, results, *, validator) -> int:
+    prefixes = sorted(
+        {
+            backout.changeset
+            for result in results
+            for backout, target in result.outside.values()
+            if target is None and RE_hex.fullmatch(backout.changeset)
+        }
+    )
+    if not prefixes:
+        return 0
+
+    revrange = " + ".join(f'id("{prefix}")' for prefix in prefixes)
+    found = NodeIndex(
+        Patch(commit=commit, validator=validator)
+        for commit in hgclient.log(revrange=revrange)
+    )
+    for result in results:
+        for node, (backout, target) in result.outside.items():
+            if target is None:
+                result.outside[node] = (backout, found.get(backout.changeset))
+    return len(prefixes)
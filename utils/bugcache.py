@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_FILE = Path.home() / ".nss-bugcache.sqlite"
+
+# Cached bugs younger than this are used as-is; older ones are revalidated
+# against Bugzilla's last_change_time before use.
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_ENTRIES = 5000
+
+# Bumped when the table changes; an older cache is dropped, not migrated.
+CACHE_VERSION = 2
+
+
+class BugCache:
+    # Rows are keyed by the Bugzilla server, the bug and the fields fetched, so
+    # a stand-in server's bugs are never served for bugzilla.mozilla.org, and
+    # a bug fetched with fewer fields doesn't replace one with more.
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_FILE,
+        *,
+        server: str,
+        ttl=DEFAULT_TTL,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        refresh=False,
+    ):
+        self.path = Path(path)
+        self.server = server
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+
+        # Security bugs end up in here too, so it's created private rather
+        # than made so after sqlite has created it; sqlite gives its journal
+        # the same mode.
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+        except FileExistsError:
+            pass
+        # Prefetches run off the main thread, though never two at once.
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version != CACHE_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS bugs")
+            self.db.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS bugs (
+                server TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                fields TEXT NOT NULL,
+                data TEXT NOT NULL,
+                last_change_time TEXT,
+                fetched REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (server, id, fields)
+            )"""
+        )
+        self.db.commit()
+
+    # Returns ({id: data} still fresh, {id: (data, last_change_time)} stale).
+    def lookup(self, bug_ids, include_fields=None):
+        fresh = {}
+        stale = {}
+        if self.refresh:
+            return fresh, stale
+
+        now = time.time()
+        used = []
+        for bug_id in bug_ids:
+            # The most recently fetched row that has every field asked for.
+            rows = self.db.execute(
+                """SELECT fields, data, last_change_time, fetched FROM bugs
+                WHERE server = ? AND id = ? ORDER BY fetched DESC""",
+                (self.server, int(bug_id)),
+            )
+            for fields, data, last_change_time, fetched in rows:
+                if self.covers(fields, include_fields):
+                    break
+            else:
+                continue
+
+            if now - fetched < self.ttl:
+                fresh[int(bug_id)] = json.loads(data)
+                used.append((now, self.server, int(bug_id), fields))
+            else:
+                stale[int(bug_id)] = (json.loads(data), last_change_time)
+
+        if used:
+            self.db.executemany(
+                "UPDATE bugs SET accessed = ? WHERE server = ? AND id = ? AND fields = ?",
+                used,
+            )
+            self.db.commit()
+        return fresh, stale
+
+    # Fields are stored as a sorted JSON list, or "*" for all of them.
+    @staticmethod
+    def covers(cached_fields, include_fields):
+        if cached_fields == "*":
+            return True
+        if include_fields is None:
+            return False
+        return set(include_fields) <= set(json.loads(cached_fields))
+
+    def store(self, data: dict, include_fields=None):
+        now = time.time()
+        fields = "*" if include_fields is None else json.dumps(sorted(include_fields))
+        self.db.execute(
+            "INSERT OR REPLACE INTO bugs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.server,
+                int(data["id"]),
+                fields,
+                json.dumps(data, default=str),
+                str(data.get("last_change_time")),
+                now,
+                now,
+            ),
+        )
+        self.db.commit()
+
+    # Takes {id: last_change_time} of the stale bugs that Bugzilla says are
+    # unchanged; any row of the bug with that last_change_time is current.
+    def revalidated(self, bugs: dict):
+        now = time.time()
+        self.db.executemany(
+            """UPDATE bugs SET fetched = ?, accessed = ?
+            WHERE server = ? AND id = ? AND last_change_time = ?""",
+            [
+                (now, now, self.server, int(bug_id), last_change_time)
+                for bug_id, last_change_time in bugs.items()
+            ],
+        )
+        self.db.commit()
+
+    def invalidate(self, bug_ids):
+        self.db.executemany(
+            "DELETE FROM bugs WHERE server = ? AND id = ?",
+            [(self.server, int(bug_id)) for bug_id in bug_ids],
+        )
+        self.db.commit()
+
+    def evict(self):
+        self.db.execute(
+            """DELETE FROM bugs WHERE rowid NOT IN (
+                SELECT rowid FROM bugs ORDER BY accessed DESC LIMIT ?
+            )""",
+            (self.max_entries,),
+        )
+        self.db.commit()
+
+    def close(self):
+        self.evict()
+        self.db.close()
+
+
+def add_cache_options(parser):
+    parser.add_option(
+        "--no-cache",
+        action="store_true",
+        help=f"Don't use the local bug cache ({DEFAULT_CACHE_FILE})",
+    )
+    parser.add_option(
+        "--refresh",
+        action="store_true",
+        help="Refetch every bug from Bugzilla, updating the local bug cache",
+    )
+
+
+def open_bug_cache(options, *, server: str):
+    if options.no_cache:
+        return None
+    return BugCache(server=server, refresh=options.refresh)
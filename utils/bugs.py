@@ -0,0 +1,148 @@
+from dataclasses import dataclass, field
+
+from utils.bugcache import BugCache
+from utils.fetch import FetchExecutor
+
+# Bug.weburl is derived client-side from the server url and the id, so it
+# doesn't need to be requested.
+RELEASE_REVIEW_FIELDS = [
+    "id",
+    "product",
+    "status",
+    "target_milestone",
+    "summary",
+    "groups",
+]
+
+
+@dataclass
+class BugFetcher:
+    bzapi: object
+    include_fields: list = None
+    cache: BugCache = None
+    executor: FetchExecutor = None
+    chunk_size: int = 200
+    round_trips: int = 0
+    bugs: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.executor is None:
+            self.executor = FetchExecutor(jobs=1)
+
+    def run(self, label, func, items) -> list:
+        self.round_trips += len(items)
+        return self.executor.map(label, func, items)
+
+    def prefetch(self, bug_ids):
+        wanted = sorted({int(bug_id) for bug_id in bug_ids} - self.bugs.keys())
+        if self.cache is not None:
+            wanted = self.from_cache(wanted)
+
+        chunks = list(self.chunks(wanted))
+        for chunk, (bugs, error) in zip(
+            chunks, self.run("getbugs", self.getbugs, chunks)
+        ):
+            if error is not None:
+                if len(chunk) != 1:
+                    raise error
+                # python-bugzilla fetches a lone id by url, which isn't
+                # permissive, so this is the same error getbug would give.
+                self.errors[chunk[0]] = error
+                continue
+            for bugdata in bugs:
+                self.remember(bugdata)
+
+        # The bulk query silently leaves out bugs we can't see (e.g. some
+        # security bugs); getbug gives a useful error for those, which get()
+        # raises when that bug is asked for.
+        missing = [
+            bug_id
+            for bug_id in wanted
+            if bug_id not in self.bugs and bug_id not in self.errors
+        ]
+        for bug_id, (bugdata, error) in zip(
+            missing, self.run("getbug", self.getbug, missing)
+        ):
+            if error is not None:
+                self.errors[bug_id] = error
+            else:
+                self.remember(bugdata)
+
+    def from_cache(self, wanted):
+        fresh, stale = self.cache.lookup(wanted, self.include_fields)
+        for bug_id, data in fresh.items():
+            self.bugs[bug_id] = self.rebuild(data)
+
+        # Anything past its TTL is only refetched if it changed upstream.
+        unchanged = {}
+        for bugs, error in self.run(
+            "revalidate", self.last_changes, list(self.chunks(sorted(stale)))
+        ):
+            if error is not None:
+                raise error
+            for bugdata in bugs:
+                data, last_change_time = stale[bugdata.id]
+                if str(bugdata.last_change_time) == last_change_time:
+                    self.bugs[bugdata.id] = self.rebuild(data)
+                    unchanged[bugdata.id] = last_change_time
+        self.cache.revalidated(unchanged)
+
+        return [bug_id for bug_id in wanted if bug_id not in self.bugs]
+
+    def rebuild(self, data):
+        # --async clients make their own bug objects.
+        client = getattr(self.bzapi, "client", None)
+        if client is not None:
+            return client.bug(data)
+
+        from bugzilla.bug import Bug
+
+        return Bug(self.bzapi, dict=data)
+
+    def get(self, bug_id):
+        bug_id = int(bug_id)
+        if bug_id in self.errors:
+            raise self.errors[bug_id]
+        if bug_id not in self.bugs and self.cache is not None:
+            self.from_cache([bug_id])
+        if bug_id not in self.bugs:
+            self.round_trips += 1
+            self.remember(self.executor.call("getbug", self.getbug, bug_id))
+        return self.bugs[bug_id]
+
+    def getbugs(self, chunk):
+        return self.bzapi.getbugs(chunk, include_fields=self.fields(), permissive=True)
+
+    def getbug(self, bug_id):
+        return self.bzapi.getbug(bug_id, include_fields=self.fields())
+
+    def last_changes(self, chunk):
+        return self.bzapi.getbugs(
+            chunk, include_fields=["id", "last_change_time"], permissive=True
+        )
+
+    def remember(self, bugdata):
+        self.bugs[bugdata.id] = bugdata
+        if self.cache is not None:
+            self.cache.store(bugdata.get_raw_data(), self.include_fields)
+
+    def invalidate(self, bug_ids):
+        for bug_id in bug_ids:
+            self.bugs.pop(int(bug_id), None)
+            self.errors.pop(int(bug_id), None)
+        if self.cache is not None:
+            self.cache.invalidate(bug_ids)
+
+    def chunks(self, bug_ids):
+        for start in range(0, len(bug_ids), self.chunk_size):
+            yield bug_ids[start : start + self.chunk_size]
+
+    def fields(self):
+        # python-bugzilla appends to the list it's handed, so pass a copy.
+        if self.include_fields is None:
+            return None
+        fields = list(self.include_fields)
+        if self.cache is not None and "last_change_time" not in fields:
+            fields.append("last_change_time")
+        return fields
@@ -0,0 +1,191 @@
+import base64
+import codecs
+import hashlib
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+TRUST_PURPOSES = {
+    "server": "CKA_TRUST_SERVER_AUTH",
+    "email": "CKA_TRUST_EMAIL_PROTECTION",
+    "code": "CKA_TRUST_CODE_SIGNING",
+}
+
+TRUSTED = "CKT_NSS_TRUSTED_DELEGATOR"
+
+
+# certdata.txt is a run of objects, each starting at its CKA_CLASS line.
+# Yields {attribute: value} for each one as soon as the next begins, so a
+# file with many releases concatenated is never held in memory.
+# MULTILINE_OCTAL values come back as bytes, the rest as strings.
+def parse_objects(lines):
+    obj = None
+    octal = None
+    for line in lines:
+        if octal is not None:
+            if line.startswith("END"):
+                name, parts = octal
+                # One C-level pass over the \ooo escapes, not a parse per byte.
+                obj[name] = codecs.escape_decode("".join(parts))[0]
+                octal = None
+            else:
+                octal[1].append(line.strip())
+            continue
+
+        if not line.startswith("CKA_"):
+            continue
+        name, _, rest = line.rstrip("\n").partition(" ")
+        kind, _, value = rest.partition(" ")
+        if name == "CKA_CLASS":
+            if obj is not None:
+                yield obj
+            obj = {}
+        if obj is None:
+            continue
+        if kind == "MULTILINE_OCTAL":
+            octal = (name, [])
+        elif kind == "UTF8":
+            obj[name] = value.strip('"')
+        else:
+            obj[name] = value
+    if obj is not None:
+        yield obj
+
+
+@dataclass
+class Root:
+    label: str
+    issuer: bytes
+    serial: bytes
+    # None for a trust object without a certificate, which is how certdata
+    # distrusts a certificate it doesn't ship.
+    der: bytes = None
+    # {purpose: CKT_* value}, or None until the trust object turns up.
+    trust: dict = None
+
+    def trusted(self, purpose: str) -> bool:
+        return (self.trust or {}).get(purpose) == TRUSTED
+
+    def key(self) -> bytes:
+        return hashlib.sha256(self.der or self.issuer + self.serial).digest()
+
+
+# Pairs each CKO_CERTIFICATE with the CKO_NSS_TRUST naming the same issuer
+# and serial number. The trust object normally comes right after its
+# certificate, so only the unpaired ones are held on to, and each release's
+# root list object (the first object in every certdata.txt) lets them go.
+def pair_trust(objects):
+    pending = {}
+    for obj in objects:
+        objClass = obj.get("CKA_CLASS")
+        if objClass == "CKO_NSS_BUILTIN_ROOT_LIST":
+            yield from pending.values()
+            pending = {}
+            continue
+        if objClass not in ["CKO_CERTIFICATE", "CKO_NSS_TRUST"]:
+            continue
+
+        key = (obj["CKA_ISSUER"], obj["CKA_SERIAL_NUMBER"])
+        root = pending.pop(key, None) or Root(
+            label=obj.get("CKA_LABEL", ""), issuer=key[0], serial=key[1]
+        )
+        if objClass == "CKO_CERTIFICATE":
+            root.label = obj.get("CKA_LABEL", root.label)
+            root.der = obj["CKA_VALUE"]
+        else:
+            root.trust = {
+                purpose: obj[attribute]
+                for purpose, attribute in TRUST_PURPOSES.items()
+                if attribute in obj
+            }
+
+        if root.der is not None and root.trust is not None:
+            yield root
+        else:
+            pending[key] = root
+    yield from pending.values()
+
+
+def read_roots(path):
+    with open(path, "r", encoding="UTF-8") as inFile:
+        yield from pair_trust(parse_objects(inFile))
+
+
+def pem(der: bytes) -> str:
+    body = base64.b64encode(der).decode("ascii")
+    lines = [body[start : start + 64] for start in range(0, len(body), 64)]
+    return (
+        "-----BEGIN CERTIFICATE-----\n"
+        + "\n".join(lines)
+        + "\n-----END CERTIFICATE-----\n"
+    )
+
+
+def pem_name(label: str, taken: set) -> str:
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", label).strip("_") or "root"
+    name = f"{stem}.pem"
+    number = 2
+    while name in taken:
+        name = f"{stem}_{number}.pem"
+        number += 1
+    taken.add(name)
+    return name
+
+
+def wanted(root: Root, purpose=None) -> bool:
+    return root.der is not None and (purpose is None or root.trusted(purpose))
+
+
+def write_pem(path, der: bytes):
+    with open(path, "w") as outFile:
+        outFile.write(pem(der))
+
+
+# Writes one PEM per certificate into `directory`, `jobs` at a time. Names
+# are handed out in file order so they're the same from run to run, and no
+# more than a few writes per worker are queued, so the parse stays ahead
+# without reading the whole file first. Returns how many were written.
+def write_pems(roots, directory, *, purpose=None, jobs=4) -> int:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    taken = set()
+    written = 0
+    inFlight = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for root in roots:
+            if not wanted(root, purpose):
+                continue
+            if len(inFlight) >= jobs * 4:
+                inFlight.popleft().result()
+            path = directory / pem_name(root.label, taken)
+            inFlight.append(pool.submit(write_pem, path, root.der))
+            written += 1
+        for future in inFlight:
+            future.result()
+    return written
+
+
+def convert(path, directory, *, purpose=None, jobs=4) -> int:
+    return write_pems(read_roots(path), directory, purpose=purpose, jobs=jobs)
+
+
+def trust_summary(root: Root) -> tuple:
+    return tuple(sorted((root.trust or {}).items()))
+
+
+# Compares two certdata snapshots. Only a digest, label and trust summary of
+# the old one is kept while the new one streams past it. Yields
+# (change, label, old trust, new trust) with change one of "+", "-" or "~".
+def diff_roots(oldRoots, newRoots):
+    old = {root.key(): (root.label, trust_summary(root)) for root in oldRoots}
+    for root in newRoots:
+        before = old.pop(root.key(), None)
+        trust = trust_summary(root)
+        if before is None:
+            yield ("+", root.label, None, trust)
+        elif before[1] != trust:
+            yield ("~", root.label, before[1], trust)
+    for label, trust in old.values():
+        yield ("-", label, trust, None)
@@ -0,0 +1,304 @@
+import abc
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+CHECKLIST_FILE = (
+    Path(__file__).resolve().parent.parent / "nss-code-review-checklist.yaml"
+)
+DEFAULT_CACHE_FILE = Path.home() / ".nss-code-review-cache.json"
+DEFAULT_MAX_RESULTS = 5000
+
+
+@dataclass
+class Rule:
+    heading: str
+    text: str
+    check: str = None
+
+
+def digest(*parts) -> str:
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class Tree:
+    # The working directory as the checkers see it for one run. Each file is
+    # read and hashed, and each directory listed, once however many of the
+    # changed files share it (a gtest directory's manifests, say).
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.contents = {}
+        self.digests = {}
+        self.listings = {}
+
+    # None for a file that doesn't exist.
+    def read(self, path: str):
+        if path not in self.contents:
+            full = self.root / path
+            self.contents[path] = full.read_bytes() if full.is_file() else None
+        return self.contents[path]
+
+    def text(self, path: str) -> str:
+        return (self.read(path) or b"").decode("UTF-8", "replace")
+
+    def digest(self, path: str) -> str:
+        if path not in self.digests:
+            self.digests[path] = digest(self.read(path) or b"")
+        return self.digests[path]
+
+    def glob(self, directory: str, pattern: str) -> list:
+        key = (directory, pattern)
+        if key not in self.listings:
+            self.listings[key] = sorted(
+                path.relative_to(self.root).as_posix()
+                for path in (self.root / directory).glob(pattern)
+            )
+        return self.listings[key]
+
+
+class CheckerUnavailable(Exception):
+    pass
+
+
+class Checker(abc.ABC):
+    # Checks one changed file for one rule, reading through the Tree.
+    # Everything a checker reads has to come back from inputs(), since
+    # cached results are keyed on those files' contents.
+
+    name = None
+    version = "1"
+    patterns = ["*"]
+    statuses = "AM"
+
+    def applies(self, path: str, status: str) -> bool:
+        return status in self.statuses and any(
+            fnmatchcase(path, pattern) for pattern in self.patterns
+        )
+
+    def inputs(self, tree: Tree, path: str) -> list:
+        return [path]
+
+    # Returns a message for each problem found.
+    @abc.abstractmethod
+    def check(self, tree: Tree, path: str) -> list:
+        pass
+
+
+class ClangFormat(Checker):
+    name = "clang-format"
+    patterns = ["*.c", "*.cc", "*.cpp", "*.h"]
+
+    def __init__(self):
+        self.binary = shutil.which("clang-format")
+        self.binaryVersion = None
+
+    # Formatting changes between clang-format releases.
+    @property
+    def version(self):
+        if self.binary is None:
+            raise CheckerUnavailable("clang-format isn't installed")
+        if self.binaryVersion is None:
+            self.binaryVersion = subprocess.run(
+                [self.binary, "--version"], stdout=subprocess.PIPE, check=True
+            ).stdout.decode()
+        return self.binaryVersion
+
+    def inputs(self, tree, path):
+        return [path, ".clang-format"]
+
+    def check(self, tree, path):
+        content = tree.read(path)
+        formatted = subprocess.run(
+            [self.binary, "--style=file", f"--assume-filename={path}"],
+            input=content,
+            stdout=subprocess.PIPE,
+            cwd=tree.root,
+            check=True,
+        ).stdout
+        return [] if formatted == content else [f"{path} isn't clang-formatted"]
+
+
+class BuildManifests(Checker):
+    # New gtest sources have to be in both the Make (manifest.mn) and the
+    # Gyp build of their directory.
+    name = "build-manifests"
+    version = "2"
+    patterns = ["gtests/*.cc"]
+    statuses = "A"
+
+    def manifests(self, tree, path):
+        directory = Path(path).parent.as_posix()
+        return [f"{directory}/manifest.mn"] + tree.glob(directory, "*.gyp")
+
+    def inputs(self, tree, path):
+        return [path] + self.manifests(tree, path)
+
+    # Entries are separated by spaces, quotes, commas or line continuations;
+    # foo.cc isn't listed just because barfoo.cc or foo.cc.orig is.
+    def check(self, tree, path):
+        name = Path(path).name
+        entry = re.compile(rf"(?<![\w.-]){re.escape(name)}(?![\w.-])")
+        return [
+            f"{name} isn't in {manifest}"
+            for manifest in self.manifests(tree, path)
+            if not entry.search(tree.text(manifest))
+        ]
+
+
+class GtestRunners(Checker):
+    # A new gtest suite (a directory with its own .gyp) has to be run by
+    # tests/gtests/gtests.sh.
+    name = "gtest-runners"
+    patterns = ["gtests/*/*.gyp"]
+    statuses = "A"
+    script = "tests/gtests/gtests.sh"
+
+    def inputs(self, tree, path):
+        return [path, self.script]
+
+    def check(self, tree, path):
+        suite = Path(path).parent.name
+        if suite not in tree.text(self.script).split():
+            return [f"{suite} isn't run by {self.script}"]
+        return []
+
+
+CHECKERS = {
+    checker.name: checker
+    for checker in [ClangFormat(), BuildManifests(), GtestRunners()]
+}
+
+
+class ReviewCache:
+    # The parsed checklist, so a run doesn't need PyYAML unless the file
+    # changed, and each checker's findings keyed on the contents of the
+    # files it read, so re-reviewing a revised patch only checks what the
+    # revision touched.
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, *, max_results=DEFAULT_MAX_RESULTS):
+        self.path = Path(path)
+        self.max_results = max_results
+        self.checklist = {}
+        self.results = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            self.checklist = data.get("checklist", {})
+            self.results = data.get("results", {})
+
+    def save(self):
+        # Oldest first, so this keeps the most recent.
+        results = dict(list(self.results.items())[-self.max_results :])
+        with open(self.path, "w") as outFile:
+            json.dump({"checklist": self.checklist, "results": results}, outFile)
+
+
+def parse_checklist(data) -> list:
+    rules = []
+    for segment in data:
+        for heading, items in segment.items():
+            for item in items:
+                if isinstance(item, dict):
+                    ((text, options),) = item.items()
+                    rules.append(Rule(heading, text, (options or {}).get("check")))
+                else:
+                    rules.append(Rule(heading, item))
+    return rules
+
+
+def load_checklist(path=CHECKLIST_FILE, *, cache: ReviewCache = None) -> list:
+    raw = Path(path).read_bytes()
+    key = digest(raw)
+    if cache is not None and cache.checklist.get("digest") == key:
+        return [Rule(**rule) for rule in cache.checklist["rules"]]
+
+    import yaml
+
+    rules = parse_checklist(yaml.load(raw, Loader=yaml.BaseLoader))
+    for rule in rules:
+        if rule.check is not None and rule.check not in CHECKERS:
+            raise ValueError(f"Unknown checker {rule.check} for '{rule.text}'")
+    if cache is not None:
+        cache.checklist = {"digest": key, "rules": [vars(rule) for rule in rules]}
+    return rules
+
+
+def input_key(checker: Checker, tree: Tree, path: str, status: str) -> str:
+    parts = [checker.name, checker.version, status, path]
+    for inputPath in checker.inputs(tree, path):
+        parts += [inputPath, tree.digest(inputPath)]
+    return digest(*parts)
+
+
+@dataclass
+class CheckResult:
+    checked: int = 0
+    cached: int = 0
+    problems: list = None
+    unavailable: str = None
+
+
+# Runs every checker the rules name over the changed files ({path: status}
+# from hg status), `jobs` files at a time. Returns {checker name: CheckResult}.
+def run_checks(rules, changes: dict, *, root, cache: ReviewCache = None, jobs=4):
+    tree = Tree(root)
+    results = {}
+    work = []
+    for name in sorted({rule.check for rule in rules if rule.check}):
+        checker = CHECKERS[name]
+        result = results[name] = CheckResult(problems=[])
+        try:
+            checker.version
+        except CheckerUnavailable as e:
+            result.unavailable = str(e)
+            continue
+        for path, status in sorted(changes.items()):
+            if checker.applies(path, status):
+                result.checked += 1
+                work.append((result, checker, path, status))
+
+    # Cache lookups happen on the workers too, but the cache itself is only
+    # updated here.
+    def check(checker, path, status):
+        key = input_key(checker, tree, path, status)
+        if cache is not None and key in cache.results:
+            return key, cache.results[key], True
+        return key, checker.check(tree, path), False
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(check, *item[1:]) for item in work]
+        for (result, checker, path, _), future in zip(work, futures):
+            error = future.exception()
+            if error is not None:
+                # Not cached, so the next run tries again.
+                result.problems.append(f"{checker.name} failed on {path}: {error}")
+                continue
+            key, problems, cached = future.result()
+            result.problems += problems
+            result.cached += cached
+            if cache is not None:
+                # Re-inserted, so it counts as recent.
+                cache.results.pop(key, None)
+                cache.results[key] = problems
+    return results
+
+
+def changed_files(hgclient, revrange: str) -> dict:
+    # From before the first changeset in `revrange` to the working
+    # directory, which is what the checkers read.
+    base = f"p1(first({revrange}))"
+    return {
+        path.decode("UTF-8"): code.decode("UTF-8")
+        for code, path in hgclient.status(rev=[base], added=True, modified=True)
+    }
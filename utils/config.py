@@ -0,0 +1,57 @@
+import json
+from colorama import Fore
+from pathlib import Path
+
+
+def config_path() -> Path:
+    return Path.home() / ".nss-land-commit.json"
+
+
+def load_config() -> dict:
+    confFile = config_path()
+    if not confFile.exists():
+        return {}
+    with open(confFile, "r") as conf:
+        return json.load(conf)
+
+
+def add_bugzilla_options(parser):
+    parser.add_option(
+        "--bugzilla",
+        default="bugzilla.mozilla.org",
+        help="Bugzilla host or REST url, e.g. a local stand-in for testing",
+    )
+    parser.add_option(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Talk to Bugzilla's REST API over asyncio instead of python-bugzilla",
+    )
+
+
+def connect_bugzilla(options):
+    config = load_config()
+    if "api_key" not in config:
+        print(
+            Fore.YELLOW
+            + f"Note: Not logging into Bugzilla. BZ actions won't work. Make a file at {config_path()}"
+        )
+        print(Fore.YELLOW + "with contents like:")
+        print(json.dumps({"api_key": "random_api_key_1e87d00d1c2fb"}))
+
+    if options.use_async:
+        from utils.asyncbz import BackgroundBugzilla
+
+        return BackgroundBugzilla(
+            options.bugzilla,
+            api_key=config.get("api_key"),
+            connections=max(1, getattr(options, "jobs", 4)),
+        )
+
+    # python-bugzilla pulls in requests and friends, which costs more than
+    # everything else the tools import put together.
+    import bugzilla
+
+    if "api_key" not in config:
+        return bugzilla.Bugzilla(options.bugzilla)
+    return bugzilla.Bugzilla(options.bugzilla, api_key=config["api_key"])
@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+
+from utils.repo import stream_log
+
+INDEX_VERSION = 2
+
+
+def quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class ContributorsList:
+    def __init__(self):
+        self.authors = {}
+
+    def observe(self, author, previousRelease=False):
+        if not author in self.authors or previousRelease:
+            self.authors[author] = previousRelease
+
+    def observe_index(self, index, *, rev: str):
+        for author in index.seen_in(self.authors, rev):
+            self.observe(author, previousRelease=True)
+
+    def list(self, *, limitToNewContributors=True):
+        if limitToNewContributors:
+            return filter(lambda x: self.authors[x] is False, self.authors)
+        return self.authors
+
+
+class AuthorIndex:
+    # Maps every author to the first changeset they appear in (rev and node),
+    # persisted per repository so that each release only has to scan the
+    # changesets that landed since the last one.
+
+    def __init__(self, hgclient, path=None):
+        self.root = hgclient.root()
+        self.path = Path(
+            path or Path(self.root.decode("UTF-8")) / ".hg" / "nss-authors.json"
+        )
+        self.heads = []
+        self.authors = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            if data.get("version") == INDEX_VERSION:
+                self.heads = data["heads"]
+                self.authors = data["authors"]
+
+    def rev(self, rev: str) -> int:
+        for line in stream_log(self.root, revrange=rev, template="{rev}\n"):
+            return int(line)
+        return -1
+
+    def update(self, rev: str) -> int:
+        if self.heads and not self.known(self.heads):
+            # Something we indexed was stripped; start over.
+            self.heads = []
+            self.authors = {}
+
+        revrange = f"ancestors({rev})"
+        if self.heads:
+            revrange += f" - ancestors({' + '.join(self.heads)})"
+
+        scanned = 0
+        for line in stream_log(
+            self.root,
+            revrange=f"sort({revrange}, rev)",
+            template="{rev}\\0{node}\\0{author}\n",
+        ):
+            number, node, author = line.split(b"\0", 2)
+            author = author.decode("UTF-8", errors="replace")
+            if author not in self.authors or int(number) < self.authors[author][0]:
+                self.authors[author] = [int(number), node.decode("UTF-8")]
+            scanned += 1
+
+        heads = " + ".join(self.heads + [rev])
+        self.heads = [
+            line.decode("UTF-8")
+            for line in stream_log(
+                self.root, revrange=f"heads(ancestors({heads}))", template="{node}\n"
+            )
+        ]
+        return scanned
+
+    def known(self, nodes) -> bool:
+        found = stream_log(
+            self.root,
+            revrange=" + ".join(f"present({node})" for node in nodes),
+            template="{node}\n",
+        )
+        return len(list(found)) == len(nodes)
+
+    # Which of `authors` have a changeset among the ancestors of `rev`
+    # (inclusive). A revision number can only rule that out: off a linear
+    # history, an older changeset needn't be an ancestor. So ancestry is
+    # asked of each author's first changeset, and only the authors whose
+    # first one isn't an ancestor have the rest of theirs looked for.
+    def seen_in(self, authors, rev: str) -> set:
+        limit = self.rev(f"max({rev})")
+        candidates = {
+            author: self.authors[author][1]
+            for author in authors
+            if author in self.authors and self.authors[author][0] <= limit
+        }
+        if not candidates:
+            return set()
+
+        firsts = {node: author for author, node in candidates.items()}
+        seen = {
+            firsts[line.decode("UTF-8")]
+            for line in stream_log(
+                self.root,
+                revrange=f"({' + '.join(firsts)}) and ::({rev})",
+                template="{node}\n",
+            )
+        }
+
+        # author() matches substrings, so its answers are checked exactly.
+        rest = [author for author in candidates if author not in seen]
+        if rest:
+            matches = " or ".join(f"author({quote(author)})" for author in rest)
+            for line in stream_log(
+                self.root,
+                revrange=f"::({rev}) and ({matches})",
+                template="{author}\n",
+            ):
+                author = line.decode("UTF-8", errors="replace")
+                if author in candidates:
+                    seen.add(author)
+        return seen
+
+    def save(self):
+        with open(self.path, "w") as outFile:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "heads": self.heads,
+                    "authors": self.authors,
+                },
+                outFile,
+            )
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# A tiny stand-in for the Bugzilla REST API, good enough to point the tools at
+# with `--bugzilla http://127.0.0.1:8800/rest/`. It serves bugs from a JSON
+# file of the form {"bugs": [{"id": 1, "product": "NSS", ...}, ...]} and
+# counts every request it answers, so you can see how many round trips a run
+# made. `GET /__stats__` returns the counters.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from optparse import OptionParser
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeBugzilla:
+    def __init__(self, bugs=None, *, delay=0.0):
+        self.bugs = {int(bug["id"]): dict(bug) for bug in bugs or []}
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.requests_by_path = {}
+
+    def record(self, method, path):
+        with self.lock:
+            self.requests += 1
+            key = f"{method} {path}"
+            self.requests_by_path[key] = self.requests_by_path.get(key, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "by_path": dict(self.requests_by_path)}
+
+    def project(self, bug, include_fields):
+        if not include_fields:
+            return dict(bug)
+        return {k: v for k, v in bug.items() if k in include_fields or k == "id"}
+
+    def get_bugs(self, ids, include_fields):
+        found = []
+        for bug_id in ids:
+            bug = self.bugs.get(int(bug_id))
+            if bug is not None:
+                found.append(self.project(bug, include_fields))
+        return found
+
+    def update_bugs(self, ids, changes):
+        results = []
+        for bug_id in ids:
+            bug = self.bugs.setdefault(int(bug_id), {"id": int(bug_id)})
+            for field in ["status", "resolution", "target_milestone"]:
+                if field in changes:
+                    bug[field] = changes[field]
+            if "comment" in changes:
+                bug.setdefault("comments", []).append(changes["comment"])
+            bug["last_change_time"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            results.append({"id": int(bug_id), "changes": {}})
+        return {"bugs": results}
+
+
+def _fields(query):
+    fields = []
+    for value in query.get("include_fields", []):
+        fields.extend(f for f in value.split(",") if f)
+    return fields
+
+
+def make_handler(fake: FakeBugzilla):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; with Nagle on, each
+        # reply on a kept-alive connection waits out the client's delayed ACK.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, code, payload):
+            body = json.dumps(payload).encode("UTF-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self, method):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = [p for p in url.path.split("/") if p]
+
+            if parts == ["__stats__"]:
+                return self.reply(200, fake.stats())
+
+            fake.record(method, "/".join(parts[:2]))
+            if fake.delay:
+                time.sleep(fake.delay)
+
+            if parts and parts[0] == "rest":
+                parts = parts[1:]
+
+            if parts == ["version"]:
+                return self.reply(200, {"version": "5.0.4"})
+            if parts == ["user"]:
+                return self.reply(200, {"users": [{"id": 1, "name": "fake"}]})
+            if parts == ["bug"] and method == "GET":
+                ids = []
+                for value in query.get("id", []):
+                    ids.extend(v for v in value.split(",") if v)
+                return self.reply(
+                    200, {"bugs": fake.get_bugs(ids, _fields(query)), "faults": []}
+                )
+            if len(parts) == 2 and parts[0] == "bug" and method == "GET":
+                bugs = fake.get_bugs([parts[1]], _fields(query))
+                if not bugs:
+                    return self.reply(
+                        404,
+                        {
+                            "error": True,
+                            "code": 101,
+                            "message": f"Bug #{parts[1]} does not exist.",
+                        },
+                    )
+                return self.reply(200, {"bugs": bugs, "faults": []})
+            if len(parts) == 3 and parts[0] == "bug" and parts[2] == "comment":
+                bug = fake.bugs.get(int(parts[1]), {})
+                comments = [{"text": c} for c in bug.get("comments", [])]
+                return self.reply(200, {"bugs": {parts[1]: {"comments": comments}}})
+            if len(parts) == 2 and parts[0] == "bug" and method == "PUT":
+                length = int(self.headers.get("Content-Length", 0))
+                changes = json.loads(self.rfile.read(length) or b"{}")
+                ids = changes.pop("ids", [parts[1]])
+                return self.reply(200, fake.update_bugs(ids, changes))
+
+            return self.reply(
+                404, {"error": True, "code": 32614, "message": "Unknown method"}
+            )
+
+        def do_GET(self):
+            self.route("GET")
+
+        def do_PUT(self):
+            self.route("PUT")
+
+    return Handler
+
+
+# The default listen backlog of 5 drops connections when clients open several
+# at once, and each dropped one waits a second for the SYN to be resent.
+class Server(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+def serve(fake: FakeBugzilla, *, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    server = Server((host, port), make_handler(fake))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] bugs.json")
+    parser.add_option("-p", "--port", type="int", default=8800)
+    parser.add_option(
+        "-d", "--delay", type="float", default=0.0, help="seconds to sleep per request"
+    )
+
+    (options, args) = parser.parse_args()
+
+    bugs = []
+    if args:
+        with open(args[0], "r") as inFile:
+            bugs = json.load(inFile)["bugs"]
+
+    fake = FakeBugzilla(bugs, delay=options.delay)
+    server = serve(fake, port=options.port)
+    print(f"Fake Bugzilla serving {len(fake.bugs)} bugs at")
+    print(f"  http://127.0.0.1:{server.server_address[1]}/rest/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
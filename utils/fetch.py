@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_JOBS = 4
+DEFAULT_RATE = 10.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchExecutor:
+    # Runs Bugzilla requests on a bounded pool, at most `rate` per second,
+    # and records how long each one took. Results come back in the order the
+    # items were given, whatever order the requests finish in.
+
+    def __init__(self, *, jobs=DEFAULT_JOBS, rate=None):
+        self.jobs = jobs
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+        self.bucket = TokenBucket(rate, burst=jobs) if rate else None
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def call(self, label, func, item):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        start = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.setdefault(label, []).append(elapsed)
+
+    # Returns [(result, exception)] in the order of `items`.
+    def map(self, label, func, items) -> list:
+        futures = [self.pool.submit(self.call, label, func, item) for item in items]
+        results = []
+        for future in futures:
+            error = future.exception()
+            results.append((None, error) if error else (future.result(), None))
+        return results
+
+    def stats(self) -> dict:
+        stats = {}
+        with self.lock:
+            for label, latencies in self.latencies.items():
+                ordered = sorted(latencies)
+                stats[label] = {
+                    "count": len(ordered),
+                    "total": sum(ordered),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    "max": ordered[-1],
+                }
+        return stats
+
+    def summary(self) -> str:
+        lines = []
+        for label, s in self.stats().items():
+            lines.append(
+                f"{label}: {s['count']} requests, {s['total']:.2f}s total, "
+                f"p50 {s['p50'] * 1000:.0f}ms, p95 {s['p95'] * 1000:.0f}ms, "
+                f"max {s['max'] * 1000:.0f}ms"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+# Runs func(*args) on a thread of its own, so a tool can get on with hg work
+# while Bugzilla answers. Call .result() on what it returns to wait for it.
+def background(func, *args) -> Future:
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(func, *args)
+    pool.shutdown(wait=False)
+    return future
+
+
+def add_fetch_options(parser):
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        default=DEFAULT_JOBS,
+        help=f"Concurrent Bugzilla requests (default {DEFAULT_JOBS})",
+    )
+    parser.add_option(
+        "--rate",
+        type="float",
+        default=DEFAULT_RATE,
+        help=f"Max Bugzilla requests per second, 0 for no limit (default {DEFAULT_RATE:g})",
+    )
+
+
+def open_executor(options) -> FetchExecutor:
+    return FetchExecutor(jobs=max(1, options.jobs), rate=options.rate or None)
@@ -0,0 +1,334 @@
+import hashlib
+import heapq
+import json
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+DEFAULT_TIMINGS_FILE = Path.home() / ".nss-gtest-timings.json"
+DEFAULT_RESULTS_FILE = Path.home() / ".nss-gtest-results.json"
+RESULTS_VERSION = 1
+
+# Builds and settings whose passes are remembered; older ones are dropped.
+MAX_RESULT_SETS = 8
+
+# NSS dlopens softoken, freebl and the builtins, so everything like a shared
+# library in the lib directory counts, not just what the binary links.
+LIBRARY_SUFFIXES = [".so", ".dylib", ".dll", ".chk"]
+
+# The environment a test run depends on, besides the binary and libraries.
+ENV_PREFIXES = ["NSS_", "NSPR_", "SSL"]
+
+# Tests at least this slow are what -f leaves out.
+DEFAULT_SLOW_SECONDS = 1.0
+
+# What nss-ssl-gtests.sh -f has always skipped; only used until there are
+# recorded timings to go by.
+DEFAULT_SLOW_TESTS = [
+    "*.AlertBeforeServerHello/*",
+    "*.ConnectWithExpiredTicket*",
+    "*.HrrThenRemoveKeyShare/1",
+    "*.HrrThenRemoveSignatureAlgorithms/1",
+    "*.HrrThenRemoveSupportedGroups/1",
+    "*.KeyLogFile/*",
+    "*.ReplaceFirstClientRecordWithApplicationData/*",
+    "*.ReplaceFirstServerRecordWithApplicationData/*",
+    "*.RetryCookieEmpty/1",
+    "*.RetryCookieWithExtras/1",
+    "*.RetryStatefulDropCookie/1",
+    "*.ServerAuthBiggestRsa/*",
+    "*.WeakDHGroup/*",
+    "*/TlsCipherSuiteTest.*",
+    "*/TlsSignatureSchemeConfiguration.*",
+    "DatagramDrop13/*",
+    "DatagramPre13/TlsConnectDatagramPre13.*",
+    "TLSVersionRanges/*",
+    "TlsConnectDatagram13.AuthCompleteBeforeFinished",
+    "TlsConnectStreamTls13.TimePassesByDefault",
+]
+
+
+def parse_test_list(output: str) -> list:
+    tests = []
+    suite = None
+    for line in output.splitlines():
+        # Parameterized tests carry a "# GetParam() = ..." comment.
+        name = line.split("#")[0].rstrip()
+        if not name:
+            continue
+        if not name.startswith(" "):
+            suite = name.strip()
+        elif suite is not None:
+            tests.append(suite + name.strip())
+    return tests
+
+
+def list_tests(command, *, env=None, gtest_filter="*") -> list:
+    output = subprocess.run(
+        [*command, "--gtest_list_tests", f"--gtest_filter={gtest_filter}"],
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout.decode("UTF-8", "replace")
+    return parse_test_list(output)
+
+
+class Timings:
+    # How long each test took, smoothed over runs, per test binary.
+
+    def __init__(self, path=DEFAULT_TIMINGS_FILE, *, binary="ssl_gtest"):
+        self.path = Path(path)
+        self.binary = binary
+        self.data = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                self.data = json.load(inFile)
+        self.tests = self.data.setdefault(binary, {})
+        self.typical = None
+
+    def __contains__(self, test):
+        return test in self.tests
+
+    def __len__(self):
+        return len(self.tests)
+
+    # Tests that haven't run before count as a typical one.
+    def estimate(self, test: str) -> float:
+        if test in self.tests:
+            return self.tests[test]
+        if not self.tests:
+            return 1.0
+        if self.typical is None:
+            ordered = sorted(self.tests.values())
+            self.typical = ordered[len(ordered) // 2]
+        return self.typical
+
+    def record(self, test: str, seconds: float):
+        self.typical = None
+        previous = self.tests.get(test)
+        self.tests[test] = seconds if previous is None else (previous + seconds) / 2
+
+    def slow(self, threshold=DEFAULT_SLOW_SECONDS) -> list:
+        return sorted(
+            test for test, seconds in self.tests.items() if seconds >= threshold
+        )
+
+    def save(self):
+        with open(self.path, "w") as outFile:
+            json.dump(self.data, outFile, indent=1, sort_keys=True)
+
+
+# Longest first onto whichever shard has the least work so far; the slowest
+# shard decides when the run ends. Returns [[test, ...], ...].
+def balance(tests, timings: Timings, shards: int) -> list:
+    loads = [(0.0, index) for index in range(shards)]
+    assigned = [[] for _ in range(shards)]
+    for test in sorted(tests, key=lambda test: -timings.estimate(test)):
+        load, index = heapq.heappop(loads)
+        assigned[index].append(test)
+        heapq.heappush(loads, (load + timings.estimate(test), index))
+    return [shard for shard in assigned if shard]
+
+
+# gtest's own sharding: the nth test that passes the filter goes to shard
+# n % total.
+def round_robin(tests, shards: int) -> list:
+    return [tests[index::shards] for index in range(shards) if tests[index::shards]]
+
+
+def makespan(assigned, timings: Timings) -> float:
+    return max(
+        (sum(timings.estimate(test) for test in shard) for shard in assigned),
+        default=0.0,
+    )
+
+
+class Shard:
+    def __init__(self, *, index, total, tests, workdir):
+        self.index = index
+        self.total = total
+        self.tests = tests
+        self.xml = Path(workdir) / f"shard-{index}.xml"
+        self.log = Path(workdir) / f"shard-{index}.log"
+        self.returncode = None
+
+    # With timings, a shard's tests are spelled out in a flag file, since
+    # thousands of names don't fit in one argument. Without, gtest picks
+    # its share of `gtest_filter` from the GTEST_SHARD_* variables.
+    def command(self, command, gtest_filter):
+        args = [*command, f"--gtest_output=xml:{self.xml}"]
+        if self.tests is None:
+            return args + [f"--gtest_filter={gtest_filter}"]
+        flagFile = self.xml.with_suffix(".flags")
+        flagFile.write_text(f"--gtest_filter={':'.join(self.tests)}\n")
+        return args + [f"--gtest_flagfile={flagFile}"]
+
+    def env(self, env):
+        env = dict(env if env is not None else os.environ)
+        if self.tests is None:
+            env["GTEST_TOTAL_SHARDS"] = str(self.total)
+            env["GTEST_SHARD_INDEX"] = str(self.index)
+        return env
+
+    def run(self, command, *, env=None, gtest_filter="*"):
+        with open(self.log, "wb") as logFile:
+            self.returncode = subprocess.run(
+                self.command(command, gtest_filter),
+                env=self.env(env),
+                stdout=logFile,
+                stderr=subprocess.STDOUT,
+            ).returncode
+        return self
+
+
+SUM_ATTRIBUTES = ["tests", "failures", "disabled", "skipped", "errors"]
+
+
+# One <testsuites> from the shards' XML, with each suite's cases gathered
+# under one <testsuite> and the counts added up. The time is the wall time
+# of the whole run, not the sum over shards.
+def merge_results(paths, *, elapsed: float) -> ET.Element:
+    merged = ET.Element("testsuites", name="AllTests")
+    suites = {}
+    for path in paths:
+        root = ET.parse(path).getroot()
+        merged.attrib.setdefault("timestamp", root.get("timestamp", ""))
+        for suite in root.findall("testsuite"):
+            target = suites.get(suite.get("name"))
+            if target is None:
+                target = suites[suite.get("name")] = ET.SubElement(
+                    merged, "testsuite", dict(suite.attrib)
+                )
+                target.extend(suite)
+                continue
+            for attribute in SUM_ATTRIBUTES + ["time"]:
+                if attribute in suite.attrib:
+                    total = float(target.get(attribute, 0)) + float(
+                        suite.get(attribute)
+                    )
+                    target.set(
+                        attribute,
+                        f"{total:.3f}" if attribute == "time" else str(int(total)),
+                    )
+            target.extend(suite)
+
+    for attribute in SUM_ATTRIBUTES:
+        merged.set(
+            attribute, str(sum(int(s.get(attribute, 0)) for s in suites.values()))
+        )
+    merged.set("time", f"{elapsed:.3f}")
+    return merged
+
+
+def test_cases(merged: ET.Element):
+    for suite in merged.findall("testsuite"):
+        for case in suite.findall("testcase"):
+            yield f"{suite.get('name')}.{case.get('name')}", case
+
+
+class ResultCache:
+    # Which tests passed, by a digest of what they ran with: the binary, the
+    # libraries next to it, the database it was given, its other arguments
+    # and the NSS environment. A run with the same inputs replays those
+    # passes and only runs the rest. Files are only hashed again when their
+    # size or mtime moves.
+
+    def __init__(self, path=DEFAULT_RESULTS_FILE):
+        self.path = Path(path)
+        self.files = {}
+        self.results = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            if data.get("version") == RESULTS_VERSION:
+                self.files = data["files"]
+                self.results = data["results"]
+
+    def file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        stored = self.files.get(key)
+        if stored is not None and stored[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return stored[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as inFile:
+            for block in iter(lambda: inFile.read(1 << 20), b""):
+                digest.update(block)
+        self.files[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def inputs(self, command, *, env, lib_dir=None) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.file_digest(Path(command[0])).encode())
+        if lib_dir is not None and Path(lib_dir).is_dir():
+            for path in sorted(Path(lib_dir).iterdir()):
+                if path.suffix in LIBRARY_SUFFIXES and path.is_file():
+                    digest.update(f"{path.name} {self.file_digest(path)}\n".encode())
+
+        # The database directory's name changes with every test setup run,
+        # so it's what's in it that counts.
+        args = iter(command[1:])
+        for arg in args:
+            if arg == "-d":
+                db = Path(next(args, "."))
+                for path in sorted(db.iterdir()) if db.is_dir() else []:
+                    if path.is_file():
+                        digest.update(
+                            f"db {path.name} {self.file_digest(path)}\n".encode()
+                        )
+            else:
+                digest.update(f"arg {arg}\n".encode())
+
+        env = env if env is not None else os.environ
+        for name in sorted(env):
+            if any(name.startswith(prefix) for prefix in ENV_PREFIXES):
+                digest.update(f"env {name}={env[name]}\n".encode())
+        return digest.hexdigest()
+
+    def passed(self, inputs: str) -> set:
+        return set(self.results.get(inputs, []))
+
+    def record(self, inputs: str, *, passed, failed):
+        tests = self.passed(inputs)
+        tests.update(passed)
+        tests.difference_update(failed)
+        self.results.pop(inputs, None)
+        self.results[inputs] = sorted(tests)
+        while len(self.results) > MAX_RESULT_SETS:
+            del self.results[next(iter(self.results))]
+
+    def save(self):
+        with open(self.path, "w") as outFile:
+            json.dump(
+                {
+                    "version": RESULTS_VERSION,
+                    "files": self.files,
+                    "results": self.results,
+                },
+                outFile,
+            )
+
+
+# Passes replayed from the cache go in the merged results as run tests with
+# result="cached", so the XML still covers everything the filter picked.
+def add_cached(merged: ET.Element, tests):
+    suites = {suite.get("name"): suite for suite in merged.findall("testsuite")}
+    for test in tests:
+        suiteName, _, name = test.partition(".")
+        suite = suites.get(suiteName)
+        if suite is None:
+            suite = suites[suiteName] = ET.SubElement(
+                merged, "testsuite", name=suiteName, tests="0", time="0.000"
+            )
+        ET.SubElement(
+            suite,
+            "testcase",
+            name=name,
+            status="run",
+            result="cached",
+            time="0",
+            classname=suiteName,
+        )
+        suite.set("tests", str(int(suite.get("tests", 0)) + 1))
+    merged.set("tests", str(int(merged.get("tests", 0)) + len(tests)))
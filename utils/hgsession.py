@@ -0,0 +1,87 @@
+import os
+import threading
+from multiprocessing.connection import AuthenticationError, Client
+from pathlib import Path
+
+
+def socket_path() -> Path:
+    return Path(os.environ.get("NSS_HGD_SOCKET", Path.home() / ".nss-hgd.sock"))
+
+
+def key_path(socket: Path) -> Path:
+    return socket.with_suffix(".key")
+
+
+class DaemonSession:
+    # One connection to nss-hgd. Requests are (op, args...) tuples and
+    # replies are ("ok", value), ("error", exception) or ("command-error",
+    # CommandError args), since hglib's CommandError doesn't unpickle.
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def request(self, op, *args):
+        with self.lock:
+            self.conn.send((op, *args))
+            status, value = self.conn.recv()
+        if status == "command-error":
+            import hglib
+
+            raise hglib.error.CommandError(*value)
+        if status == "error":
+            raise value
+        return value
+
+
+_session = None
+
+
+def daemon():
+    global _session
+    if _session is None:
+        socket = socket_path()
+        try:
+            authkey = key_path(socket).read_bytes()
+            _session = DaemonSession(
+                Client(str(socket), family="AF_UNIX", authkey=authkey)
+            )
+        except (OSError, EOFError, AuthenticationError):
+            _session = False
+    return _session or None
+
+
+class RemoteRepo:
+    # Quacks like an hglib client, but each call runs on the daemon's warm
+    # command server for this repository.
+
+    def __init__(self, session: DaemonSession, root: bytes):
+        self.session = session
+        self._root = root
+
+    def root(self):
+        return self._root
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            return self.session.request("call", self._root, name, args, kwargs)
+
+        return call
+
+    def close(self):
+        pass
+
+
+# hglib is only loaded once a tool opens a repository, not for --help.
+def open_repo(path="."):
+    import hglib
+
+    session = daemon()
+    if session is not None:
+        try:
+            root = session.request("open", os.path.abspath(path))
+            return RemoteRepo(session, root)
+        except (OSError, EOFError):
+            global _session
+            _session = False
+    return hglib.open(path)
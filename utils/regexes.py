@@ -2,8 +2,30 @@ import re
 
 RE_bugnum = r"[Bb]ug (?P<bug>[0-9]+)"
 RE_reviewers = r" (?P<reviewers>r[?=].*)+"
+RE_patch = r"[Bb]ug (?P<bug>[0-9]+)[ ,-]*(?P<desc>.+) +(?P<reviewers>r[?=].*)* *(?P<approvers>a=.*)*"
 RE_backout = r"(backout|back.* out|Back.* out|Backout)"
+RE_backout_std = r"[Bb]acked out changeset (?P<changeset>[a-z0-9]+).*"
 RE_backout_template = r"[Bb]acked out changeset (?P<changeset>[a-z0-9]+) \([Bb]ug (?P<bug>[0-9]+)\) for (?P<reason>.+)"
 RE_nss_version = r'#define NSS_VERSION "(?P<version>[0-9.]+)"'
 RE_nspr_version = r'#define PR_VERSION +"(?P<version>[0-9.]+).*"'
 RE_tag = r"Added tag (?P<tag>[A-Z0-9_]+) for changeset (?P<changeset>[a-z0-9]+)"
+
+RX_patch = re.compile(RE_patch)
+RX_backout = re.compile(RE_backout)
+RX_backout_std = re.compile(RE_backout_std)
+RX_backout_template = re.compile(RE_backout_template)
+RX_nss_version = re.compile(RE_nss_version)
+RX_nspr_version = re.compile(RE_nspr_version)
+RX_tag = re.compile(RE_tag)
+
+# The patterns above in one pass, as Patch used to try them: a backout (in
+# the sheriffs' format, then the plain one, then anything else RE_backout
+# takes), then a tag, then a patch. Whichever alternative matched is
+# m.lastgroup, since the outer group closes last.
+RX_headline = re.compile(
+    r"(?P<backout_template>[Bb]acked out changeset (?P<backout_changeset>[a-z0-9]+) \([Bb]ug (?P<backout_bug>[0-9]+)\) for (?P<reason>.+))"
+    r"|(?P<backout_std>[Bb]acked out changeset (?P<std_changeset>[a-z0-9]+).*)"
+    r"|(?P<backout>backout|back.* out|Back.* out|Backout)"
+    r"|(?P<tagged>Added tag (?P<tag>[A-Z0-9_]+) for changeset (?P<tag_changeset>[a-z0-9]+))"
+    r"|(?P<patch>[Bb]ug (?P<bug>[0-9]+)[ ,-]*(?P<desc>.+) +(?P<reviewers>r[?=].*)* *(?P<approvers>a=.*)*)"
+)
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+from collections import namedtuple
+from datetime import datetime
+
+from utils.hgsession import daemon
+from utils.trace import span
+
+# The same shape as the tuples hglib.log() returns, so Patch takes either.
+# Fields that weren't asked for are None; with "headline" rather than "desc",
+# desc only holds the first line of the message.
+Revision = namedtuple(
+    "Revision",
+    ["rev", "node", "tags", "branch", "author", "desc", "date"],
+    defaults=[None] * 7,
+)
+
+TEMPLATES = {
+    "rev": ("rev", "{rev|json}"),
+    "node": ("node", "{node|json}"),
+    "tags": ("tags", "{join(tags, ' ')|json}"),
+    "branch": ("branch", "{branch|json}"),
+    "author": ("author", "{author|json}"),
+    "desc": ("desc", "{desc|json}"),
+    "headline": ("desc", "{desc|firstline|json}"),
+    "date": ("date", "{date|hgdate|json}"),
+}
+
+PATCH_FIELDS = ["rev", "node", "author", "headline", "date"]
+
+
+# hglib's command server buffers a command's whole output before returning
+# it, so for history-sized logs run hg directly and yield lines as they come.
+# With nss-hgd running, hg's startup costs more than the buffering does, so
+# the daemon's warm command server runs it instead.
+# Styles like "changelog" print less under -q, so they need quiet=False.
+def stream_log(root, *, revrange: str, template: str, command="log", quiet=True):
+    # For --trace, the span includes whatever the caller does between lines.
+    with span("hg", command, revrange) as current:
+        current["bytes"] = 0
+        for line in _stream_log(
+            root, revrange=revrange, template=template, command=command, quiet=quiet
+        ):
+            current["bytes"] += len(line) + 1
+            yield line
+
+
+def _stream_log(root, *, revrange: str, template: str, command, quiet):
+    import hglib
+
+    args = [command, *(["-q"] if quiet else []), "-r", revrange, "-T", template]
+    session = daemon()
+    if session is not None:
+        root = session.request("open", os.fsdecode(root))
+        returncode, out, err = session.request("run", root, args)
+        yield from out.splitlines()
+    else:
+        env = dict(os.environ, HGPLAIN="1")
+        with subprocess.Popen(
+            [hglib.HGPATH, *args],
+            cwd=root,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as proc:
+            for line in proc.stdout:
+                yield line.rstrip(b"\n")
+            err = proc.stderr.read()
+        returncode = proc.returncode
+
+    # outgoing exits 1 when there's nothing to push.
+    if returncode and not (command == "outgoing" and returncode == 1):
+        raise hglib.error.CommandError(args, returncode, b"", err)
+
+
+# hg gets a revset as one argument, which Linux caps at 128 KiB, so a list of
+# nodes for stream_log goes in several revsets.
+def node_revsets(nodes: list, *, size=1000):
+    for start in range(0, len(nodes), size):
+        yield " + ".join(nodes[start : start + size])
+
+
+def stream_revisions(root, *, revrange: str, fields=PATCH_FIELDS, command="log"):
+    names = [TEMPLATES[field][0] for field in fields]
+    template = "[" + ",".join(TEMPLATES[field][1] for field in fields) + "]\n"
+
+    for line in stream_log(root, revrange=revrange, template=template, command=command):
+        values = {}
+        for name, value in zip(names, json.loads(line)):
+            if name == "date":
+                value = datetime.fromtimestamp(float(value.split(" ")[0]))
+            else:
+                value = str(value).encode(encoding="UTF-8")
+            values[name] = value
+        yield Revision(**values)
@@ -0,0 +1,105 @@
+import json
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass
+
+SEVERITIES = ["fatal", "warn", "ignore"]
+
+
+@dataclass
+class Finding:
+    severity: str
+    rule: str
+    message: str
+    patch: str = None
+    bug: int = None
+
+
+def load_policy(path) -> dict:
+    if path is None:
+        return {}
+    with open(path, "r") as inFile:
+        policy = json.load(inFile)
+    for rule, severity in policy.items():
+        if severity not in SEVERITIES:
+            raise Exception(f"Unknown severity {severity} for rule {rule}")
+    return policy
+
+
+def write_json(findings: list, outFile, *, tool: str, patches=()):
+    json.dump(
+        {
+            "tool": tool,
+            "failed": any(f.severity == "fatal" for f in findings),
+            "patches": list(patches),
+            "findings": [asdict(f) for f in findings],
+        },
+        outFile,
+        indent=2,
+    )
+
+
+# One testcase per reviewed patch, findings or not, plus one for findings
+# that aren't about a patch; failing if it has fatal findings. Warnings go in
+# system-out.
+def write_junit(findings: list, outFile, *, tool: str, patches=()):
+    cases = {patch: [] for patch in patches}
+    for finding in findings:
+        cases.setdefault(finding.patch or "general", []).append(finding)
+
+    suite = ET.Element(
+        "testsuite",
+        name=tool,
+        tests=str(len(cases)),
+        failures=str(
+            sum(
+                any(f.severity == "fatal" for f in caseFindings)
+                for caseFindings in cases.values()
+            )
+        ),
+    )
+    for name, caseFindings in cases.items():
+        case = ET.SubElement(suite, "testcase", classname=tool, name=name)
+        for finding in caseFindings:
+            if finding.severity == "fatal":
+                failure = ET.SubElement(case, "failure", type=finding.rule)
+                failure.set("message", finding.message)
+        warnings = [f for f in caseFindings if f.severity != "fatal"]
+        if warnings:
+            ET.SubElement(case, "system-out").text = "\n".join(
+                f"[{f.rule}] {f.message}" for f in warnings
+            )
+
+    outFile.write(ET.tostring(suite, encoding="unicode"))
+    outFile.write("\n")
+
+
+REPORT_FORMATS = {"json": write_json, "junit": write_junit}
+
+
+def write_report(findings: list, path, *, format="json", tool: str, patches=()):
+    with open(path, "w") as outFile:
+        REPORT_FORMATS[format](findings, outFile, tool=tool, patches=patches)
+
+
+def add_batch_options(parser):
+    parser.add_option(
+        "--batch",
+        action="store_true",
+        help="Don't prompt; collect findings and write a report at the end",
+    )
+    parser.add_option("--report", help="Where to write the --batch report")
+    parser.add_option(
+        "--report-format",
+        choices=list(REPORT_FORMATS),
+        default="json",
+        help="json or junit (default json)",
+    )
+    parser.add_option(
+        "--yes",
+        action="store_true",
+        help="With --batch, go ahead with actions like updating bugs if nothing failed",
+    )
+    parser.add_option(
+        "--policy",
+        help='JSON file mapping rules to severities, e.g. {"no-reviewers": "fatal"}',
+    )
@@ -0,0 +1,76 @@
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+STATE_VERSION = 1
+
+
+class ReviewState:
+    # What the last nss-release-review --incremental run worked out, per
+    # repository: for each changeset the version it's against and the
+    # findings for its bug, and for each bug the fields the review reads.
+    # A re-run only looks up versions for new changesets and only refetches
+    # bugs whose last_change_time moved; the rest is replayed from here so
+    # the output still covers the whole range.
+
+    def __init__(self, hgclient, path=None):
+        self.path = Path(
+            path
+            or Path(hgclient.root().decode("UTF-8")) / ".hg" / "nss-release-review.json"
+        )
+        self.patches = {}
+        self.bugs = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            if data.get("version") == STATE_VERSION:
+                self.patches = data["patches"]
+                self.bugs = data["bugs"]
+
+    def unchanged(self, fetcher, bug_ids) -> dict:
+        known = sorted(bug_id for bug_id in bug_ids if str(bug_id) in self.bugs)
+        unchanged = {}
+        for bugs, error in fetcher.run(
+            "revalidate", fetcher.last_changes, list(fetcher.chunks(known))
+        ):
+            if error is not None:
+                raise error
+            for bugdata in bugs:
+                stored = self.bugs[str(bugdata.id)]
+                if str(bugdata.last_change_time) == stored["last_change_time"]:
+                    unchanged[bugdata.id] = SimpleNamespace(**stored)
+        return unchanged
+
+    def remember_patch(self, node: str, *, version: str, bug=None, findings=None):
+        self.patches[node] = {
+            "version": version,
+            "bug": bug,
+            "findings": findings or [],
+        }
+
+    def remember_bug(self, bugdata):
+        if isinstance(bugdata, SimpleNamespace):
+            return
+        self.bugs[str(bugdata.id)] = dict(
+            bugdata.get_raw_data(),
+            weburl=bugdata.weburl,
+            last_change_time=str(bugdata.last_change_time),
+        )
+
+    # Only keeps what the range just reviewed needs.
+    def save(self, nodes):
+        patches = {node: self.patches[node] for node in nodes if node in self.patches}
+        bugs = {str(p["bug"]) for p in patches.values() if p["bug"] is not None}
+        # Security bugs end up in here too, so keep it private.
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as outFile:
+            json.dump(
+                {
+                    "version": STATE_VERSION,
+                    "patches": patches,
+                    "bugs": {bug: self.bugs[bug] for bug in bugs if bug in self.bugs},
+                },
+                outFile,
+            )
@@ -0,0 +1,62 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, *, fetcher, revrange: str, bugzilla_url: str):
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "created": int(time.time()),
+        "revrange": revrange,
+        "bugzilla": bugzilla_url,
+        "bugs": {
+            str(bug_id): dict(bugdata.get_raw_data(), weburl=bugdata.weburl)
+            for bug_id, bugdata in fetcher.bugs.items()
+        },
+        "errors": {str(bug_id): str(error) for bug_id, error in fetcher.errors.items()},
+    }
+    # Security bugs end up in here too, so keep it private.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w") as outFile:
+        json.dump(snapshot, outFile, indent=1, sort_keys=True)
+
+
+class SnapshotBugs:
+    # Stands in for BugFetcher when rendering from a snapshot: the same
+    # prefetch/get interface, but nothing leaves the machine.
+
+    def __init__(self, path):
+        with open(path, "r") as inFile:
+            snapshot = json.load(inFile)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise Exception(
+                f"{path} is a version {snapshot.get('version')} snapshot, expected {SNAPSHOT_VERSION}"
+            )
+
+        self.revrange = snapshot["revrange"]
+        self.url = snapshot["bugzilla"]
+        self.created = snapshot["created"]
+        self.bugs = {
+            int(bug_id): SimpleNamespace(**data)
+            for bug_id, data in snapshot["bugs"].items()
+        }
+        self.errors = {
+            int(bug_id): Exception(message)
+            for bug_id, message in snapshot["errors"].items()
+        }
+        self.round_trips = 0
+
+    def prefetch(self, bug_ids):
+        pass
+
+    def get(self, bug_id):
+        bug_id = int(bug_id)
+        if bug_id in self.errors:
+            raise self.errors[bug_id]
+        if bug_id not in self.bugs:
+            raise Exception(f"Bug {bug_id} isn't in the snapshot; export it again")
+        return self.bugs[bug_id]
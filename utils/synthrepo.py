@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Builds a Mercurial repository that looks enough like NSS for the tools to
+# chew on: patches from a pool of authors (plus some first-timers), version
+# bumps in lib/nss/nss.h, release tags and backouts. It also writes a bugs
+# file for utils.fakebugzilla with a bug for every patch.
+#
+#   python3 -m utils.synthrepo -n 2000 /tmp/synth
+
+import difflib
+import json
+import random
+import tempfile
+from optparse import OptionParser
+
+import hglib
+
+NSS_HEADER = """/*
+ * NSS utility functions
+ */
+
+#ifndef __nss_h_
+#define __nss_h_
+
+#define NSS_VERSION "{version}" _NSS_CUSTOMIZED
+#define NSS_VMAJOR 3
+#define NSS_VMINOR {minor}
+#define NSS_VPATCH 0
+#define NSS_VBUILD 0
+#define NSS_BETA PR_FALSE
+
+#endif /* __nss_h_ */
+"""
+
+REASONS = ["build bustage", "causing gtest failures", "breaking the ABI check"]
+
+
+def header(minor: int) -> str:
+    return NSS_HEADER.format(version=f"3.{minor}", minor=minor)
+
+
+def export(*, user: str, date: int, message: str, diff: str) -> str:
+    return f"# HG changeset patch\n# User {user}\n# Date {date} 0\n{message}\n\n{diff}"
+
+
+def new_file_diff(path: str, contents: str) -> str:
+    lines = contents.splitlines(True)
+    return (
+        f"diff --git a/{path} b/{path}\nnew file mode 100644\n--- /dev/null\n"
+        f"+++ b/{path}\n@@ -0,0 +1,{len(lines)} @@\n"
+        + "".join("+" + line for line in lines)
+    )
+
+
+def changed_file_diff(path: str, old: str, new: str) -> str:
+    return f"diff --git a/{path} b/{path}\n" + "".join(
+        difflib.unified_diff(
+            old.splitlines(True), new.splitlines(True), f"a/{path}", f"b/{path}"
+        )
+    )
+
+
+class SynthRepo:
+    def __init__(self, path, *, seed=1, authors=50, first_bug=1600000):
+        self.path = path
+        self.rng = random.Random(seed)
+        self.authors = [f"Dev {n} <dev{n}@example.com>" for n in range(authors)]
+        self.newcomers = 0
+        self.next_bug = first_bug
+        self.date = 1600000000
+        self.minor = 50
+        self.rev = -1
+        self.pending = []
+        self.patches = []
+        self.backedOut = set()
+        self.bugs = []
+
+        hglib.init(path)
+        self.client = hglib.open(path)
+
+    def author(self) -> str:
+        if self.rng.random() < 0.05:
+            self.newcomers += 1
+            return f"New {self.newcomers} <new{self.newcomers}@example.com>"
+        return self.rng.choice(self.authors)
+
+    def queue(self, *, message: str, diff: str, user=None):
+        self.date += 3600
+        self.rev += 1
+        self.pending.append(
+            export(
+                user=user or self.author(), date=self.date, message=message, diff=diff
+            )
+        )
+
+    # hg import splits a file of exported changesets, so everything between
+    # tags and backouts (which need real nodes) goes in one command.
+    def flush(self):
+        if not self.pending:
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".patch") as patchFile:
+            patchFile.write("".join(self.pending))
+            patchFile.flush()
+            self.client.import_([patchFile.name.encode()])
+        self.pending = []
+
+    def bug(self, *, summary: str, milestone=None) -> int:
+        bug = self.next_bug
+        self.next_bug += 1
+        # A few land with the wrong milestone, or get left open.
+        if self.rng.random() < 0.05:
+            milestone = f"3.{self.minor - 1}"
+        self.bugs.append(
+            {
+                "id": bug,
+                "product": "NSS",
+                "component": "Libraries",
+                "status": "RESOLVED" if self.rng.random() > 0.02 else "ASSIGNED",
+                "resolution": "FIXED",
+                "target_milestone": milestone or f"3.{self.minor}",
+                "summary": summary,
+                "groups": ["crypto-core-security"] if self.rng.random() < 0.05 else [],
+                "keywords": ["leave-open"] if self.rng.random() < 0.02 else [],
+                "last_change_time": "2026-01-01T00:00:00Z",
+            }
+        )
+        return bug
+
+    def patch(self):
+        number = len(self.patches)
+        summary = f"Fix issue {number} in lib/ssl"
+        bug = self.bug(summary=summary)
+        self.queue(
+            message=f"Bug {bug} - {summary.lower()} r=reviewer{self.rng.randrange(5)}",
+            diff=new_file_diff(f"lib/ssl/gen/f{number}.c", f"int f{number} = 1;\n"),
+        )
+        self.patches.append((self.rev, bug))
+
+    def bump(self):
+        old = header(self.minor)
+        self.minor += 1
+        bug = self.bug(summary=f"Set version numbers to 3.{self.minor}")
+        self.queue(
+            message=f"Bug {bug} - Set version numbers to 3.{self.minor} r=reviewer0",
+            diff=changed_file_diff("lib/nss/nss.h", old, header(self.minor)),
+        )
+
+    def release(self):
+        self.flush()
+        tag = f"NSS_3_{self.minor}_RTM"
+        node = self.client.log(revrange=".")[0][1].decode()
+        self.date += 3600
+        self.client.tag(
+            [tag.encode()],
+            rev=node,
+            message=f"Added tag {tag} for changeset {node[:12]}",
+            user="Release Manager <release@example.com>",
+            date=f"{self.date} 0",
+        )
+        self.rev += 1
+        self.bump()
+
+    def backout(self):
+        candidates = [p for p in self.patches[-50:] if p[0] not in self.backedOut]
+        if not candidates:
+            return self.patch()
+        rev, bug = self.rng.choice(candidates)
+        self.flush()
+        node = self.client.log(revrange=str(rev))[0][1].decode()
+        self.date += 3600
+        self.client.backout(
+            str(rev),
+            message=f"Backed out changeset {node[:12]} (bug {bug}) for {self.rng.choice(REASONS)}",
+            user="Sheriff <sheriff@example.com>",
+            date=f"{self.date} 0",
+        )
+        self.rev += 1
+        self.backedOut.add(rev)
+
+    def build(self, *, commits: int, releases: int, backouts=0.03):
+        bug = self.bug(summary="Import NSS")
+        self.queue(
+            message=f"Bug {bug} - Import NSS r=reviewer0",
+            diff=new_file_diff("lib/nss/nss.h", header(self.minor)),
+            user=self.authors[0],
+        )
+
+        releaseEvery = max(1, commits // (releases + 1))
+        for number in range(1, commits):
+            if number % releaseEvery == 0 and number // releaseEvery <= releases:
+                self.release()
+            elif self.rng.random() < backouts:
+                self.backout()
+            else:
+                self.patch()
+        self.flush()
+        self.client.close()
+        return self.bugs
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] path")
+    parser.add_option("-n", "--commits", type="int", default=500)
+    parser.add_option("--releases", type="int", default=4)
+    parser.add_option("--authors", type="int", default=50)
+    parser.add_option("--seed", type="int", default=1)
+    parser.add_option(
+        "--bugs", help="Where to write the bugs for utils.fakebugzilla (path.json)"
+    )
+
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Give the path of the repository to create")
+
+    repo = SynthRepo(args[0], seed=options.seed, authors=options.authors)
+    bugs = repo.build(commits=options.commits, releases=options.releases)
+    bugsFile = options.bugs or f"{args[0].rstrip('/')}.json"
+    with open(bugsFile, "w") as outFile:
+        json.dump({"bugs": bugs}, outFile)
+    print(
+        f"Wrote {repo.rev + 1} changesets to {args[0]} and {len(bugs)} bugs to {bugsFile}"
+    )
+
+
+if __name__ == "__main__":
+    main()
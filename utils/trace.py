@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_tracer = None
+
+
+class Tracer:
+    # Records one span per Bugzilla request, hg command and prompt, from
+    # whichever thread made it.
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def record(self, *, category, name, detail, start, duration, size=None):
+        with self.lock:
+            self.spans.append(
+                {
+                    "category": category,
+                    "name": name,
+                    "detail": detail,
+                    "start": start - self.origin,
+                    "duration": duration,
+                    "bytes": size,
+                    "thread": threading.get_ident(),
+                }
+            )
+
+    def summary(self) -> str:
+        totals = {}
+        for span in self.spans:
+            key = f"{span['category']}.{span['name']}"
+            count, total, longest, size = totals.get(key, (0, 0, 0, 0))
+            totals[key] = (
+                count + 1,
+                total + span["duration"],
+                max(longest, span["duration"]),
+                size + (span["bytes"] or 0),
+            )
+
+        lines = [
+            f"{'call':<28} {'count':>6} {'total':>9} {'mean':>9} {'max':>9} {'bytes':>10}"
+        ]
+        for key, (count, total, longest, size) in sorted(
+            totals.items(), key=lambda item: -item[1][1]
+        ):
+            lines.append(
+                f"{key:<28} {count:>6} {total:>8.3f}s {total / count * 1000:>7.1f}ms "
+                f"{longest * 1000:>7.1f}ms {size:>10}"
+            )
+        return "\n".join(lines)
+
+    # Chrome's trace event format, which chrome://tracing and Perfetto load.
+    def write_chrome_trace(self, path):
+        events = [
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": span["start"] * 1e6,
+                "dur": span["duration"] * 1e6,
+                "pid": os.getpid(),
+                "tid": span["thread"],
+                "args": {"detail": span["detail"], "bytes": span["bytes"]},
+            }
+            for span in self.spans
+        ]
+        with open(path, "w") as outFile:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, outFile)
+
+
+def result_size(value):
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(result_size(item) or 0 for item in value)
+    if hasattr(value, "get_raw_data"):
+        return len(json.dumps(value.get_raw_data(), default=str))
+    return None
+
+
+def describe(args, kwargs):
+    parts = [repr(arg) for arg in args]
+    parts += [f"{key}={value!r}" for key, value in kwargs.items()]
+    detail = ", ".join(parts)
+    return detail if len(detail) <= 200 else detail[:197] + "..."
+
+
+# Yields a dict the caller can set "bytes" in.
+@contextmanager
+def span(category, name, detail=""):
+    current = {"bytes": None}
+    if _tracer is None:
+        yield current
+        return
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        _tracer.record(
+            category=category,
+            name=name,
+            detail=detail,
+            start=start,
+            duration=time.perf_counter() - start,
+            size=current["bytes"],
+        )
+
+
+class TracedProxy:
+    # Wraps a bzapi or hgclient so that every public method call is a span.
+    # Attributes and private methods go straight through.
+
+    def __init__(self, target, category):
+        self._target = target
+        self._category = category
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name.startswith("_") or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = value(*args, **kwargs)
+                return result
+            finally:
+                _tracer.record(
+                    category=self._category,
+                    name=name,
+                    detail=describe(args, kwargs),
+                    start=start,
+                    duration=time.perf_counter() - start,
+                    size=result_size(result),
+                )
+
+        return call
+
+
+def traced(target, category):
+    return target if _tracer is None else TracedProxy(target, category)
+
+
+def add_trace_options(parser):
+    parser.add_option(
+        "--trace",
+        action="store_true",
+        help="Time every Bugzilla and hg call and print a summary at the end",
+    )
+    parser.add_option(
+        "--trace-file",
+        metavar="FILE",
+        help="Trace as with --trace and also write a Chrome trace-event file",
+    )
+
+
+def open_tracer(options):
+    global _tracer
+    if not (options.trace or options.trace_file):
+        return None
+    _tracer = Tracer()
+
+    # At exit, so runs that end in Validator.fatal() are reported too.
+    def report():
+        print(_tracer.summary())
+        if options.trace_file:
+            _tracer.write_chrome_trace(options.trace_file)
+            print(f"Wrote trace to {options.trace_file}")
+
+    atexit.register(report)
+    return _tracer
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from pathlib import Path
+
+HISTORY_VERSION = 1
+
+TREEHERDER_URL = "https://treeherder.mozilla.org/#/jobs?repo=nss-try&revision="
+
+# What nss-try.sh documents as the defaults, so spelling one out doesn't make
+# a different push.
+SYNTAX_DEFAULTS = {"-b": "do", "-p": "all", "-u": "none", "-t": "none", "-e": "none"}
+SYNTAX_FLAGS = ["--nspr-patch"]
+
+TRY_HELP = """Try syntax:
+  -b d | o                   debug and/or opt builds (default: do)
+  -p <platforms> | all | none
+                             linux64,linux64-make,linux64-fuzz,linux64-asan,
+                             linux64-fips,linux,linux-make,linux-fuzz,aarch64,
+                             mac,win64,win64-make,win,win-make (default: all)
+  -u <tests> | all | none    bogo,crmf,chains,cipher,db,ec,fips,gtest,interop,
+                             lowhash,merge,mpi,sdr,smime,ssl,tlsfuzzer,tools
+                             (default: none)
+  -t <tools> | all | none    abi,clang-format,coverage,coverity,hacl,saw,
+                             scan-build (default: none)
+  -e all | none              extra builds (default: none)
+  --nspr-patch               apply nspr.patch from the top of nss/ first"""
+
+
+# The same choices in one spelling: options in order, list values sorted and
+# deduplicated, defaults filled in. Words it doesn't know are kept as given,
+# at the end, so at worst an equivalent push isn't recognised.
+def normalize_syntax(words) -> str:
+    words = " ".join(words).split()
+    if words and words[0] == "try:":
+        words = words[1:]
+
+    chosen = dict(SYNTAX_DEFAULTS)
+    flags = set()
+    unknown = []
+    remaining = iter(words)
+    for word in remaining:
+        if word in SYNTAX_FLAGS:
+            flags.add(word)
+        elif word in SYNTAX_DEFAULTS:
+            chosen[word] = next(remaining, "")
+        else:
+            unknown.append(word)
+
+    parts = []
+    for option, value in sorted(chosen.items()):
+        if option == "-b":
+            value = "".join(sorted(set(value)))
+        else:
+            value = ",".join(sorted(set(value.split(","))))
+        parts.append(f"{option} {value}")
+    return " ".join(parts + sorted(flags) + unknown)
+
+
+# `hg export` output without the changeset headers (node, date, parent,
+# message), so the same change applied again, e.g. by another moz-phab
+# patch, has the same contents.
+def patch_contents(export: bytes) -> bytes:
+    kept = []
+    header = False
+    for line in export.splitlines(keepends=True):
+        if line.startswith(b"# HG changeset patch"):
+            header = True
+        elif line.startswith(b"diff "):
+            header = False
+        if not header:
+            kept.append(line)
+    return b"".join(kept)
+
+
+# What try would build: the public changeset underneath, the draft changes
+# on top of it and the normalised syntax.
+def push_key(hgclient, rev: str, syntax: str) -> str:
+    base = hgclient.log(revrange=f"last(::{rev} and public())")
+    drafts = f"::{rev} and not public()"
+    digest = hashlib.sha256()
+    digest.update(base[0].node if base else b"null")
+    if hgclient.log(revrange=drafts):
+        digest.update(patch_contents(hgclient.export([drafts.encode()], git=True)))
+    digest.update(syntax.encode("UTF-8"))
+    return digest.hexdigest()
+
+
+class TryHistory:
+    # Every push nss-try.py made from this repository, by push_key(), kept in
+    # .hg so a push that's already on try can be skipped.
+
+    def __init__(self, hgclient, path=None):
+        self.path = Path(
+            path or Path(hgclient.root().decode("UTF-8")) / ".hg" / "nss-try.json"
+        )
+        self.pushes = {}
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            if data.get("version") == HISTORY_VERSION:
+                self.pushes = data["pushes"]
+
+    def get(self, key: str):
+        return self.pushes.get(key)
+
+    def record(self, key: str, *, revision: str, syntax: str, description: str, when):
+        self.pushes[key] = {
+            "revision": revision,
+            "url": TREEHERDER_URL + revision,
+            "syntax": syntax,
+            "description": description,
+            "pushed": when.isoformat(timespec="seconds"),
+        }
+
+    def save(self):
+        with open(self.path, "w") as outFile:
+            json.dump(
+                {"version": HISTORY_VERSION, "pushes": self.pushes}, outFile, indent=1
+            )
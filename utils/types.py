@@ -2,31 +2,35 @@ import re
 
 from colorama import init, Fore
 from dataclasses import dataclass
-from whaaaaat import prompt
 
-RE_patch = r"[Bb]ug (?P<bug>[0-9]+)[ ,-]*(?P<desc>.+) +(?P<reviewers>r[?=].*)* *(?P<approvers>a=.*)*"
-RE_backout = r"(backout|back.* out|Back.* out|Backout)"
-RE_backout_std = r"[Bb]acked out changeset (?P<changeset>[a-z0-9]+).*"
-RE_backout_template = r"[Bb]acked out changeset (?P<changeset>[a-z0-9]+) \([Bb]ug (?P<bug>[0-9]+)\) for (?P<reason>.+)"
-RE_nss_version = r'#define NSS_VERSION "(?P<version>[0-9.]+)"'
-RE_nspr_version = r'#define PR_VERSION +"(?P<version>[0-9.]+).*"'
-RE_tag = r"Added tag (?P<tag>[A-Z0-9_]+) for changeset (?P<changeset>[a-z0-9]+)"
+from utils.regexes import RX_headline, RX_nspr_version, RX_nss_version
+from utils.report import Finding, load_policy, write_report
+from utils.trace import span
+
+
+# whaaaaat brings prompt_toolkit with it, so only load it once we ask something.
+def prompt(questions):
+    from whaaaaat import prompt
+
+    with span("prompt", questions[0]["type"], questions[0]["message"]):
+        return prompt(questions)
 
 
 @dataclass
 class Validator:
     warnings: list
     ask: bool
+    interactive = True
 
     def __init__(self, *, ask=True):
         self.warnings = []
         self.ask = ask
 
-    def fatal(self, message):
+    def fatal(self, message, *, rule="fatal", patch=None, bug=None):
         print(Fore.RED + "[die] " + message)
         exit()
 
-    def warn(self, message):
+    def warn(self, message, *, rule="warning", patch=None, bug=None):
         self.warnings.append(message)
 
         print(Fore.YELLOW + "[WARN] " + message)
@@ -37,15 +41,133 @@ class Validator:
             if not answers["okay"]:
                 exit()
 
+    def confirm(self, message) -> bool:
+        return prompt([{"type": "confirm", "message": message, "name": "okay"}])["okay"]
+
+    # Called for every patch looked at, whether or not it has findings.
+    def reviewed(self, patch):
+        pass
+
+    def finish(self):
+        pass
+
+
+class BatchValidator(Validator):
+    # For automation: never prompts, records every finding with the rule that
+    # raised it, and writes one report when the run finishes or dies. The
+    # policy can make a warning fatal (the run carries on but fails at the
+    # end) or ignore it; fatal() calls always stop the run. Confirmations are
+    # only answered yes with `yes` (--yes), and then only if nothing failed.
+
+    interactive = False
+
+    def __init__(
+        self, *, tool, policy=None, report=None, report_format="json", yes=False
+    ):
+        super().__init__(ask=False)
+        self.tool = tool
+        self.policy = policy or {}
+        self.report = report
+        self.report_format = report_format
+        self.yes = yes
+        self.findings = []
+        self.patches = {}
+        self.finished = False
+
+    def reviewed(self, patch):
+        if isinstance(patch, bytes):
+            patch = patch.decode(encoding="UTF-8")
+        self.patches[patch] = True
+
+    def record(self, severity, message, *, rule, patch, bug):
+        if isinstance(patch, bytes):
+            patch = patch.decode(encoding="UTF-8")
+        self.findings.append(
+            Finding(
+                severity=severity,
+                rule=rule,
+                message=message,
+                patch=patch,
+                bug=int(bug) if bug is not None else None,
+            )
+        )
+
+    def fatal(self, message, *, rule="fatal", patch=None, bug=None):
+        self.record("fatal", message, rule=rule, patch=patch, bug=bug)
+        print(Fore.RED + "[die] " + message)
+        self.finish()
+
+    def warn(self, message, *, rule="warning", patch=None, bug=None):
+        severity = self.policy.get(rule, "warn")
+        if severity == "ignore":
+            return
+        self.warnings.append(message)
+        self.record(severity, message, rule=rule, patch=patch, bug=bug)
+        if severity == "fatal":
+            print(Fore.RED + f"[FAIL] [{rule}] " + message)
+        else:
+            print(Fore.YELLOW + f"[WARN] [{rule}] " + message)
+
+    def failed(self) -> bool:
+        return any(finding.severity == "fatal" for finding in self.findings)
+
+    # Actions like updating bugs need --yes, and nothing to have failed.
+    def confirm(self, message) -> bool:
+        if not self.yes:
+            print(f"{message} No; pass --yes to go ahead in batch mode")
+            return False
+        return not self.failed()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+
+        if self.report:
+            write_report(
+                self.findings,
+                self.report,
+                format=self.report_format,
+                tool=self.tool,
+                patches=list(self.patches),
+            )
+        fatals = sum(finding.severity == "fatal" for finding in self.findings)
+        print(f"{len(self.findings)} findings, {fatals} fatal")
+        if fatals:
+            exit(1)
+
+
+def open_validator(options, *, tool, ask=True) -> Validator:
+    if not options.batch:
+        return Validator(ask=ask)
+    return BatchValidator(
+        tool=tool,
+        policy=load_policy(options.policy),
+        report=options.report,
+        report_format=options.report_format,
+        yes=options.yes,
+    )
+
 
 class NullValidator:
+    interactive = False
+
     def __init__(self):
         pass
 
-    def fatal(self, message):
+    def fatal(self, message, **kwargs):
         pass
 
-    def warn(self, message):
+    def warn(self, message, **kwargs):
+        pass
+
+    def confirm(self, message) -> bool:
+        return False
+
+    def reviewed(self, patch):
+        pass
+
+    def finish(self):
         pass
 
 
@@ -58,7 +180,7 @@ class PackageVersion:
     def extract_version(contents: str, *, regex, validator: Validator) -> str:
         versionmatch = re.search(regex, contents)
         if not versionmatch:
-            validator.fatal("Unknown version")
+            validator.fatal("Unknown version", rule="unknown-version")
         return versionmatch.group("version")
 
     @staticmethod
@@ -67,123 +189,206 @@ class PackageVersion:
             return PackageVersion(
                 "NSS",
                 PackageVersion.extract_version(
-                    header, regex=RE_nss_version, validator=validator
+                    header, regex=RX_nss_version, validator=validator
                 ),
             )
         if component == "NSPR":
             return PackageVersion(
                 "NSPR",
                 PackageVersion.extract_version(
-                    header, regex=RE_nspr_version, validator=validator
+                    header, regex=RX_nspr_version, validator=validator
                 ),
             )
         raise Exception("Unknown component")
 
 
-@dataclass
 class Patch:
-    type: str
-    headline: str
-    id: str
-    hash: str
-    author: str
-    message: str
-    timestamp: str
-    bug: int = None
-    reviewers: list = None
-    tag: str = None
-    reason: str = None
-    description: str = None
+    # One of these is made for every changeset in a release, usually just to
+    # read the author or hash, so it keeps the raw hglib tuple (or a
+    # utils.repo.Revision) and only parses the headline the first time one of
+    # the parsed fields is read.
+    # Headline warnings therefore fire on first access rather than here.
+
+    __slots__ = (
+        "commit",
+        "validator",
+        "_headline",
+        "_type",
+        "_bug",
+        "_reviewers",
+        "_approvers",
+        "_description",
+        "_changeset",
+        "_tag",
+        "_reason",
+    )
 
     def __init__(self, *, validator: Validator, commit: list):
-        self.headline = commit[5].decode(encoding="UTF-8").split("\n")[0]
-
-        if re.match(RE_backout, self.headline):
-            self.__init_backout(validator, commit)
-        elif re.match(RE_tag, self.headline):
-            self.__init_tag(validator, commit)
-        else:
-            self.__init_bug(validator, commit)
+        self.commit = commit
+        self.validator = validator
+        self._headline = None
+        self._type = None
 
     def __repr__(self) -> str:
         return f"[{self.type}]: {self.headline}"
 
-    def __init_bug(self, validator: Validator, commit):
-        matches = re.match(RE_patch, self.headline)
-        if matches:
-            self.reviewers = matches.group("reviewers")
-            self.bug = matches.group("bug")
-            self.description = matches.group("desc")
-        else:
-            validator.warn(f"Patch headline doesn't parse: {self.headline}")
-
-        self.type = "patch"
-        self.id = commit[0]
-        self.hash = commit[1]
-        self.author = commit[4]
-        self.message = commit[5].decode(encoding="UTF-8")
-        self.timestamp = commit[6]
-
-    def __init_backout(self, validator: Validator, commit):
-        extended_match = re.match(RE_backout_template, self.headline)
-        if extended_match:
-            self.bug = extended_match.group("bug")
-            self.changeset = extended_match.group("changeset")
-            self.reason = extended_match.group("reason")
-        else:
-            validator.warn(
-                "Backout headline needs to be of the form: Backed out changeset X (bug Y) for REASON"
+    @property
+    def id(self):
+        return self.commit[0]
+
+    @property
+    def hash(self):
+        return self.commit[1]
+
+    @property
+    def author(self):
+        return self.commit[4]
+
+    @property
+    def message(self) -> str:
+        return self.commit[5].decode(encoding="UTF-8")
+
+    @property
+    def timestamp(self):
+        return self.commit[6]
+
+    @property
+    def headline(self) -> str:
+        if self._headline is None:
+            # A newline byte is never part of a multi-byte UTF-8 sequence.
+            self._headline = self.commit[5].split(b"\n", 1)[0].decode(encoding="UTF-8")
+        return self._headline
+
+    @property
+    def type(self) -> str:
+        self.__parse()
+        return self._type
+
+    @property
+    def bug(self):
+        self.__parse()
+        return self._bug
+
+    @property
+    def reviewers(self):
+        self.__parse()
+        return self._reviewers
+
+    @property
+    def approvers(self):
+        self.__parse()
+        return self._approvers
+
+    @property
+    def description(self):
+        self.__parse()
+        return self._description
+
+    @property
+    def changeset(self):
+        self.__parse()
+        return self._changeset
+
+    @property
+    def tag(self):
+        self.__parse()
+        return self._tag
+
+    @property
+    def reason(self):
+        self.__parse()
+        return self._reason
+
+    def __parse(self):
+        if self._type is not None:
+            return
+
+        self._bug = None
+        self._reviewers = None
+        self._approvers = None
+        self._description = None
+        self._changeset = None
+        self._tag = None
+        self._reason = None
+
+        match = RX_headline.match(self.headline)
+        kind = match.lastgroup if match else None
+
+        if kind == "backout_template":
+            self._type = "backout"
+            self._bug = match.group("backout_bug")
+            self._changeset = match.group("backout_changeset")
+            self._reason = match.group("reason")
+        elif kind in ["backout_std", "backout"]:
+            self._type = "backout"
+            self.validator.warn(
+                "Backout headline needs to be of the form: Backed out changeset X (bug Y) for REASON",
+                rule="backout-format",
+                patch=self.hash,
             )
-
-            matches = re.match(RE_backout_std, self.headline)
-            if matches:
-                self.changeset = matches.group("changeset")
+            if kind == "backout_std":
+                self._changeset = match.group("std_changeset")
+            else:
+                self.validator.warn(
+                    f"Backout headline doesn't parse: {self.headline}",
+                    rule="backout-parse",
+                    patch=self.hash,
+                )
+        elif kind == "tagged":
+            self._type = "tag"
+            self._changeset = match.group("tag_changeset")
+            self._tag = match.group("tag")
+        else:
+            self._type = "patch"
+            if kind == "patch":
+                self._reviewers = match.group("reviewers")
+                self._approvers = match.group("approvers")
+                self._bug = match.group("bug")
+                self._description = match.group("desc")
             else:
-                validator.warn(f"Backout headline doesn't parse: {self.headline}")
-
-        self.type = "backout"
-        self.id = commit[0]
-        self.hash = commit[1]
-        self.author = commit[4]
-        self.message = commit[5].decode(encoding="UTF-8")
-        self.timestamp = commit[6]
-
-    def __init_tag(self, validator: Validator, commit):
-        tagmatches = re.match(RE_tag, self.headline)
-        if not tagmatches:
-            validator.fatal(f"Tag headline doesn't parse: {self.headline}")
-
-        self.type = "tag"
-        self.changeset = tagmatches.group("changeset")
-        self.tag = tagmatches.group("tag")
-        self.id = commit[0]
-        self.hash = commit[1]
-        self.author = commit[4]
-        self.message = commit[5].decode(encoding="UTF-8")
-        self.timestamp = commit[6]
+                self.validator.warn(
+                    f"Patch headline doesn't parse: {self.headline}",
+                    rule="headline-parse",
+                    patch=self.hash,
+                )
 
     def validate(self, *, validator: Validator) -> bool:
+        validator.reviewed(self.hash)
         if self.type in ["patch", "backout"]:
             if not self.bug:
-                validator.warn("No bug number found")
+                validator.warn("No bug number found", rule="no-bug", patch=self.hash)
                 return False
 
         if self.type == "backout":
             if not self.changeset or not self.reason:
-                validator.warn("No changeset or reason in backout")
+                validator.warn(
+                    "No changeset or reason in backout",
+                    rule="backout-incomplete",
+                    patch=self.hash,
+                    bug=self.bug,
+                )
                 return False
 
         if self.type == "patch":
             if not self.reviewers:
-                validator.warn("No reviewers found")
+                validator.warn(
+                    "No reviewers found",
+                    rule="no-reviewers",
+                    patch=self.hash,
+                    bug=self.bug,
+                )
 
         return True
 
     def verify_tag_version(self, *, validator: Validator, version: PackageVersion):
         expected_version = version.number.replace(".", "_")
-        if not expected_version in tag:
-            validator.fatal(f"Tag {tag} doesn't contain {expected_version}")
+        if not expected_version in self.tag:
+            validator.fatal(
+                f"Tag {self.tag} doesn't contain {expected_version}",
+                rule="tag-version",
+                patch=self.hash,
+            )
 
         validator.info(
-            f"Tag {tag} for version {version.number} detected. Format looks good."
+            f"Tag {self.tag} for version {version.number} detected. Format looks good."
         )
@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+import hglib
+
+from utils.repo import stream_log
+
+DEFAULT_CONFIG_FILE = Path.home() / ".nss-uplift.conf"
+
+# Lines of the NSS changelog that only point at the reviews.
+SKIPPED_LINES = ["phabricator.services.mozilla.com", "Differential"]
+
+
+class UpliftError(Exception):
+    pass
+
+
+# The config is shell, name=value per line, since nss-uplift-unified.sh
+# sources the same file.
+def load_uplift_config(path=DEFAULT_CONFIG_FILE) -> dict:
+    config = {}
+    with open(path, "r") as inFile:
+        for line in inFile:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            name, value = line.split("=", 1)
+            config[name.strip()] = os.path.expanduser(value.strip().strip("\"'"))
+    return config
+
+
+class Checkpoints:
+    # The steps of an uplift that have finished, and what they found, kept in
+    # mozilla-unified's .hg. A re-run for the same tag skips those steps; a
+    # run for another tag starts afresh. Saved after every step, since the
+    # next one may fail or be interrupted.
+
+    def __init__(self, path, *, tag: str):
+        self.path = Path(path)
+        self.tag = tag
+        self.steps = {}
+        self.lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r") as inFile:
+                data = json.load(inFile)
+            if data.get("tag") == tag:
+                self.steps = data["steps"]
+
+    def __contains__(self, step):
+        return step in self.steps
+
+    def get(self, step):
+        return self.steps.get(step)
+
+    def finish(self, step, value=True):
+        with self.lock:
+            self.steps[step] = value
+            with open(self.path, "w") as outFile:
+                json.dump({"tag": self.tag, "steps": self.steps}, outFile, indent=1)
+
+    def clear(self):
+        with self.lock:
+            self.steps = {}
+            if self.path.exists():
+                self.path.unlink()
+
+
+# Output is kept rather than shown as it comes, so steps running at the same
+# time don't interleave; it's part of the error if the command fails.
+# Long commands like builds pass capture=False to show their progress.
+def run(args, *, cwd, env=None, capture=True, verbose=False) -> str:
+    proc = subprocess.run(
+        [str(arg) for arg in args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE if capture else None,
+        stderr=subprocess.STDOUT if capture else None,
+    )
+    output = proc.stdout.decode("UTF-8", "replace") if capture else ""
+    if verbose:
+        print(output, end="")
+    if proc.returncode:
+        raise UpliftError(
+            f"{' '.join(str(arg) for arg in args)} failed ({proc.returncode})\n{output}"
+        )
+    return output
+
+
+def hg(repo, *args, capture=True, verbose=False) -> str:
+    env = dict(os.environ, HGPLAIN="1")
+    return run(
+        [hglib.HGPATH, *args], cwd=repo, env=env, capture=capture, verbose=verbose
+    )
+
+
+def status_paths(hgclient, **kwargs) -> list:
+    return [path.decode("UTF-8") for _, path in hgclient.status(**kwargs)]
+
+
+# security/nss.symbols has to follow the NSS .def files by hand.
+def def_changes(hgclient) -> list:
+    return [
+        path
+        for path in status_paths(hgclient, modified=True, added=True, removed=True)
+        if path.endswith(".def")
+    ]
+
+
+def orig_files(hgclient) -> list:
+    return [path for path in status_paths(hgclient) if path.endswith(".orig")]
+
+
+# The NSS changesets in `revset`, as hg's changelog style prints them, under
+# `header`. The log is filtered as it streams.
+def commit_message(nss_path, *, revset: str, header: str) -> str:
+    lines = [header, ""]
+    for line in stream_log(
+        nss_path, revrange=revset, template="changelog", quiet=False
+    ):
+        text = line.decode("UTF-8", "replace")
+        if not any(skipped in text for skipped in SKIPPED_LINES):
+            lines.append(text)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+import weakref
+from pathlib import Path
+
+from utils.repo import stream_log
+from utils.types import PackageVersion, Validator
+
+VERSION_FILES = [("NSS", "lib/nss/nss.h"), ("NSPR", "pr/include/prinit.h")]
+
+
+class VersionResolver:
+    # NSS_VERSION only changes a couple of times per release, so the header
+    # is only read at the revisions that can change it: those touching it,
+    # and merges, whose file list leaves out what they take from p2. Any
+    # revision has the header of the newest of those among its ancestors;
+    # that's the first one on its first-parent line, since everything only
+    # reachable through a p2 is older than the merge that brought it in.
+
+    def __init__(self, hgclient):
+        for component, path in VERSION_FILES:
+            if Path(path).exists():
+                break
+        else:
+            raise Exception("No version files found")
+
+        self.hgclient = hgclient
+        self.component = component
+        self.path = path
+        self.changes = f"file('path:{path}') or merge()"
+        self.points = {}
+        self.versions = {}
+
+    # Finds the change point of every changeset in `revrange` from two hg logs
+    # over its ancestors, whatever their number: which of them are changes,
+    # and each one's first parent. Going up in revision order, a changeset's
+    # change point is itself if it's a change, else its first parent's.
+    def prefetch(self, revrange: str):
+        root = self.hgclient.root()
+        ancestors = f"::({revrange})"
+        changes = {
+            int(line)
+            for line in stream_log(
+                root, revrange=f"{ancestors} and ({self.changes})", template="{rev}\n"
+            )
+        }
+        byRev = {-1: -1}
+        for line in stream_log(
+            root,
+            revrange=f"sort({ancestors}, rev)",
+            template="{rev} {p1rev} {node}\n",
+        ):
+            rev, p1, node = line.decode(encoding="UTF-8").split(" ")
+            rev = int(rev)
+            byRev[rev] = rev if rev in changes else byRev[int(p1)]
+            self.points[node] = byRev[rev]
+
+    # Same as `hg cat -r`, which uses the last revision of a revset.
+    def change_point(self, rev) -> int:
+        if isinstance(rev, bytes):
+            rev = rev.decode(encoding="UTF-8")
+        spec = "." if rev is None else rev
+        if spec not in self.points:
+            commits = self.hgclient.log(
+                revrange=f"last(::last({spec}) and ({self.changes}))"
+            )
+            self.points[spec] = int(commits[0][0]) if commits else -1
+        return self.points[spec]
+
+    def get(self, rev=None, *, validator: Validator) -> PackageVersion:
+        number = self.change_point(rev)
+        if number not in self.versions:
+            self.versions[number] = self.read(number, validator=validator)
+        return self.versions[number]
+
+    def read(self, number: int, *, validator: Validator) -> PackageVersion:
+        contents = self.hgclient.cat(
+            [self.path.encode(encoding="UTF-8")], rev=str(number)
+        ).decode(encoding="UTF-8")
+        return PackageVersion.from_header(
+            component=self.component, header=contents, validator=validator
+        )
+
+
+_resolvers = weakref.WeakKeyDictionary()
+
+
+def resolver(hgclient) -> VersionResolver:
+    if hgclient not in _resolvers:
+        _resolvers[hgclient] = VersionResolver(hgclient)
+    return _resolvers[hgclient]
+
+
+def get_version(hgclient, *, rev=None, validator) -> PackageVersion:
+    return resolver(hgclient).get(rev, validator=validator)
+
+
+def prefetch_versions(hgclient, revrange: str):
+    resolver(hgclient).prefetch(revrange)